@@ -5,10 +5,17 @@ ADB 控制器
 import asyncio
 import logging
 import shutil
+import struct
+import time
 from typing import Optional
 import numpy as np
 import cv2
 
+from core.buffer_pool import frame_pool
+from core.frame import Frame
+from core.frame_pipeline import FramePipeline
+from core.preview import encode_preview
+
 logger = logging.getLogger("zat.adb")
 
 
@@ -43,6 +50,12 @@ class ADBController:
         self.device: Optional[str] = None
         self.screen_resolution: Optional[tuple[int, int]] = None
         
+        # 截图模式: "raw" 传输未压缩像素，解码直接写入缓冲池；"png" 为兼容模式
+        self.capture_mode = "raw"
+        
+        # 截图流水线（双缓冲），识别循环统一从这里取帧
+        self.pipeline = FramePipeline(self.capture)
+        
         # 检查 ADB 是否可用
         if not shutil.which(self.adb_path):
             raise ADBError(f"未找到 ADB: {self.adb_path}")
@@ -72,6 +85,7 @@ class ADBController:
                 logger.warning(f"设备已离线: {self.device}")
                 self.device = None
                 self.screen_resolution = None
+                self.pipeline.reset()
                 return False
         except Exception as e:
             logger.error(f"检查设备状态失败: {e}")
@@ -137,6 +151,7 @@ class ADBController:
         devices = await self.get_devices()
         if device in devices:
             self.device = device
+            self.pipeline.reset()
             logger.info(f"已连接设备: {device}")
             return True
         else:
@@ -157,6 +172,7 @@ class ADBController:
         if devices:
             device = devices[0]
             self.device = device
+            self.pipeline.reset()
             logger.info(f"发现已连接设备: {device}")
             return device
         
@@ -171,22 +187,19 @@ class ADBController:
         logger.warning("未找到可用设备")
         return None
     
-    async def screencap(self, gray: bool = False, quality: int = 65) -> bytes:
+    async def _exec_screencap(self, raw: bool = False) -> bytes:
         """
-        截图（使用 exec-out，最快）
+        执行 exec-out screencap
         
         Args:
-            gray: 是否转换为灰度图
-            quality: JPEG 质量 (1-100)
-        
-        Returns:
-            JPEG 图像字节
+            raw: True 返回原始 RGBA 数据（带头部），False 返回 PNG 字节
         """
         if not self.is_connected():
             raise ADBError("设备未连接")
         
         # 使用 exec-out 直接输出到 stdout
-        cmd = f'"{self.adb_path}" -s {self.device} exec-out screencap -p'
+        flag = "" if raw else " -p"
+        cmd = f'"{self.adb_path}" -s {self.device} exec-out screencap{flag}'
         
         proc = await asyncio.create_subprocess_shell(
             cmd,
@@ -194,58 +207,100 @@ class ADBController:
             stderr=asyncio.subprocess.PIPE
         )
         
-        stdout, stderr = await proc.communicate()
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            # 截图被取消（输入后过期的预取）时结束进程，不留下后台的 screencap
+            if proc.returncode is None:
+                proc.kill()
+            raise
         
         if proc.returncode != 0:
             raise ADBError(f"截图失败: {stderr.decode()}")
         
-        # 解码 PNG
-        nparr = np.frombuffer(stdout, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise ADBError("解码截图失败")
-        
-        # 可选：转换为灰度图
-        if gray:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # 编码为 JPEG
-        encode_param = [cv2.IMWRITE_JPEG_QUALITY, quality]
-        _, buffer = cv2.imencode(".jpg", img, encode_param)
-        
-        return buffer.tobytes()
+        return stdout
     
-    async def screencap_array(self) -> np.ndarray:
+    @staticmethod
+    def _decode_raw(data: bytes) -> Optional[np.ndarray]:
         """
-        截图并返回 numpy 数组（用于图像识别）
+        将原始截图解码到缓冲池中的 BGR 数组
+        
+        原始格式: 头部 (width, height, format[, colorspace]) 各 4 字节 + RGBA_8888 像素
         
         Returns:
-            BGR 格式的 numpy 数组
+            BGR 数组（从 frame_pool 借出），无法解析时返回 None
         """
-        if not self.is_connected():
-            raise ADBError("设备未连接")
+        if len(data) < 12:
+            return None
         
-        cmd = f'"{self.adb_path}" -s {self.device} exec-out screencap -p'
+        width, height, pixel_format = struct.unpack_from("<III", data, 0)
+        pixel_bytes = width * height * 4
+        header = len(data) - pixel_bytes
         
-        proc = await asyncio.create_subprocess_shell(
-            cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        # 1 = RGBA_8888；Android 9 起头部多了 4 字节 colorspace
+        if pixel_format != 1 or header not in (12, 16):
+            return None
         
-        stdout, stderr = await proc.communicate()
+        rgba = np.frombuffer(data, np.uint8, count=pixel_bytes, offset=header).reshape(height, width, 4)
+        bgr = frame_pool.acquire((height, width, 3))
+        cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR, dst=bgr)
+        return bgr
+    
+    async def capture(self) -> Frame:
+        """
+        截图并返回 Frame（用于图像识别）
         
-        if proc.returncode != 0:
-            raise ADBError(f"截图失败: {stderr.decode()}")
+        Frame 携带截图时刻和设备信息，灰度图、裁剪、哈希和匹配结果按需计算并缓存。
+        raw 模式下像素数组来自缓冲池，Frame 被回收时自动归还。
+        """
+        timestamp = time.monotonic()
+        device = self.device
+        
+        if self.capture_mode == "raw":
+            data = await self._exec_screencap(raw=True)
+            img = self._decode_raw(data)
+            if img is not None:
+                return Frame(img, timestamp, device, duration=time.monotonic() - timestamp, pool=frame_pool)
+            
+            logger.warning("无法解析原始截图格式，切换到 PNG 模式")
+            self.capture_mode = "png"
+        
+        stdout = await self._exec_screencap()
         
+        # 解码 PNG
         nparr = np.frombuffer(stdout, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if img is None:
             raise ADBError("解码截图失败")
         
-        return img
+        return Frame(img, timestamp, device, duration=time.monotonic() - timestamp)
+    
+    async def screencap(self, gray: bool = False, quality: int = 65) -> bytes:
+        """
+        截图（使用 exec-out，最快）
+        
+        Args:
+            gray: 是否转换为灰度图
+            quality: JPEG 质量 (1-100)
+        
+        Returns:
+            JPEG 图像字节
+        """
+        frame = await self.capture()
+        
+        # 编码放到工作线程，不阻塞事件循环
+        return await asyncio.to_thread(encode_preview, frame, quality=quality, gray=gray)
+    
+    async def screencap_array(self) -> np.ndarray:
+        """
+        截图并返回 numpy 数组
+        
+        Returns:
+            BGR 格式的 numpy 数组（独立副本，不受缓冲池回收影响）
+        """
+        frame = await self.capture()
+        return frame.image.copy()
     
     async def tap(self, x: int, y: int):
         """
@@ -260,6 +315,7 @@ class ADBController:
         
         cmd = f'"{self.adb_path}" -s {self.device} shell input tap {x} {y}'
         stdout, stderr, code = await self._run_command(cmd)
+        self.pipeline.mark_input()
         
         if code != 0:
             raise ADBError(f"点击失败: {stderr}")
@@ -280,12 +336,32 @@ class ADBController:
         
         cmd = f'"{self.adb_path}" -s {self.device} shell input swipe {x1} {y1} {x2} {y2} {duration}'
         stdout, stderr, code = await self._run_command(cmd)
+        self.pipeline.mark_input()
         
         if code != 0:
             raise ADBError(f"滑动失败: {stderr}")
         
         logger.debug(f"滑动: ({x1}, {y1}) -> ({x2}, {y2})")
     
+    async def keyevent(self, keycode: str):
+        """
+        发送按键事件
+        
+        Args:
+            keycode: 按键码，如 "KEYCODE_BACK"
+        """
+        if not self.is_connected():
+            raise ADBError("设备未连接")
+        
+        cmd = f'"{self.adb_path}" -s {self.device} shell input keyevent {keycode}'
+        stdout, stderr, code = await self._run_command(cmd)
+        self.pipeline.mark_input()
+        
+        if code != 0:
+            raise ADBError(f"按键失败: {stderr}")
+        
+        logger.debug(f"按键: {keycode}")
+    
     async def get_screen_resolution(self) -> tuple[int, int]:
         """
         获取屏幕分辨率
@@ -4,12 +4,20 @@
 """
 import asyncio
 import logging
+import time
 from typing import Optional, Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
+import numpy as np
+
 from core.adb_controller import ADBController
+from core.battle_telemetry import BattleTimeline, battle_telemetry
+from core.frame_waiter import wait_for_any, Condition, TemplateCondition, WaitResult
 from core.image_matcher import image_matcher
+from core.motion import MotionEstimator, MotionGate, GatedCondition
+from core.result_screen import ResultScreen, RankCondition, result_parser
+from utils.storage import data_path, load_json, save_json
 
 logger = logging.getLogger("zat.battle")
 
@@ -26,24 +34,163 @@ class BattleResult:
     success: bool
     rank: Optional[str] = None  # S/A/B/C
     message: str = ""
+    screen: Optional[ResultScreen] = None  # 结算界面（与评级同一帧识别的退出按钮等）
+    timeline: Optional[BattleTimeline] = None  # 本场时间线（结算处理时长由调用方补充后记录）
+
+# 超过该时间（秒）没有任何操作时输出警告
+MAX_IDLE = 90.0
+# 战斗中画面静止超过该时间（秒）视为停滞（断线弹窗、游戏卡死等），结束战斗循环交给调用方恢复
+STALL_TIMEOUT = 90.0
+
+TIMINGS_FILE = "battle_timings.json"
+# 每个阶段保留最近多少次实测时长
+MAX_SAMPLES = 20
+# 实测样本少于该数量时使用默认轮询间隔
+MIN_SAMPLES = 3
+# 预计结束时刻：最近实测时长的低分位数再留一点余量（宁可早一点切换到快速轮询）
+LATE_QUANTILE = 0.1
+LATE_MARGIN = 0.9
+
 
+@dataclass(frozen=True)
+class PhasePolicy:
+    """阶段轮询策略（轮询间隔，秒）"""
+    early: float      # 距离预计结束还早时
+    late: float       # 接近预计结束时（以及已接受匹配、等待准备按钮时）
+    default: float    # 还没有足够的实测时长时
 
-# 评级模板
-RANK_TEMPLATES = {
-    "S": "daily_dungeon/level/s",
-    "A": "daily_dungeon/level/a",
-    "B": "daily_dungeon/level/b",
-    "C": "daily_dungeon/level/c",
+
+# 阶段 -> 轮询策略
+# MATCHING 的接受按钮只显示很短时间，全程快速轮询；BATTLING 中途没有可点击的东西，
+# 按实测战斗时长慢速轮询，接近预计结束时再加快以尽早识别评级
+PHASE_POLICIES = {
+    BattlePhase.MATCHING: PhasePolicy(early=0.6, late=0.25, default=0.3),
+    BattlePhase.BATTLING: PhasePolicy(early=3.0, late=0.4, default=1.5),
 }
 
 
+class PhaseTimings:
+    """
+    阶段时长记录（持久化到数据目录）
+
+    MATCHING 记录开始匹配到点击接受的时长，BATTLING 记录点击准备到出现评级的时长。
+    同时按副本（profile）和全局记录，副本样本不足时使用全局样本
+    """
+
+    # 最短保存间隔（秒），避免每个阶段结束都写文件
+    SAVE_INTERVAL = 10.0
+
+    def __init__(self, filename: str = TIMINGS_FILE):
+        self._path = data_path(filename)
+        self._samples: dict[str, list[float]] = load_json(self._path, default={})
+        self._dirty = False
+        self._last_save = 0.0
+
+    @staticmethod
+    def _key(phase: BattlePhase, profile: Optional[str] = None) -> str:
+        return f"{phase.value}:{profile}" if profile else phase.value
+
+    def record(self, phase: BattlePhase, duration: float, profile: Optional[str] = None):
+        for key in {self._key(phase), self._key(phase, profile)}:
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(duration, 2))
+            del samples[:-MAX_SAMPLES]
+        self._dirty = True
+
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """将未保存的时长写入文件"""
+        if not self._dirty:
+            return
+        try:
+            save_json(self._path, self._samples)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"保存战斗阶段时长失败: {e}")
+
+    def late_after(self, phase: BattlePhase, profile: Optional[str] = None) -> Optional[float]:
+        """阶段开始后多久切换到快速轮询（秒），样本不足时返回 None"""
+        for key in (self._key(phase, profile), self._key(phase)):
+            samples = self._samples.get(key, [])
+            if len(samples) >= MIN_SAMPLES:
+                return float(np.quantile(samples, LATE_QUANTILE)) * LATE_MARGIN
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            key: {
+                "count": len(samples),
+                "median": round(float(np.median(samples)), 2),
+                "min": min(samples),
+                "max": max(samples),
+            }
+            for key, samples in self._samples.items() if samples
+        }
+
+
+@dataclass
+class LatencyStats:
+    """提示出现到点击的延迟统计"""
+    count: int = 0
+    total: float = 0.0
+    last: float = 0.0
+    max: float = 0.0
+
+    def record(self, latency: float):
+        self.count += 1
+        self.total += latency
+        self.last = latency
+        self.max = max(self.max, latency)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / max(self.count, 1) * 1000, 1),
+            "last_ms": round(self.last * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+        }
+
+
+@dataclass
+class BattleStats:
+    """战斗循环统计"""
+    battles: int = 0             # 进入战斗循环次数
+    completed: int = 0           # 识别到评级次数
+    # 提示（accept / ready）-> 延迟统计。出现时刻按上一帧与识别帧截图时刻的中点估计
+    latency: dict[str, LatencyStats] = field(default_factory=dict)
+
+    def record_latency(self, prompt: str, latency: float):
+        self.latency.setdefault(prompt, LatencyStats()).record(latency)
+
+    def to_dict(self) -> dict:
+        return {
+            "battles": self.battles,
+            "completed": self.completed,
+            "latency": {prompt: stats.to_dict() for prompt, stats in self.latency.items()},
+        }
+
+
 class BattleLoop:
     """战斗状态循环"""
     
     def __init__(self, adb: ADBController):
         self.adb = adb
+        self.stats = BattleStats()
+        self.timings = PhaseTimings()
         self._running = False
         self._phase = BattlePhase.MATCHING
+        self._phase_started = 0.0
+        self._accepted = False
+        self._profile: Optional[str] = None
+        self._timeline: Optional[BattleTimeline] = None
+        # 开始时的 (交付帧数, 截图等待耗时, 识别耗时)，结束时取差值
+        self._counters = (0, 0.0, 0.0)
+        self.motion = MotionEstimator()
+        self._gate = MotionGate(self.motion)
+        self._rank = RankCondition(result_parser)
         self._on_phase_change: Optional[Callable[[BattlePhase], None]] = None
     
     def set_phase_callback(self, callback: Callable[[BattlePhase], None]):
@@ -54,28 +201,82 @@ class BattleLoop:
         """设置阶段并触发回调"""
         if self._phase != phase:
             self._phase = phase
+            self._phase_started = time.monotonic()
+            self.motion.reset()
             logger.debug(f"战斗阶段: {phase.value}")
             if self._on_phase_change:
                 self._on_phase_change(phase)
     
-    async def _detect_and_click(self, screen, template: str, threshold: float = 0.7) -> bool:
-        """检测模板并点击（单次检测）"""
-        result = image_matcher.match_template(screen, template, threshold=threshold)
-        if result:
-            x, y, confidence = result
-            await self.adb.tap(x, y)
-            logger.debug(f"点击: {template} at ({x}, {y})")
-            return True
-        return False
+    def _conditions(self) -> list[Condition]:
+        """
+        当前阶段可能出现的条件（按优先级），不可能出现的模板不检查：
+        - MATCHING: 准备按钮 > 接受按钮
+        - BATTLING: 准备按钮（多子地图）> 评级（只比较评级徽章区域）
+        
+        所有条件都经过识别闸门：闸门开启时，战斗进行中和场景切换的帧不做识别
+        """
+        conditions: list[Condition] = [TemplateCondition("ready", priority=2)]
+        if self._phase == BattlePhase.MATCHING:
+            conditions.append(TemplateCondition("accept", priority=1))
+        else:
+            conditions.append(self._rank)
+        return [GatedCondition(condition, self._gate) for condition in conditions]
     
-    async def _detect_rank(self, screen) -> Optional[str]:
-        """检测评级"""
-        for rank, template in RANK_TEMPLATES.items():
-            if image_matcher.match_template(screen, template, threshold=0.7):
-                return rank
-        return None
+    def _stalled(self) -> bool:
+        return self._phase == BattlePhase.BATTLING and self.motion.static_for(time.monotonic()) >= STALL_TIMEOUT
+    
+    def _polling(self) -> tuple[float, float]:
+        """
+        当前的轮询间隔和按该间隔轮询的时长（秒），到时后重新计算
+
+        轮询间隔固定（不随画面变化加快），战斗动画不会导致持续截图。
+        同时设置识别闸门：只在 BATTLING 且尚未接近预计结束时按画面状态跳过识别
+        """
+        policy = PHASE_POLICIES[self._phase]
+        self._gate.enabled = self._phase == BattlePhase.BATTLING
+        if self._phase == BattlePhase.MATCHING and self._accepted:
+            return policy.late, MAX_IDLE
+
+        late_after = self.timings.late_after(self._phase, self._profile)
+        if late_after is None:
+            return policy.default, MAX_IDLE
+
+        elapsed = time.monotonic() - self._phase_started
+        if elapsed < late_after:
+            return policy.early, late_after - elapsed
+        self._gate.enabled = False
+        return policy.late, MAX_IDLE
+    
+    async def _tap_prompt(self, result: WaitResult):
+        """点击提示按钮并记录提示出现到点击的延迟"""
+        latency = time.monotonic() - result.appeared_at
+        await self.adb.tap(result.x, result.y)
+        self.stats.record_latency(result.name, latency)
+        logger.debug(f"{result.name} 出现到点击: {latency * 1000:.0f}ms")
+    
+    def _start_timeline(self, profile: Optional[str]):
+        pipeline = self.adb.pipeline.stats
+        self._timeline = battle_telemetry.start(profile)
+        self._counters = (pipeline.frames, pipeline.wait_time, self._detect_time())
     
-    async def run(self, timeout: float = 600.0) -> BattleResult:
+    @staticmethod
+    def _detect_time() -> float:
+        return image_matcher.stats.match_time + image_matcher.stats.ocr_time
+    
+    def _finish(self, outcome: str, **kwargs) -> BattleResult:
+        """结束战斗循环，补全时间线的截图和识别耗时"""
+        self._running = False
+        timeline = self._timeline
+        pipeline = self.adb.pipeline.stats
+        frames, wait_time, detect_time = self._counters
+        timeline.outcome = outcome
+        timeline.rank = kwargs.get("rank")
+        timeline.captures = pipeline.frames - frames
+        timeline.capture_wait = pipeline.wait_time - wait_time
+        timeline.detect = self._detect_time() - detect_time
+        return BattleResult(timeline=timeline, **kwargs)
+    
+    async def run(self, timeout: float = 600.0, profile: Optional[str] = None) -> BattleResult:
         """
         运行战斗循环
         
@@ -85,63 +286,95 @@ class BattleLoop:
         
         Args:
             timeout: 总超时时间（秒），默认10分钟
+            profile: 阶段时长的记录分组（如 副本:难度），决定何时切换到快速轮询
         
         Returns:
             BattleResult
         """
         logger.info("进入战斗循环...")
         self._running = True
+        self._accepted = False
+        self._profile = profile
         self._set_phase(BattlePhase.MATCHING)
+        self._phase_started = time.monotonic()
+        self.motion.reset()
+        self._gate.reset()
+        self.stats.battles += 1
+        self._start_timeline(profile)
+        timeline = self._timeline
         
-        elapsed = 0
-        interval = 1.5
-        idle_time = 0
-        max_idle = 90
+        deadline = self._phase_started + timeout
+        last_action = self._phase_started
+        accepted_at: Optional[float] = None
+        ready_at: Optional[float] = None
         
-        while self._running and elapsed < timeout:
-            screen = await self.adb.screencap_array()
-            action_taken = False
+        while self._running:
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                return self._finish("timeout", success=False, message="战斗超时")
+            
+            if now - last_action >= MAX_IDLE:
+                logger.warning(f"超过 {MAX_IDLE:.0f} 秒无操作")
+                last_action = now
+            
+            interval, duration = self._polling()
+            # 点击后开始的截图才会被交付（由流水线保证）
+            result = await wait_for_any(
+                self.adb.pipeline,
+                self._conditions(),
+                min(remaining, duration),
+                max_interval=interval,
+                min_interval=interval,
+                cancelled=lambda: not self._running or self._stalled(),
+            )
+            
+            if result is None:
+                if self._running and self._stalled():
+                    self.motion.stats.stalls += 1
+                    logger.warning(f"战斗画面已静止 {STALL_TIMEOUT:.0f} 秒，判定为停滞")
+                    return self._finish("stalled", success=False, message="战斗画面停滞")
+                continue
+            last_action = time.monotonic()
             
-            # 优先级1: 检测准备按钮（点击后进入 BATTLING 阶段）
-            if await self._detect_and_click(screen, "ready"):
+            if result.name == "ready":
+                # 点击后进入 BATTLING 阶段（多子地图时再次出现不重新计时）
+                await self._tap_prompt(result)
                 logger.info("点击准备按钮")
+                if ready_at is None:
+                    ready_at = last_action
+                    if accepted_at is None:
+                        timeline.matching = ready_at - self._phase_started
+                    else:
+                        timeline.loading = ready_at - accepted_at
                 self._set_phase(BattlePhase.BATTLING)
-                action_taken = True
-                idle_time = 0
                 await asyncio.sleep(1.0)
-                continue
             
-            # 优先级2: 检测接受按钮（仅在 MATCHING 阶段）
-            if self._phase == BattlePhase.MATCHING:
-                if await self._detect_and_click(screen, "accept"):
-                    logger.info("点击接受按钮")
-                    action_taken = True
-                    idle_time = 0
-                    await asyncio.sleep(0.5)
-                    continue
+            elif result.name == "accept":
+                await self._tap_prompt(result)
+                logger.info("点击接受按钮")
+                if not self._accepted:
+                    self._accepted = True
+                    self.timings.record(BattlePhase.MATCHING, last_action - self._phase_started, profile)
+                else:
+                    # 再次出现接受按钮：上一次匹配有人拒绝，重新排队
+                    timeline.rejections += 1
+                timeline.accepts += 1
+                accepted_at = last_action
+                timeline.matching = accepted_at - self._phase_started
+                await asyncio.sleep(0.5)
             
-            # 优先级3: 检测评级（战斗结束）
-            rank = await self._detect_rank(screen)
-            if rank:
+            else:
+                # 战斗结束：在识别到评级的同一帧上解析结算界面
+                rank = self._rank.rank
                 logger.info(f"战斗完成，评级: {rank}")
-                self._running = False
-                return BattleResult(success=True, rank=rank, message="战斗完成")
-            
-            # 无操作，累计空闲时间
-            if not action_taken:
-                idle_time += interval
-                if idle_time >= max_idle:
-                    logger.warning(f"超过 {max_idle} 秒无操作")
-            
-            await asyncio.sleep(interval)
-            elapsed += interval
-        
-        self._running = False
-        
-        if elapsed >= timeout:
-            return BattleResult(success=False, message="战斗超时")
+                self.stats.completed += 1
+                timeline.battle = result.frame.timestamp - self._phase_started
+                self.timings.record(BattlePhase.BATTLING, timeline.battle, profile)
+                screen = result_parser.parse(result.frame, profile)
+                return self._finish("completed", success=True, rank=rank, message="战斗完成", screen=screen)
         
-        return BattleResult(success=False, message="战斗被中断")
+        return self._finish("interrupted", success=False, message="战斗被中断")
     
     def stop(self):
         """停止战斗循环"""
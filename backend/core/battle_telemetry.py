@@ -0,0 +1,168 @@
+"""
+战斗时间线统计
+每场战斗记录一条时间线（匹配等待、接受次数、战斗时长、结算处理、截图与识别耗时），
+按副本和难度累计各阶段时长的直方图，跨会话保存，用于判断吞吐量瓶颈在哪个环节
+"""
+import bisect
+import logging
+import time
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Optional
+
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.telemetry")
+
+TELEMETRY_FILE = "battle_telemetry.json"
+
+# 直方图分桶上界（秒），最后一个桶收集超过最大上界的样本
+BUCKETS = [0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600]
+# 统计直方图的时间线字段
+METRICS = ["matching", "loading", "battle", "result", "capture_wait", "detect"]
+# 保留最近多少条时间线
+MAX_RECENT = 50
+
+
+@dataclass
+class BattleTimeline:
+    """单场战斗的时间线（时长单位：秒）"""
+    profile: str = ""                  # 副本:难度
+    started: str = ""                  # 开始时间
+    outcome: str = ""                  # completed / timeout / stalled / interrupted
+    rank: Optional[str] = None
+    matching: float = 0.0              # 开始匹配到首次点击接受（排队时间）
+    accepts: int = 0                   # 点击接受次数
+    rejections: int = 0                # 接受后又回到排队的次数（有人拒绝）
+    loading: float = 0.0               # 首次点击接受到点击准备
+    battle: float = 0.0                # 点击准备到识别评级
+    result: float = 0.0                # 识别评级到退出结算界面
+    captures: int = 0                  # 本场交付的截图帧数
+    capture_wait: float = 0.0          # 等待截图的总时长
+    detect: float = 0.0                # 模板匹配 / OCR 的总耗时
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        for key in METRICS:
+            data[key] = round(data[key], 3)
+        return data
+
+
+@dataclass
+class Histogram:
+    """时长直方图"""
+    counts: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+    total: float = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": BUCKETS,
+            "counts": self.counts,
+            "count": self.count,
+            "avg": round(self.total / max(self.count, 1), 3),
+        }
+
+
+class BattleTelemetry:
+    """战斗时间线统计（持久化到数据目录）"""
+
+    # 最短保存间隔（秒），避免每场战斗都重写文件
+    SAVE_INTERVAL = 10.0
+
+    def __init__(self, filename: str = TELEMETRY_FILE):
+        self._path = data_path(filename)
+        data = load_json(self._path, default={})
+        # 副本:难度 -> 指标 -> 直方图
+        self._histograms: dict[str, dict[str, Histogram]] = {
+            profile: {
+                metric: Histogram(list(hist["counts"]), hist["total"])
+                for metric, hist in metrics.items()
+                if len(hist.get("counts", [])) == len(BUCKETS) + 1
+            }
+            for profile, metrics in data.get("histograms", {}).items()
+        }
+        self._recent: list[dict] = data.get("recent", [])
+        self._dirty = False
+        self._last_save = 0.0
+
+    def start(self, profile: Optional[str] = None) -> BattleTimeline:
+        return BattleTimeline(profile=profile or "", started=datetime.now().isoformat(timespec="seconds"))
+
+    def record(self, timeline: BattleTimeline):
+        """记录一场战斗（只有完成的战斗计入直方图，所有战斗都保留在最近记录中）"""
+        if timeline.outcome == "completed":
+            histograms = self._histograms.setdefault(timeline.profile, {})
+            for metric in METRICS:
+                histograms.setdefault(metric, Histogram()).add(getattr(timeline, metric))
+
+        self._recent.append(timeline.to_dict())
+        del self._recent[:-MAX_RECENT]
+        logger.debug(
+            f"战斗时间线: 排队 {timeline.matching:.1f}s, 加载 {timeline.loading:.1f}s, "
+            f"战斗 {timeline.battle:.1f}s, 结算 {timeline.result:.1f}s"
+        )
+
+        self._dirty = True
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """将未保存的统计写入文件"""
+        if not self._dirty:
+            return
+        try:
+            save_json(self._path, {
+                "histograms": {
+                    profile: {metric: {"counts": hist.counts, "total": round(hist.total, 3)} for metric, hist in metrics.items()}
+                    for profile, metrics in self._histograms.items()
+                },
+                "recent": self._recent,
+            })
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"保存战斗时间线失败: {e}")
+
+    def summary(self, dungeon_id: Optional[str] = None, difficulty: Optional[str] = None) -> dict:
+        """
+        按副本 / 难度筛选并合并直方图
+
+        Args:
+            dungeon_id: 只统计该副本，None 表示全部
+            difficulty: 只统计该难度，None 表示全部
+        """
+        def selected(profile: str) -> bool:
+            profile_dungeon, _, profile_difficulty = profile.partition(":")
+            return (dungeon_id is None or profile_dungeon == dungeon_id) and \
+                (difficulty is None or profile_difficulty == difficulty)
+
+        merged: dict[str, Histogram] = {metric: Histogram() for metric in METRICS}
+        profiles = []
+        for profile, metrics in self._histograms.items():
+            if not selected(profile):
+                continue
+            profiles.append(profile)
+            for metric, hist in metrics.items():
+                merged[metric].merge(hist)
+
+        return {
+            "profiles": profiles,
+            "histograms": {metric: hist.to_dict() for metric, hist in merged.items()},
+            "recent": [timeline for timeline in self._recent if selected(timeline["profile"])],
+        }
+
+
+# 全局实例
+battle_telemetry = BattleTelemetry()
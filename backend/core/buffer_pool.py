@@ -0,0 +1,86 @@
+"""
+帧缓冲池
+复用截图解码和灰度转换的目标数组，避免长时间运行时反复分配大块内存
+"""
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+
+logger = logging.getLogger("zat.pool")
+
+
+@dataclass
+class PoolStats:
+    """缓冲池统计"""
+    allocated: int = 0   # 新分配次数
+    reused: int = 0      # 复用次数
+    dropped: int = 0     # 池满后丢弃的归还次数
+    in_use: int = 0      # 当前借出数量
+
+    def to_dict(self) -> dict:
+        return {
+            "allocated": self.allocated,
+            "reused": self.reused,
+            "dropped": self.dropped,
+            "in_use": self.in_use,
+        }
+
+
+class BufferPool:
+    """
+    按 (shape, dtype) 分组的有界缓冲池
+
+    每组最多保留 max_per_shape 个空闲数组，超出的归还会被丢弃交给 GC，
+    因此池本身占用的内存有上限。归还可能发生在 GC 线程中，内部加锁。
+    """
+
+    def __init__(self, max_per_shape: int = 4):
+        self.max_per_shape = max_per_shape
+        self.stats = PoolStats()
+        self._free: dict[tuple, list[np.ndarray]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(shape: tuple, dtype) -> tuple:
+        return (tuple(shape), np.dtype(dtype).str)
+
+    def acquire(self, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """借出一个数组（内容未初始化）"""
+        key = self._key(shape, dtype)
+        with self._lock:
+            self.stats.in_use += 1
+            free = self._free.get(key)
+            if free:
+                self.stats.reused += 1
+                return free.pop()
+            self.stats.allocated += 1
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buffer: np.ndarray):
+        """归还数组"""
+        key = self._key(buffer.shape, buffer.dtype)
+        with self._lock:
+            self.stats.in_use -= 1
+            free = self._free[key]
+            if len(free) < self.max_per_shape:
+                free.append(buffer)
+            else:
+                self.stats.dropped += 1
+
+    @property
+    def pooled_bytes(self) -> int:
+        """池中空闲数组占用的字节数"""
+        with self._lock:
+            return sum(buf.nbytes for free in self._free.values() for buf in free)
+
+    def clear(self):
+        """清空空闲数组"""
+        with self._lock:
+            self._free.clear()
+
+
+# 全局实例
+frame_pool = BufferPool()
@@ -3,16 +3,22 @@
 
 import asyncio
 import logging
-from typing import Optional, List
+import time
+from typing import Optional, Callable
 from contextlib import asynccontextmanager
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 from enum import Enum
-from datetime import datetime
 
 from core.adb_controller import ADBController
 from core.game_navigator import GameNavigator
-from core.battle_loop import BattleLoop, BattlePhase
+from core.battle_loop import BattleLoop, BattlePhase, BattleResult
+from core.battle_telemetry import battle_telemetry
+from core.history_store import history_store
+from core.frame_waiter import wait_for_any, TemplateCondition, TemplateGoneCondition
 from core.image_matcher import image_matcher
+from core.result_screen import result_parser, SKIP_REWARD_POPUP
+from core.run_checkpoint import RunCheckpoint, run_checkpoint
+from core.run_plan import PlanEntry, RunPlan, dungeon_scene
 
 logger = logging.getLogger("zat.dungeon")
 
@@ -26,6 +32,15 @@ class DungeonState(str, Enum):
     FINISHED = "finished"
 
 
+# 退出结算界面后等待副本页（或跳过奖励弹窗）的最长时间（秒）
+EXIT_TIMEOUT = 3.0
+# 预测会弹出跳过奖励确认时，副本页出现后继续等待弹窗的时间（秒）
+POPUP_GRACE = 0.8
+# 失败后开始下一次之前的等待时间（秒）
+RETRY_DELAY = 1.5
+# 保留最近多少次的再进入开销
+REENTRY_WINDOW = 20
+
 DIFFICULTY_TEMPLATES = {
     "normal": "daily_dungeon/difficulty/normal",
     "hard": "daily_dungeon/difficulty/hard",
@@ -45,19 +60,54 @@ class DungeonResult:
     success: bool
     rank: Optional[str] = None
     message: str = ""
+    stopped: bool = False                # 被 stop() 终止
 
 
 @dataclass
 class DungeonRecord:
-    # 副本运行记录
+    # 副本运行记录（持久化到运行历史存储）
     id: int
     dungeon_id: str
-    dungeon_name: str
     difficulty: str
-    difficulty_name: str
-    rank: Optional[str]
-    time: str
     status: str
+    started_at: float                   # 开始时间（Unix 时间戳）
+    rank: Optional[str] = None
+    finished_at: Optional[float] = None
+    duration: Optional[float] = None    # 耗时（秒）
+    failure: Optional[str] = None       # 失败原因
+
+
+@dataclass
+class ReentryStats:
+    # 连续运行的再进入开销：上一次退出结算界面到本次点击匹配的时间（秒）
+    runs: int = 0
+    fast: int = 0                       # 一帧确认详情页和难度后直接点击匹配的次数
+    slow: int = 0                       # 快速路径未确认，逐步进入的次数
+    total: float = 0.0
+    max: float = 0.0
+    recent: list = field(default_factory=list)
+    
+    def record(self, overhead: float, fast: bool):
+        self.runs += 1
+        if fast:
+            self.fast += 1
+        else:
+            self.slow += 1
+        self.total += overhead
+        self.max = max(self.max, overhead)
+        self.recent.append(round(overhead, 3))
+        del self.recent[:-REENTRY_WINDOW]
+    
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "fast": self.fast,
+            "slow": self.slow,
+            "avg": round(self.total / self.runs, 3) if self.runs else 0.0,
+            "recent_avg": round(sum(self.recent) / len(self.recent), 3) if self.recent else 0.0,
+            "max": round(self.max, 3),
+            "recent": self.recent,
+        }
 
 
 @dataclass
@@ -67,12 +117,17 @@ class DungeonRunResult:
     completed: int = 0
     failed: int = 0
     ranks: list = field(default_factory=list)
+    stopped: bool = False                # 被 stop() 提前终止
     
     @property
     def success_rate(self) -> float:
         return self.completed / self.total if self.total > 0 else 0
 
 
+# 流程失败后恢复到的锚点场景
+RECOVERY_ANCHORS = ["dungeon_list", "home"]
+
+
 DUNGEON_NAMES = {
     "world_tree": "世界之树",
     "mount_mechagod": "机神山",
@@ -90,8 +145,6 @@ DIFFICULTY_NAMES = {
 class DungeonRunner:
     # 副本执行器
     
-    MAX_HISTORY = 10
-    
     def __init__(self, adb: ADBController, navigator: GameNavigator):
         self.adb = adb
         self.navigator = navigator
@@ -100,9 +153,13 @@ class DungeonRunner:
         self._running = False
         self._stop_requested = False
         self._state = DungeonState.IDLE
-        self._history: List[DungeonRecord] = []
-        self._record_id = 0
         self._current_record: Optional[DungeonRecord] = None
+        self.reentry_stats = ReentryStats()
+        # 上一次成功退出结算界面的时刻（连续运行时用于计算再进入开销）
+        self._exited_at: Optional[float] = None
+        # 本次运行是否在写检查点，停止时是否保留检查点
+        self._checkpointing = False
+        self._keep_checkpoint = False
         
         self.battle_loop.set_phase_callback(self._on_battle_phase_change)
     
@@ -114,10 +171,6 @@ class DungeonRunner:
     def is_running(self) -> bool:
         return self._running
     
-    @property
-    def history(self) -> List[DungeonRecord]:
-        return self._history.copy()
-    
     def _on_battle_phase_change(self, phase: BattlePhase):
         if phase == BattlePhase.MATCHING:
             self._set_state(DungeonState.MATCHING)
@@ -129,39 +182,41 @@ class DungeonRunner:
         logger.debug(f"状态变更: {state.value}")
     
     def _add_record(self, dungeon_id: str, difficulty: str, status: str = "running") -> DungeonRecord:
-        self._record_id += 1
         record = DungeonRecord(
-            id=self._record_id,
+            id=history_store.next_id(),
             dungeon_id=dungeon_id,
-            dungeon_name=DUNGEON_NAMES.get(dungeon_id, dungeon_id),
             difficulty=difficulty,
-            difficulty_name=DIFFICULTY_NAMES.get(difficulty, difficulty),
-            rank=None,
-            time=datetime.now().strftime("%H:%M"),
             status=status,
+            started_at=time.time(),
         )
-        self._history.insert(0, record)
-        if len(self._history) > self.MAX_HISTORY:
-            self._history = self._history[:self.MAX_HISTORY]
+        history_store.save(asdict(record))
         self._current_record = record
         return record
     
-    def _update_current_record(self, status: str, rank: Optional[str] = None):
+    def _update_current_record(self, status: str, rank: Optional[str] = None, failure: Optional[str] = None):
         if self._current_record:
-            self._current_record.status = status
+            record = self._current_record
+            record.status = status
             if rank:
-                self._current_record.rank = rank
+                record.rank = rank
+            record.failure = failure
+            record.finished_at = time.time()
+            record.duration = round(record.finished_at - record.started_at, 2)
+            history_store.save(asdict(record))
 
     
     # ============================================================
     #  停止控制
     # ============================================================
     
-    def stop(self):
+    def stop(self, keep_checkpoint: bool = False):
         # 外部调用此方法终止运行
+        # keep_checkpoint: 保留检查点（后端关闭时使用，下次启动从检查点继续）
         if self._running:
             logger.info("收到停止指令...")
             self._stop_requested = True
+            # 已要求保留时不被之后的普通停止覆盖
+            self._keep_checkpoint = self._keep_checkpoint or keep_checkpoint
             self.battle_loop.stop()
     
     async def _check_stop(self):
@@ -184,19 +239,24 @@ class DungeonRunner:
         
         self._running = True
         self._stop_requested = False
+        self._exited_at = None
         logger.info("任务启动")
         
         try:
             yield True
         except asyncio.CancelledError:
-            logger.info("任务被用户终止")
+            # 协程被取消（任务强制取消 / 后端关闭）：清理后继续抛出，由调用方记为取消
+            logger.info("任务被取消")
+            raise
         except Exception as e:
             logger.error(f"任务发生未捕获异常: {e}", exc_info=True)
+            raise
         finally:
             self._running = False
             self._stop_requested = False
             self._set_state(DungeonState.IDLE)
             self._current_record = None
+            self._end_checkpoint()
             logger.info("任务结束，状态已重置")
 
     
@@ -209,40 +269,55 @@ class DungeonRunner:
         # 不包含 while 循环，不包含 running 状态的开启/关闭（由调用者负责）
         
         self._add_record(dungeon_id, difficulty, "running")
+        # 只有在详情页原地再进入同一副本时才统计再进入开销，需要导航时不计入
+        exited_at, self._exited_at = (self._exited_at if skip_navigate else None), None
         
         try:
             await self._check_stop()
             
-            # 1. 导航到副本列表
-            if not skip_navigate:
-                self._set_state(DungeonState.NAVIGATING)
-                if not await self.navigator.navigate_to("dungeon_list"):
-                    raise Exception("导航到副本列表失败")
-                await asyncio.sleep(0.5)
-            
-            await self._check_stop()
-            
-            # 2. 确保进入副本详情页（幂等）
-            if not await self._ensure_in_dungeon_detail(dungeon_id):
-                raise Exception("进入副本详情页失败")
-            await asyncio.sleep(0.3)
-            
-            await self._check_stop()
-            
-            # 3. 选难度
-            if not await self._select_difficulty(difficulty):
-                raise Exception("选择难度失败")
-            await asyncio.sleep(0.3)
-            
-            await self._check_stop()
+            # 0. 连续运行同一副本：一帧确认详情页和难度后直接点击匹配，失败时逐步进入
+            fast = skip_navigate and exited_at is not None and await self._fast_reenter(difficulty)
+            if fast:
+                self._set_state(DungeonState.MATCHING)
+            else:
+                # 1. 导航到副本列表
+                if not skip_navigate:
+                    self._set_state(DungeonState.NAVIGATING)
+                    if not await self.navigator.navigate_to("dungeon_list"):
+                        raise Exception("导航到副本列表失败")
+                    await asyncio.sleep(0.5)
+                
+                await self._check_stop()
+                
+                # 2. 确保进入副本详情页（幂等）
+                if not await self._ensure_in_dungeon_detail(dungeon_id):
+                    raise Exception("进入副本详情页失败")
+                await asyncio.sleep(0.3)
+                
+                await self._check_stop()
+                
+                # 3. 选难度
+                if not await self._select_difficulty(difficulty):
+                    raise Exception("选择难度失败")
+                await asyncio.sleep(0.3)
+                
+                await self._check_stop()
+                
+                # 4. 匹配
+                self._set_state(DungeonState.MATCHING)
+                if not await self._click_match():
+                    raise Exception("点击匹配失败")
             
-            # 4. 匹配
-            self._set_state(DungeonState.MATCHING)
-            if not await self._click_match():
-                raise Exception("点击匹配失败")
+            if exited_at is not None:
+                overhead = time.monotonic() - exited_at
+                self.reentry_stats.record(overhead, fast)
+                logger.debug(f"再进入开销: {overhead:.2f}s ({'快速路径' if fast else '逐步进入'})")
             
             # 5. 战斗
-            battle_result = await self.battle_loop.run()
+            profile = f"{dungeon_id}:{difficulty}"
+            battle_result = await self.battle_loop.run(profile=profile)
+            if not battle_result.success:
+                battle_telemetry.record(battle_result.timeline)
             
             await self._check_stop()
             
@@ -251,20 +326,26 @@ class DungeonRunner:
             
             # 5. 结算
             self._set_state(DungeonState.FINISHED)
-            await asyncio.sleep(1.0)
-            await self._exit_result_screen()
+            result_started = time.monotonic()
+            await self._exit_result_screen(battle_result, dungeon_id, profile)
+            battle_result.timeline.result = time.monotonic() - result_started
+            battle_telemetry.record(battle_result.timeline)
             
             # 成功完成
+            self._exited_at = time.monotonic()
             self._update_current_record("completed", battle_result.rank)
             logger.info(f"副本完成: {dungeon_id} ({difficulty}) - 评级: {battle_result.rank}")
             return DungeonResult(success=True, rank=battle_result.rank)
             
         except asyncio.CancelledError:
-            self._update_current_record("failed")
-            return DungeonResult(success=False, message="用户终止")
+            self._update_current_record("failed", failure="用户终止")
+            # stop() 由 _check_stop 抛出，正常返回；协程本身被取消时继续抛出
+            if asyncio.current_task().cancelling():
+                raise
+            return DungeonResult(success=False, message="用户终止", stopped=True)
         except Exception as e:
             logger.error(f"单次流程异常: {e}")
-            self._update_current_record("failed")
+            self._update_current_record("failed", failure=str(e))
             if not self._stop_requested:
                 await self._try_recover()
             return DungeonResult(success=False, message=str(e))
@@ -281,16 +362,31 @@ class DungeonRunner:
                 return DungeonResult(success=False, message="任务正在运行中")
             return await self._execute_dungeon_flow(dungeon_id, difficulty, skip_navigate=False)
     
-    async def run_loop(self, dungeon_id: str, difficulty: str = "normal", count: int = -1) -> DungeonRunResult:
+    async def run_loop(
+        self,
+        dungeon_id: str,
+        difficulty: str = "normal",
+        count: int = -1,
+        on_progress: Optional[Callable[[int, DungeonRunResult, DungeonResult], None]] = None,
+        resume: Optional[RunCheckpoint] = None,
+    ) -> DungeonRunResult:
         # 多次/无限循环入口
+        # on_progress: 每次结束后调用 (第几次, 累计结果, 本次结果)
+        # resume: 从检查点继续（已完成的次数和结果计入本次运行）
         async with self._run_context() as active:
             if not active:
                 return DungeonRunResult()
             
+            checkpoint = resume or RunCheckpoint(
+                kind="loop", params={"dungeon_id": dungeon_id, "difficulty": difficulty, "count": count},
+            )
             is_infinite = count == -1
-            result = DungeonRunResult(total=0 if is_infinite else count)
+            result = self._checkpoint_result(checkpoint, 0 if is_infinite else count)
             need_navigate = True
-            i = 0
+            if resume:
+                need_navigate = await self._resume_scene(checkpoint) != dungeon_scene(dungeon_id)
+            i = checkpoint.iteration
+            self._begin_checkpoint(checkpoint)
             
             while not self._stop_requested:
                 if not is_infinite and i >= count:
@@ -315,11 +411,147 @@ class DungeonRunner:
                     result.failed += 1
                     need_navigate = True
                 
-                if not self._stop_requested:
-                    await asyncio.sleep(1.5)
+                self._save_checkpoint(checkpoint, i, result, dungeon_id if step_res.success else None)
+                
+                if on_progress:
+                    on_progress(i, result, step_res)
+                
+                # 成功后已确认回到副本详情页，下一次直接走快速路径；失败后稍等再重试
+                if not self._stop_requested and not step_res.success:
+                    await asyncio.sleep(RETRY_DELAY)
             
+            result.stopped = self._stop_requested
             logger.info(f"副本运行完成: {result.completed}/{result.total} 成功")
             return result
+    
+    async def run_plan(
+        self,
+        plan: RunPlan,
+        on_progress: Optional[Callable[[int, PlanEntry, DungeonRunResult, DungeonResult], None]] = None,
+        resume: Optional[RunCheckpoint] = None,
+        use_checkpoint: bool = True,
+    ) -> DungeonRunResult:
+        # 按计划依次执行多个副本（计划由 run_plan.plan_runs 排序）
+        # 同一副本的条目之间只切换难度；换副本时从详情页经副本列表进入下一个副本，不从头导航
+        # on_progress: 每次结束后调用 (第几次, 当前条目, 累计结果, 本次结果)
+        # resume: 从检查点记录的计划位置继续
+        # use_checkpoint: 是否写检查点（任务引擎执行的计划由引擎负责重试，不写检查点）
+        async with self._run_context() as active:
+            if not active:
+                return DungeonRunResult()
+            
+            checkpoint = resume or RunCheckpoint(kind="plan", params=plan.to_dict())
+            result = self._checkpoint_result(checkpoint, plan.total)
+            # 当前所在的副本详情页（None 表示位置未知，需要导航）
+            at_dungeon: Optional[str] = None
+            if resume:
+                scene = await self._resume_scene(checkpoint)
+                if scene and scene.startswith("dungeon:"):
+                    at_dungeon = scene.split(":", 1)[1]
+            i = checkpoint.iteration
+            if use_checkpoint:
+                self._begin_checkpoint(checkpoint)
+            
+            for index, entry in enumerate(plan.entries):
+                if index < checkpoint.entry_index:
+                    continue
+                done = checkpoint.entry_done if index == checkpoint.entry_index else 0
+                
+                while done < entry.count and not self._stop_requested:
+                    i += 1
+                    logger.info(f"=== 第 {i}/{plan.total} 次: {entry.dungeon_id} ({entry.difficulty}) ===")
+                    
+                    if at_dungeon != entry.dungeon_id:
+                        step_res = await self._enter_dungeon(entry.dungeon_id, entry.difficulty, at_dungeon)
+                    else:
+                        step_res = None
+                    if step_res is None:
+                        step_res = await self._execute_dungeon_flow(entry.dungeon_id, entry.difficulty, skip_navigate=True)
+                    
+                    if self._stop_requested:
+                        break
+                    
+                    done += 1
+                    if step_res.success:
+                        result.completed += 1
+                        result.ranks.append(step_res.rank)
+                        at_dungeon = entry.dungeon_id
+                    else:
+                        result.failed += 1
+                        at_dungeon = None
+                    
+                    checkpoint.entry_index, checkpoint.entry_done = (index, done) if done < entry.count else (index + 1, 0)
+                    self._save_checkpoint(checkpoint, i, result, at_dungeon)
+                    
+                    if on_progress:
+                        on_progress(i, entry, result, step_res)
+                    
+                    if not self._stop_requested and not step_res.success:
+                        await asyncio.sleep(RETRY_DELAY)
+            
+            result.stopped = self._stop_requested
+            logger.info(f"运行计划完成: {result.completed}/{result.total} 成功")
+            return result
+    
+    # ============================================================
+    #  检查点 (Private) - 每次结束时保存进度，重启后从检查点继续
+    # ============================================================
+    
+    @staticmethod
+    def _checkpoint_result(checkpoint: RunCheckpoint, total: int) -> DungeonRunResult:
+        return DungeonRunResult(
+            total=total or checkpoint.iteration,
+            completed=checkpoint.completed,
+            failed=checkpoint.failed,
+            ranks=list(checkpoint.ranks),
+        )
+    
+    def _begin_checkpoint(self, checkpoint: RunCheckpoint):
+        self._checkpointing = True
+        run_checkpoint.save(checkpoint)
+    
+    def _save_checkpoint(self, checkpoint: RunCheckpoint, iteration: int, result: DungeonRunResult, at_dungeon: Optional[str]):
+        # 成功时已确认回到副本详情页；失败时记录异常恢复后导航器确定的场景
+        checkpoint.iteration = iteration
+        checkpoint.completed = result.completed
+        checkpoint.failed = result.failed
+        checkpoint.ranks = list(result.ranks)
+        checkpoint.scene = dungeon_scene(at_dungeon) if at_dungeon else self.navigator.get_current_scene()
+        if self._checkpointing:
+            run_checkpoint.save(checkpoint)
+    
+    def _end_checkpoint(self):
+        # 正常结束或用户停止时删除检查点；后端关闭（stop(keep_checkpoint=True)）时保留，下次启动继续
+        if self._checkpointing and not self._keep_checkpoint:
+            run_checkpoint.clear()
+        self._checkpointing = False
+        self._keep_checkpoint = False
+    
+    async def _resume_scene(self, checkpoint: RunCheckpoint) -> Optional[str]:
+        # 以检查点记录的场景为提示检测一次场景（画面没变时只需确认提示场景）
+        self._set_state(DungeonState.NAVIGATING)
+        scene = await self.navigator.detect_current_scene(hint=checkpoint.scene)
+        logger.info(f"从检查点继续: 已完成 {checkpoint.iteration} 次，当前场景 {scene}")
+        return scene
+    
+    async def _enter_dungeon(self, dungeon_id: str, difficulty: str, at_dungeon: Optional[str]) -> Optional[DungeonResult]:
+        # 进入副本详情页：已知在另一个副本详情页时经副本列表过去，否则从当前场景导航
+        # 成功返回 None，失败时记录一次失败并返回结果
+        # 换副本不是再进入，不统计再进入开销（否则会把导航时间算进去）
+        self._exited_at = None
+        self._set_state(DungeonState.NAVIGATING)
+        if at_dungeon is not None:
+            # 退出结算界面后已确认回到详情页，导航器不知道战斗期间的场景变化
+            self.navigator.set_current_scene(dungeon_scene(at_dungeon))
+        
+        if await self.navigator.navigate_to(dungeon_scene(dungeon_id)):
+            return None
+        
+        self._add_record(dungeon_id, difficulty, "running")
+        self._update_current_record("failed", failure="导航到副本失败")
+        if not self._stop_requested:
+            await self._try_recover()
+        return DungeonResult(success=False, message="导航到副本失败")
 
     
     # ============================================================
@@ -334,19 +566,42 @@ class DungeonRunner:
         
         selected_template = DIFFICULTY_SELECTED_TEMPLATES.get(difficulty)
         if selected_template:
-            screen = await self.adb.screencap_array()
+            screen = await self.adb.capture()
             if image_matcher.match_template(screen, selected_template, threshold=0.7):
                 logger.info(f"难度 {difficulty} 已选中")
                 return True
         
-        success = await self.navigator.click_template(template, timeout=3.0)
+        success = await self.navigator.click_template(template, timeout=3.0, blind=True)
         if success:
             logger.info(f"已选择难度: {difficulty}")
         return success
     
+    async def _fast_reenter(self, difficulty: str) -> bool:
+        # 快速路径：在上次点击之后的第一帧上同时确认匹配按钮和难度已选中，确认后直接点击匹配
+        # 任一项不满足时返回 False，由调用者逐步进入
+        selected = DIFFICULTY_SELECTED_TEMPLATES.get(difficulty)
+        if not selected:
+            return False
+        
+        frame = await self.adb.pipeline.next_frame(after=self.adb.pipeline.last_input)
+        match = image_matcher.match_template(
+            frame, "daily_dungeon/match", threshold=0.7, region=image_matcher.search_region("daily_dungeon/match"),
+        )
+        if not match or not image_matcher.match_template(
+            frame, selected, threshold=0.7, region=image_matcher.search_region(selected),
+        ):
+            logger.debug("快速路径未确认详情页和难度，逐步进入")
+            return False
+        
+        x, y, _ = match
+        await self.adb.tap(x, y)
+        self.navigator.tap_cache.observe("daily_dungeon/match", x, y)
+        logger.info("点击匹配按钮（快速路径）")
+        return True
+    
     async def _click_match(self) -> bool:
         logger.info("点击匹配按钮")
-        return await self.navigator.click_template("daily_dungeon/match", timeout=5.0)
+        return await self.navigator.click_template("daily_dungeon/match", timeout=5.0, blind=True)
     
     async def _click_confirm_skip_reward(self) -> bool:
         # 点击确认跳过奖励弹窗（不是每次都有）
@@ -358,19 +613,44 @@ class DungeonRunner:
         logger.info(f"点击副本: {dungeon_id}")
         return await self.navigator.click_template(template, timeout=5.0)
     
-    async def _exit_result_screen(self) -> bool:
-        # 退出结算界面，回到副本列表
+    async def _exit_result_screen(self, battle_result: BattleResult, dungeon_id: str, profile: str) -> bool:
+        # 退出结算界面，回到副本页
+        # 退出按钮已在识别评级的同一帧上找到时直接点击；跳过奖励弹窗与副本页谁先出现处理谁，
+        # 只有预测会弹窗时才在副本页出现后多等一会
         logger.info("退出结算界面")
-        success = await self.navigator.click_template("back", timeout=5.0)
-        if not success:
-            logger.warning("点击返回失败，尝试按返回键")
-            await self.navigator.press_back()
+        screen = battle_result.screen
+        popup = TemplateCondition(SKIP_REWARD_POPUP, threshold=0.6, priority=1)
+        conditions = [popup, TemplateCondition("daily_dungeon/match"), TemplateCondition(f"daily_dungeon/{dungeon_id}")]
+        
+        result = None
+        for exit_button in (screen.exit if screen else None, None):
+            tapped_at = time.monotonic()
+            if exit_button:
+                await self.adb.tap(exit_button[0], exit_button[1])
+            elif not await self.navigator.click_template("back", timeout=5.0):
+                logger.warning("点击返回失败，尝试按返回键")
+                await self.navigator.press_back()
+            
+            result = await wait_for_any(self.adb.pipeline, conditions, EXIT_TIMEOUT, max_interval=0.3, after=tapped_at)
+            if result:
+                break
+        
+        if result is None:
+            logger.warning("退出结算界面后未识别到副本页")
+            return False
+        
+        if result.condition is not popup and (screen is None or screen.skip_reward_likely):
+            # 弹窗可能在副本页出现之后才弹出
+            result = await wait_for_any(
+                self.adb.pipeline, [popup], POPUP_GRACE, max_interval=0.2, after=result.frame.timestamp,
+            ) or result
         
-        # 等待动画，处理可能出现的跳过奖励弹窗
-        await asyncio.sleep(1.0)
-        if await self._click_confirm_skip_reward():
+        appeared = result.condition is popup
+        if screen:
+            result_parser.record_skip_reward(screen.rank, appeared, profile)
+        if appeared and await self._click_confirm_skip_reward():
             logger.info("已确认跳过奖励")
-            await asyncio.sleep(0.5)
+            await wait_for_any(self.adb.pipeline, [TemplateGoneCondition(SKIP_REWARD_POPUP, threshold=0.6)], 1.5)
         
         return True
     
@@ -378,7 +658,7 @@ class DungeonRunner:
         # 确保当前在副本详情页（幂等操作）
         # 无论当前在 dungeon_list 还是 dungeon:xxx，都能正确进入
         template = f"daily_dungeon/{dungeon_id}"
-        screen = await self.adb.screencap_array()
+        screen = await self.adb.capture()
         
         # 检查是否已在副本详情页（能看到匹配按钮）
         if image_matcher.match_template(screen, "daily_dungeon/match", threshold=0.7):
@@ -389,8 +669,5 @@ class DungeonRunner:
         return await self._click_dungeon(dungeon_id)
     
     async def _try_recover(self):
-        logger.info("尝试恢复...")
-        for _ in range(3):
-            await self.navigator.press_back()
-            await asyncio.sleep(0.5)
-        await self.navigator.detect_current_scene()
+        # 回到副本列表（下一轮从这里重新导航），先处理弹窗，无法识别的画面才按返回键
+        await self.navigator.recovery.recover(anchors=RECOVERY_ANCHORS)
@@ -0,0 +1,155 @@
+"""
+截图帧
+封装一次截图及其派生视图（灰度、ROI 裁剪、感知哈希、匹配结果），
+派生数据在首次请求时计算并缓存，同一帧上的多次检测只计算一次
+
+使用缓冲池时，截图和灰度图的内存在 Frame 被回收时自动归还，
+因此由 Frame 派生的数组（image、gray、crop 等）不应在 Frame 之外长期持有
+"""
+import hashlib
+import time
+import weakref
+from typing import Any, Callable, Optional, Tuple
+import numpy as np
+import cv2
+
+from core.buffer_pool import BufferPool
+
+# 区域格式与 OCR 一致: (x, y, w, h)
+Region = Tuple[int, int, int, int]
+
+
+def clip_region(region: Region, width: int, height: int) -> Region:
+    """将区域截断到 width x height 的图像范围内"""
+    x, y, w, h = region
+    x0 = min(max(x, 0), width)
+    y0 = min(max(y, 0), height)
+    x1 = min(max(x + w, x0), width)
+    y1 = min(max(y + h, y0), height)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+class Frame:
+    """截图帧"""
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        timestamp: float,
+        device: Optional[str] = None,
+        duration: float = 0.0,
+        pool: Optional[BufferPool] = None,
+    ):
+        """
+        Args:
+            image: BGR 格式的截图（若来自 pool，则由 Frame 负责归还）
+            timestamp: 截图开始时刻（time.monotonic()）
+            device: 设备地址
+            duration: 截图耗时（秒）
+            pool: 缓冲池，派生的灰度图也从这里借用
+        """
+        self.image = image
+        self.timestamp = timestamp
+        self.device = device
+        self.duration = duration
+        self._pool = pool
+        self._cache: dict[Any, Any] = {}
+        if pool is not None:
+            self._adopt(image)
+
+    def _adopt(self, buffer: np.ndarray):
+        """Frame 被回收时将 buffer 归还缓冲池"""
+        weakref.finalize(self, self._pool.release, buffer)
+
+    @property
+    def width(self) -> int:
+        return self.image.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.image.shape[0]
+
+    @property
+    def shape(self) -> tuple:
+        return self.image.shape
+
+    def cached(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """
+        获取缓存的派生数据，不存在时调用 compute 计算并缓存
+
+        供外部模块（模板匹配、OCR 等）在帧上挂载自己的计算结果
+        """
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def gray(self) -> np.ndarray:
+        """灰度图"""
+        def compute():
+            if self._pool is None:
+                return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+            dst = self._pool.acquire(self.image.shape[:2])
+            self._adopt(dst)
+            return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=dst)
+
+        return self.cached("gray", compute)
+
+    def crop(self, region: Region, gray: bool = False) -> np.ndarray:
+        """
+        裁剪区域（返回视图，不复制数据）
+
+        Args:
+            region: (x, y, w, h)，超出屏幕的部分会被截断
+            gray: 是否从灰度图裁剪
+        """
+        x, y, w, h = self.clip_region(region)
+
+        def compute():
+            source = self.gray if gray else self.image
+            return source[y:y + h, x:x + w]
+
+        return self.cached(("crop", (x, y, w, h), gray), compute)
+
+    def clip_region(self, region: Region) -> Region:
+        """将区域截断到屏幕范围内"""
+        return clip_region(region, self.width, self.height)
+
+    @property
+    def phash(self) -> int:
+        """
+        感知哈希（64 位 dHash）
+
+        对整体布局敏感，对压缩噪声和细小变化不敏感，可用于快速比较两帧是否相似
+        """
+        def compute():
+            small = cv2.resize(self.gray, (9, 8), interpolation=cv2.INTER_AREA)
+            bits = (small[:, 1:] > small[:, :-1]).flatten()
+            value = 0
+            for bit in bits:
+                value = (value << 1) | int(bit)
+            return value
+
+        return self.cached("phash", compute)
+
+    @property
+    def digest(self) -> str:
+        """像素内容摘要（精确比较两帧是否完全相同）"""
+        def compute():
+            data = np.ascontiguousarray(self.image)
+            return hashlib.blake2b(data.data, digest_size=8).hexdigest()
+
+        return self.cached("digest", compute)
+
+    @property
+    def age(self) -> float:
+        """距截图时刻的秒数"""
+        return time.monotonic() - self.timestamp
+
+    def __repr__(self) -> str:
+        return f"Frame({self.width}x{self.height}, device={self.device}, t={self.timestamp:.3f})"
+
+
+def phash_distance(a: int, b: int) -> int:
+    """两个感知哈希之间的汉明距离"""
+    return bin(a ^ b).count("1")
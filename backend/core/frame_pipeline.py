@@ -0,0 +1,196 @@
+"""
+截图流水线
+双缓冲：消费者处理第 N 帧时，第 N+1 帧的截图已在进行中
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from core.frame import Frame
+
+logger = logging.getLogger("zat.pipeline")
+
+
+@dataclass
+class PipelineStats:
+    """流水线统计"""
+    frames: int = 0              # 已交付帧数
+    prefetch_hits: int = 0       # 交付时截图已提前开始的帧数
+    captures: int = 0            # 实际截图次数
+    capture_time: float = 0.0    # 截图总耗时（秒）
+    wait_time: float = 0.0       # 消费者等待总耗时（秒）
+    saved_time: float = 0.0      # 重叠节省的总耗时（秒）
+
+    def to_dict(self) -> dict:
+        frames = max(self.frames, 1)
+        captures = max(self.captures, 1)
+        return {
+            "frames": self.frames,
+            "captures": self.captures,
+            "prefetch_hits": self.prefetch_hits,
+            "avg_capture_ms": round(self.capture_time / captures * 1000, 1),
+            "avg_wait_ms": round(self.wait_time / frames * 1000, 1),
+            "avg_saved_ms": round(self.saved_time / frames * 1000, 1),
+        }
+
+
+class FramePipeline:
+    """
+    截图流水线
+
+    每交付一帧就立即开始下一次截图（最多预取一帧），消费者通过
+    next_frame(after=T) 获取「截图开始时刻晚于 T」的帧。
+    点击/滑动等输入之前开始的截图不会被交付，避免拿到操作前的画面；
+    输入时进行中的预取直接取消，下一次请求立即开始新的截图。
+    """
+
+    # 未指定 after 时，可接受的帧最大年龄（秒）
+    DEFAULT_MAX_AGE = 0.5
+
+    def __init__(self, capture: Callable[[], Awaitable[Frame]], pipelined: bool = True):
+        """
+        Args:
+            capture: 截图函数
+            pipelined: 是否启用流水线模式，关闭时每次请求直接串行截图
+        """
+        self._capture = capture
+        self.pipelined = pipelined
+        self.stats = PipelineStats()
+
+        self._latest: Optional[Frame] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._inflight_started = 0.0
+        self._last_input = 0.0
+        self._published: Optional[asyncio.Event] = None
+
+    @property
+    def latest(self) -> Optional[Frame]:
+        """最近一次截图（不触发截图）"""
+        return self._latest
+
+    @property
+    def last_input(self) -> float:
+        """最近一次输入操作的时刻（time.monotonic()）"""
+        return self._last_input
+
+    def mark_input(self):
+        """记录一次输入操作，此前开始的截图视为过期（进行中的截图取消，不再等它完成）"""
+        self._last_input = time.monotonic()
+        if not self._capture_idle():
+            self._inflight.cancel()
+
+    def reset(self):
+        """丢弃缓存的帧（设备切换或断开时调用）"""
+        self._latest = None
+        self._last_input = time.monotonic()
+
+    async def _run_capture(self, started: float) -> Frame:
+        frame = await self._capture()
+        self.stats.captures += 1
+        self.stats.capture_time += time.monotonic() - started
+        if self._latest is None or frame.timestamp > self._latest.timestamp:
+            self._latest = frame
+            # 唤醒被动等待者，并为下一帧准备新的事件
+            if self._published is not None:
+                self._published.set()
+                self._published = None
+        return frame
+
+    def _start_capture(self) -> asyncio.Task:
+        started = time.monotonic()
+        task = asyncio.ensure_future(self._run_capture(started))
+        # 预取失败且无人等待时，避免 "exception was never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight = task
+        self._inflight_started = started
+        return task
+
+    def _capture_idle(self) -> bool:
+        return self._inflight is None or self._inflight.done()
+
+    async def next_frame(self, after: Optional[float] = None, prefetch: bool = True) -> Frame:
+        """
+        获取下一帧
+
+        Args:
+            after: 只接受截图开始时刻晚于该时刻（time.monotonic()）的帧；
+                   默认接受不超过 DEFAULT_MAX_AGE 秒的帧
+            prefetch: 交付后是否立即预取下一帧（一次性请求应传 False）
+
+        Returns:
+            Frame
+        """
+        requested = time.monotonic()
+        if after is None:
+            after = requested - self.DEFAULT_MAX_AGE
+        after = max(after, self._last_input)
+
+        if not self.pipelined:
+            return await self._deliver_serial(requested)
+
+        prefetched = True
+        while True:
+            latest = self._latest
+            if latest is not None and latest.timestamp > after:
+                frame = latest
+                break
+
+            if self._capture_idle():
+                self._start_capture()
+                prefetched = False
+            elif self._inflight_started <= after:
+                # 进行中的截图开始得太早，等它完成后再截一次
+                prefetched = False
+
+            task = self._inflight
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # 进行中的截图被输入取消时重新截图；自身被取消时照常抛出
+                if not task.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        wait = time.monotonic() - requested
+        self.stats.frames += 1
+        self.stats.wait_time += wait
+        if prefetched:
+            self.stats.prefetch_hits += 1
+            self.stats.saved_time += max(frame.duration - wait, 0.0)
+
+        # 预取下一帧，与消费者的处理重叠
+        if prefetch and self._capture_idle():
+            self._start_capture()
+
+        return frame
+
+    async def wait_for_frame(self, after: float, timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        被动等待一帧截图开始时刻晚于 after 的帧，不触发截图
+
+        用于预览等旁路消费者，只复用其他消费者已经截取的帧
+
+        Returns:
+            Frame，超时返回 None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._latest is None or self._latest.timestamp <= after:
+            if self._published is None:
+                self._published = asyncio.Event()
+            event = self._published
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+        return self._latest
+
+    async def _deliver_serial(self, requested: float) -> Frame:
+        frame = await self._run_capture(requested)
+        self.stats.frames += 1
+        self.stats.wait_time += time.monotonic() - requested
+        return frame
@@ -0,0 +1,283 @@
+"""
+视觉等待
+在截图流水线上等待一组条件（模板出现、文字出现、区域变化）中的任意一个满足
+
+超时按单调时钟计算（包含截图和识别耗时）。轮询间隔自适应：画面在变化时立即处理下一帧，
+画面静止时逐步放慢到 max_interval，减少无意义的截图和匹配
+"""
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+import cv2
+
+from core.frame import Frame, Region
+from core.frame_pipeline import FramePipeline
+from core.image_matcher import image_matcher
+
+logger = logging.getLogger("zat.waiter")
+
+# 匹配结果: (x, y, 置信度或变化量)
+Match = Tuple[int, int, float]
+
+# 画面变化检测的缩略图尺寸 (w, h)
+THUMBNAIL_SIZE = (32, 32)
+# 相邻两帧缩略图的平均差异超过该值（0-1）视为画面在变化
+MOTION_THRESHOLD = 0.01
+# 画面静止时轮询间隔的增长倍数和起始值（秒）
+BACKOFF_FACTOR = 1.5
+BACKOFF_START = 0.1
+# 轮询间隔不超过该值时预取下一帧，间隔更长时预取的帧到使用时已经过期
+PREFETCH_MAX_INTERVAL = 0.3
+
+
+def _thumbnail(frame: Frame, region: Optional[Region] = None) -> np.ndarray:
+    """缩略灰度图（缓存在 Frame 上）"""
+    def compute():
+        source = frame.gray if region is None else frame.crop(region, gray=True)
+        if source.size == 0:
+            return np.zeros(THUMBNAIL_SIZE[::-1], dtype=np.uint8)
+        return cv2.resize(source, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+    return frame.cached(("thumbnail", region), compute)
+
+
+def frame_change(a: Frame, b: Frame, region: Optional[Region] = None) -> float:
+    """两帧（指定区域）缩略图的平均差异，0 表示相同，1 表示完全相反"""
+    diff = cv2.absdiff(_thumbnail(a, region), _thumbnail(b, region))
+    return float(diff.mean()) / 255
+
+
+class Condition(ABC):
+    """
+    等待条件
+
+    priority 越大越优先：同一帧上有多个条件满足时，返回优先级最高的
+    """
+
+    def __init__(self, name: str, priority: int = 0):
+        self.name = name
+        self.priority = priority
+
+    def reset(self):
+        """开始等待前调用，有状态的条件在这里清空状态"""
+
+    @abstractmethod
+    def check(self, frame: Frame) -> Optional[Match]:
+        """检查条件，满足时返回 (x, y, score)"""
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name})"
+
+
+class TemplateCondition(Condition):
+    """模板出现"""
+
+    def __init__(
+        self,
+        template: str,
+        threshold: float = 0.7,
+        region: Optional[Region] = None,
+        priority: int = 0,
+        name: Optional[str] = None,
+    ):
+        super().__init__(name or template, priority)
+        self.template = template
+        self.threshold = threshold
+        self.region = region
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        return image_matcher.match_template(frame, self.template, threshold=self.threshold, region=self.region)
+
+
+class TemplateGoneCondition(Condition):
+    """模板消失（如弹窗关闭、按钮点击后消失）"""
+
+    def __init__(
+        self,
+        template: str,
+        threshold: float = 0.7,
+        region: Optional[Region] = None,
+        priority: int = 0,
+        name: Optional[str] = None,
+    ):
+        super().__init__(name or f"gone:{template}", priority)
+        self.template = template
+        self.threshold = threshold
+        self.region = region
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        if image_matcher.match_template(frame, self.template, threshold=self.threshold, region=self.region):
+            return None
+        return (frame.width // 2, frame.height // 2, 1.0)
+
+
+class TextCondition(Condition):
+    """文字出现（OCR）"""
+
+    def __init__(
+        self,
+        text: str,
+        region: Union[Region, Callable[[Frame], Region], None] = None,
+        priority: int = 0,
+        name: Optional[str] = None,
+        every: int = 1,
+    ):
+        """
+        Args:
+            region: 搜索区域，或根据帧尺寸计算区域的函数
+            every: 每 every 帧才做一次 OCR（OCR 在事件循环中同步执行，开销大）
+        """
+        super().__init__(name or f"text:{text}", priority)
+        self.text = text
+        self.region = region
+        self.every = max(every, 1)
+        self._checks = 0
+
+    def reset(self):
+        self._checks = 0
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        self._checks += 1
+        if (self._checks - 1) % self.every:
+            return None
+        region = self.region(frame) if callable(self.region) else self.region
+        return image_matcher.ocr_find_text(frame, self.text, region=region)
+
+
+class RoiChangeCondition(Condition):
+    """区域内容相对基准帧发生变化"""
+
+    def __init__(
+        self,
+        region: Optional[Region] = None,
+        threshold: float = 0.05,
+        priority: int = 0,
+        name: Optional[str] = None,
+        baseline: Optional[Frame] = None,
+    ):
+        """
+        Args:
+            region: 监视区域，None 表示全屏
+            threshold: 缩略图平均差异阈值（0-1）
+            baseline: 基准帧（如操作前的画面），默认为开始等待后的第一帧
+        """
+        super().__init__(name or f"change:{region or 'full'}", priority)
+        self.region = region
+        self.threshold = threshold
+        self._initial = baseline
+        self._baseline = baseline
+
+    def reset(self):
+        self._baseline = self._initial
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        if self._baseline is None:
+            self._baseline = frame
+            return None
+
+        change = frame_change(self._baseline, frame, self.region)
+        if change < self.threshold:
+            return None
+
+        x, y, w, h = frame.clip_region(self.region) if self.region else (0, 0, frame.width, frame.height)
+        return (x + w // 2, y + h // 2, change)
+
+
+@dataclass
+class WaitResult:
+    """等待结果"""
+    condition: Condition         # 满足的条件
+    match: Match                 # (x, y, score)
+    frame: Frame                 # 满足条件的帧
+    elapsed: float               # 等待耗时（秒）
+    previous: Optional[float] = None  # 上一帧（条件尚未满足）的截图时刻，用于估计条件出现的时刻
+
+    @property
+    def appeared_at(self) -> float:
+        """条件出现时刻的估计：上一帧与本帧截图时刻的中点"""
+        if self.previous is None:
+            return self.frame.timestamp
+        return (self.previous + self.frame.timestamp) / 2
+
+    @property
+    def name(self) -> str:
+        return self.condition.name
+
+    @property
+    def x(self) -> int:
+        return self.match[0]
+
+    @property
+    def y(self) -> int:
+        return self.match[1]
+
+
+async def wait_for_any(
+    pipeline: FramePipeline,
+    conditions: list[Condition],
+    timeout: float,
+    max_interval: float = 1.0,
+    min_interval: float = 0.0,
+    cancelled: Optional[Callable[[], bool]] = None,
+    after: Optional[float] = None,
+) -> Optional[WaitResult]:
+    """
+    等待任意一个条件满足
+
+    每帧按优先级从高到低检查条件，返回第一个满足的。至少会检查一帧（timeout 为 0 时相当于单次检测）
+
+    Args:
+        pipeline: 截图流水线
+        conditions: 等待条件
+        timeout: 超时时间（秒）
+        max_interval: 画面静止时的最长轮询间隔
+        min_interval: 画面变化时的轮询间隔
+        cancelled: 返回 True 时中止等待
+        after: 只使用截图开始时刻晚于该时刻的帧
+
+    Returns:
+        WaitResult，超时或被中止时返回 None
+    """
+    ordered = sorted(conditions, key=lambda c: c.priority, reverse=True)
+    for condition in ordered:
+        condition.reset()
+
+    started = time.monotonic()
+    deadline = started + timeout
+    interval = min_interval
+    previous: Optional[Frame] = None
+
+    while not (cancelled and cancelled()):
+        prefetch = interval <= PREFETCH_MAX_INTERVAL
+        if previous is not None:
+            # 间隔较长时只接受等待期间开始的截图，避免用到等待前预取的旧画面
+            after = previous.timestamp if prefetch else max(previous.timestamp, time.monotonic() - interval)
+        frame = await pipeline.next_frame(after=after, prefetch=prefetch)
+
+        for condition in ordered:
+            match = condition.check(frame)
+            if match:
+                return WaitResult(
+                    condition, match, frame, time.monotonic() - started,
+                    previous.timestamp if previous else None,
+                )
+
+        now = time.monotonic()
+        if now >= deadline:
+            break
+
+        if previous is not None and frame_change(previous, frame) >= MOTION_THRESHOLD:
+            interval = min_interval
+        else:
+            interval = min(max(interval * BACKOFF_FACTOR, BACKOFF_START), max_interval)
+        previous = frame
+
+        if interval > 0:
+            await asyncio.sleep(min(interval, deadline - now))
+
+    return None
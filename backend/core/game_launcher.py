@@ -4,16 +4,19 @@
 """
 import asyncio
 import logging
+import time
 from typing import Optional
 
 from core.adb_controller import ADBController
-from core.image_matcher import image_matcher
+from core.frame_waiter import wait_for_any, TemplateCondition, TextCondition
 
 logger = logging.getLogger("zat.game")
 
 # 游戏配置
 GAME_PACKAGE = "com.leiting.zjcs"
 GAME_ACTIVITY = "com.leiting.unity.AppActivity"
+# 等待加载时每几帧做一次 OCR（模板匹配每帧都做）
+READY_OCR_EVERY = 4
 
 
 class GameLauncher:
@@ -94,62 +97,54 @@ class GameLauncher:
         
         Args:
             timeout: 超时时间（秒）
-            check_interval: 检测间隔（秒）
+            check_interval: 检测间隔（秒），加载动画播放时也不会更快
         
         Returns:
             True 如果成功进入游戏，False 如果超时或被中断
         """
         logger.info("等待游戏加载...")
         
-        elapsed = 0
-        check_count = 0
+        # 优先使用模板匹配（速度快），模板没匹配到时每 READY_OCR_EVERY 帧用 OCR 在屏幕下方 1/4 区域查找文字
+        conditions = [
+            TemplateCondition("start", priority=1),
+            TextCondition(
+                self.CLICK_TO_START_TEXT,
+                region=lambda frame: (0, int(frame.height * 0.75), frame.width, int(frame.height * 0.25)),
+                every=READY_OCR_EVERY,
+            ),
+        ]
+        deadline = time.monotonic() + timeout
         
-        while elapsed < timeout:
-            # 检查是否被中断
-            if not self._waiting:
-                logger.info("等待游戏加载被中断")
+        while self._waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"等待游戏加载超时 ({timeout}s)")
                 return False
             
-            check_count += 1
             try:
-                screen = await self.adb.screencap_array()
-                h, w = screen.shape[:2]
-                
-                # 每 20 次检测输出一次日志
-                if check_count % 20 == 1:
-                    logger.debug(f"检测中... ({elapsed:.1f}s/{timeout}s)")
-                
-                # 只搜索屏幕下方 1/4 区域
-                region = (0, int(h * 0.75), w, int(h * 0.25))
-                
-                # 优先使用模板匹配（速度快）
-                result = image_matcher.match_template(screen, "start", threshold=0.7)
-                
-                # 如果模板匹配失败，使用 OCR 作为备用
-                if not result:
-                    result = image_matcher.ocr_find_text(
-                        screen,
-                        self.CLICK_TO_START_TEXT,
-                        region=region
-                    )
-                
-                if result:
-                    x, y, confidence = result
-                    logger.info(f"检测到游戏启动页面 (置信度: {confidence:.2f})，点击进入...")
-                    
-                    await self.adb.tap(x, y)
-                    await asyncio.sleep(1.0)
-                    
-                    logger.info("已进入游戏")
-                    return True
-                
+                result = await wait_for_any(
+                    self.adb.pipeline,
+                    conditions,
+                    remaining,
+                    max_interval=check_interval,
+                    min_interval=check_interval,
+                    cancelled=lambda: not self._waiting,
+                )
             except Exception as e:
                 if not self._waiting:
                     return False
                 logger.warning(f"检测游戏状态失败: {e}")
+                await asyncio.sleep(check_interval)
+                continue
             
-            await asyncio.sleep(check_interval)
-            elapsed += check_interval
+            if result:
+                logger.info(f"检测到游戏启动页面 (置信度: {result.match[2]:.2f})，点击进入...")
+                
+                await self.adb.tap(result.x, result.y)
+                await asyncio.sleep(1.0)
+                
+                logger.info("已进入游戏")
+                return True
         
-        logger.warning(f"等待游戏加载超时 ({timeout}s)")
+        logger.info("等待游戏加载被中断")
         return False
@@ -4,86 +4,346 @@
 """
 import asyncio
 import logging
+from dataclasses import dataclass
 from typing import Optional
 
 from core.adb_controller import ADBController
+from core.frame import Frame
+from core.frame_waiter import wait_for_any, frame_change, Condition, Match, TemplateCondition, TextCondition
 from core.image_matcher import image_matcher
+from core.recovery import RecoveryPlanner
+from core.scene_classifier import scene_classifier
+from core.scene_model import scene_model
+from core.scroll_search import ScrollSearcher
+from core.tap_cache import TapCache
 from core.scene_graph import (
     scene_navigator, 
     Scene, 
     Transition, 
     ActionType,
+    HopResult,
     SCENES
 )
 
 logger = logging.getLogger("zat.navigator")
 
+# 底部导航栏场景（始终可见的标签页，优先检测）
+TAB_SCENES = ["home", "note", "character", "guild", "world"]
+
+# 到达确认：每轮最长等待 wait_after，最多 ARRIVAL_ATTEMPTS 轮
+ARRIVAL_ATTEMPTS = 3
+ARRIVAL_POLL_INTERVAL = 0.1
+# 目标模板操作前就已可见时，画面相对操作前的最小变化量（0-1）
+ARRIVAL_MIN_CHANGE = 0.02
+
+
+@dataclass
+class DetectionStats:
+    """场景检测统计"""
+    detections: int = 0          # 检测次数
+    template_checks: int = 0     # 模板匹配次数
+    ocr_checks: int = 0          # OCR 次数
+    
+    def to_dict(self) -> dict:
+        detections = max(self.detections, 1)
+        return {
+            "detections": self.detections,
+            "template_checks": self.template_checks,
+            "ocr_checks": self.ocr_checks,
+            "avg_template_checks": round(self.template_checks / detections, 2),
+            "avg_ocr_checks": round(self.ocr_checks / detections, 2),
+        }
+
+
+@dataclass
+class SpeculationStats:
+    """多跳导航预判执行统计"""
+    attempts: int = 0            # 确认到达时同时监视下一跳模板的次数
+    hits: int = 0                # 提前点击下一跳的次数
+    misses: int = 0              # 提前点击后未能到达的次数
+    
+    def to_dict(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / self.attempts, 3) if self.attempts else 0.0,
+        }
+
+
+class _ArrivalCondition(Condition):
+    """
+    到达目标场景：positive 任一出现且 negative 都不出现
+
+    before 不为 None 时（目标模板在操作前的画面里就已可见）还要求画面相对操作前发生明显变化
+    """
+
+    def __init__(self, positive: list[str], negative: list[str], before: Optional[Frame], full: bool):
+        """
+        Args:
+            full: positive 做全屏搜索；否则只在模板上次出现的位置附近搜索
+        """
+        super().__init__("arrival")
+        self.positive = positive
+        self.negative = [TemplateCondition(template) for template in negative]
+        self.before = before
+        self.full = full
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        if self.before is not None and frame_change(self.before, frame) < ARRIVAL_MIN_CHANGE:
+            return None
+        for template in self.positive:
+            region = None if self.full else image_matcher.search_region(template)
+            match = image_matcher.match_template(frame, template, threshold=0.7, region=region)
+            if match:
+                return None if any(negative.check(frame) for negative in self.negative) else match
+        return None
+
 
 class GameNavigator:
     """游戏场景导航器"""
     
     def __init__(self, adb: ADBController):
         self.adb = adb
+        self.detection_stats = DetectionStats()
+        self.speculation_stats = SpeculationStats()
+        self.scroller = ScrollSearcher(adb)
+        self.tap_cache = TapCache(adb, on_miss=self._on_blind_tap_miss)
+        self.recovery = RecoveryPlanner(self)
+        # 本次导航中是否有提前执行的操作未能到达（需要重新检测场景）
+        self._speculation_missed = False
+        # 最近一次确定的场景（current_scene 被置为未知后仍保留，用于预测下一个场景）
+        self._last_scene: Optional[str] = None
         scene_navigator.set_action_handler(self._execute_transition)
     
-    async def _execute_transition(self, transition: Transition, from_scene: Scene) -> bool:
-        """执行场景转移操作"""
+    async def _execute_transition(
+        self,
+        transition: Transition,
+        from_scene: Scene,
+        next_transition: Optional[Transition] = None,
+        performed: bool = False,
+    ) -> HopResult:
+        """
+        执行场景转移操作，并确认到达目标场景
+        
+        到达后立即返回；wait_after 是每轮确认的上限，超时时如果仍停留在原场景则重试操作，
+        ARRIVAL_ATTEMPTS 轮都无法确认则返回 FAILED（由调用方重新检测场景）。
+        
+        有下一跳时，确认到达的同时监视下一跳的模板，一出现就点击并返回 ADVANCED
+        
+        Args:
+            next_transition: 路径上的下一跳
+            performed: 操作已在上一跳提前执行，只需确认到达
+        """
         try:
-            if transition.scroll:
-                await self._scroll(transition.scroll, transition.scroll_distance)
-                await asyncio.sleep(0.3)
+            if not performed and not await self._perform_action(transition, from_scene):
+                return HopResult.FAILED
+            
+            # 操作前的画面，用于排除操作前就已可见的模板
+            before = self.adb.pipeline.latest
+            speculate = self._speculation_template(next_transition, before)
+            if speculate:
+                self.speculation_stats.attempts += 1
             
-            if transition.action == ActionType.CLICK:
-                if not transition.template:
-                    logger.error("CLICK 操作需要 template")
-                    return False
-                success = await self.click_template(transition.template)
+            for attempt in range(ARRIVAL_ATTEMPTS):
+                result = await self._wait_for_arrival(
+                    from_scene, transition.target, transition.wait_after, before, speculate
+                )
+                if result != HopResult.FAILED:
+                    scene_model.observe(from_scene.id, transition.target)
+                    self._last_scene = transition.target
+                    self.scroller.reset(transition.target)
+                    return result
                 
-            elif transition.action == ActionType.CLICK_TEXT:
-                if not transition.text:
-                    logger.error("CLICK_TEXT 操作需要 text")
-                    return False
-                success = await self._click_text(transition.text)
+                if attempt + 1 >= ARRIVAL_ATTEMPTS:
+                    break
                 
-            elif transition.action == ActionType.BACK:
-                if transition.template:
-                    success = await self.click_template(transition.template)
-                else:
-                    success = await self.press_back()
-                    
-            elif transition.action == ActionType.SWIPE:
-                await self._scroll(transition.scroll or "down", transition.scroll_distance)
-                success = True
-            else:
-                logger.error(f"未知操作类型: {transition.action}")
-                return False
-            
-            if success:
-                await asyncio.sleep(transition.wait_after)
+                # 仍停留在原场景说明操作没有生效，重试；否则可能是动画较慢，继续等待
+                # （只用原场景独有的模板判断，共用模板无法区分是否已离开）
+                latest = self.adb.pipeline.latest
+                target_templates = SCENES[transition.target].detect_templates
+                source_only = [t for t in from_scene.detect_templates if t not in target_templates]
+                if latest is not None and self._any_template_visible(latest, source_only, full=True):
+                    logger.info(f"仍停留在 {from_scene.name}，重试操作")
+                    if not await self._perform_action(transition, from_scene):
+                        break
             
-            return success
+            if performed:
+                self.speculation_stats.misses += 1
+                self._speculation_missed = True
+            logger.warning(f"未能确认到达: {SCENES[transition.target].name}")
+            return HopResult.FAILED
             
         except Exception as e:
             logger.error(f"执行转移失败: {e}")
-            return False
+            return HopResult.FAILED
     
-    async def click_template(self, template_name: str, timeout: float = 5.0, threshold: float = 0.7) -> bool:
-        """等待并点击模板"""
-        elapsed = 0
-        interval = 0.3
+    async def _perform_action(self, transition: Transition, from_scene: Scene) -> bool:
+        """执行转移对应的操作（不等待结果）"""
+        if transition.scroll and transition.action == ActionType.CLICK and transition.template:
+            # 目标在列表中需要滚动才能看到：边滚动边查找，找到后直接点击
+            result = await self.scroller.search(
+                from_scene.id,
+                transition.template,
+                transition.scroll,
+                step=transition.scroll_distance,
+            )
+            if not result:
+                return False
+            x, y, _ = result
+            await self.adb.tap(x, y)
+            logger.debug(f"点击模板: {transition.template} at ({x}, {y})")
+            return True
         
-        while elapsed < timeout:
-            screen = await self.adb.screencap_array()
-            result = image_matcher.match_template(screen, template_name, threshold=threshold)
+        if transition.scroll:
+            await self._scroll(transition.scroll, transition.scroll_distance)
+        
+        if transition.action == ActionType.CLICK:
+            if not transition.template:
+                logger.error("CLICK 操作需要 template")
+                return False
+            return await self.click_template(transition.template)
             
-            if result:
-                x, y, confidence = result
-                await self.adb.tap(x, y)
-                logger.debug(f"点击模板: {template_name} at ({x}, {y})")
-                return True
+        elif transition.action == ActionType.CLICK_TEXT:
+            if not transition.text:
+                logger.error("CLICK_TEXT 操作需要 text")
+                return False
+            return await self._click_text(transition.text)
             
-            await asyncio.sleep(interval)
-            elapsed += interval
+        elif transition.action == ActionType.BACK:
+            if transition.template:
+                # 返回按钮位置固定
+                return await self.click_template(transition.template, blind=True)
+            return await self.press_back()
+                
+        elif transition.action == ActionType.SWIPE:
+            await self._scroll(transition.scroll or "down", transition.scroll_distance)
+            return True
+        
+        logger.error(f"未知操作类型: {transition.action}")
+        return False
+    
+    @staticmethod
+    def _arrival_templates(from_id: str, to_id: str) -> tuple[list[str], list[str]]:
+        """
+        确认到达所用的模板
+        
+        Returns:
+            (positive, negative): positive 出现且 negative 都不出现才算到达。
+            两个场景共用的识别模板（如副本列表和副本详情都能看到副本图标）不能区分两者，
+            优先用目标场景独有的模板；没有时用目标模板 + 原场景独有模板的反向确认
+        """
+        source = SCENES[from_id].detect_templates
+        target = SCENES[to_id].detect_templates
+        exclusive = [t for t in target if t not in source]
+        if exclusive:
+            return exclusive, []
+        return list(target), [t for t in source if t not in target]
+    
+    def _any_template_visible(self, screen, templates: list[str], full: bool = False) -> bool:
+        for template in templates:
+            region = None if full else image_matcher.search_region(template)
+            if image_matcher.match_template(screen, template, threshold=0.7, region=region):
+                return True
+        return False
+    
+    def _speculation_template(
+        self,
+        next_transition: Optional[Transition],
+        before: Optional[Frame],
+    ) -> Optional[str]:
+        """
+        确认到达时可以同时监视的下一跳模板
+        
+        只有不需要滑动的模板点击可以提前执行；操作前的画面里已经能看到该模板时
+        （如多个页面共用的返回按钮），无法用它判断是否已到达，不做预判
+        """
+        if (next_transition is None
+                or next_transition.action not in (ActionType.CLICK, ActionType.BACK)
+                or not next_transition.template
+                or next_transition.scroll):
+            return None
+        
+        if before is None or image_matcher.match_template(before, next_transition.template, threshold=0.7):
+            return None
+        return next_transition.template
+    
+    async def _wait_for_arrival(
+        self,
+        from_scene: Scene,
+        to_id: str,
+        timeout: float,
+        before: Optional[Frame] = None,
+        speculate: Optional[str] = None,
+    ) -> HopResult:
+        """
+        等待确认已到达目标场景
+        
+        等待时只在模板上次出现的位置附近搜索，超时后再做一次全屏确认。
+        目标模板在操作前的画面（before）里就已可见时（如列表中的副本图标），
+        还要求画面相对操作前发生明显变化。
+        目标场景没有识别模板时无法确认，等待 timeout 后视为到达。
+        speculate 为下一跳的模板，出现即说明已到达，直接点击并返回 ADVANCED
+        """
+        positive, negative = self._arrival_templates(from_scene.id, to_id)
+        if not positive and not speculate:
+            await asyncio.sleep(timeout)
+            return HopResult.ARRIVED
+        
+        visible_before = before is not None and self._any_template_visible(before, positive, full=True)
+        
+        def conditions(full: bool) -> list[Condition]:
+            result: list[Condition] = []
+            if speculate:
+                region = None if full else image_matcher.search_region(speculate)
+                result.append(TemplateCondition(speculate, region=region, priority=1, name="speculate"))
+            if positive:
+                result.append(_ArrivalCondition(positive, negative, before if visible_before else None, full))
+            return result
+        
+        pipeline = self.adb.pipeline
+        result = await wait_for_any(pipeline, conditions(full=False), timeout, max_interval=ARRIVAL_POLL_INTERVAL)
+        if result is None:
+            # 超时前做一次全屏确认（模板可能不在上次出现的位置）
+            result = await wait_for_any(pipeline, conditions(full=True), 0)
+        if result is None:
+            return HopResult.FAILED if positive else HopResult.ARRIVED
+        
+        if result.name == "speculate":
+            await self.adb.tap(result.x, result.y)
+            self.speculation_stats.hits += 1
+            logger.debug(f"预判点击下一跳: {speculate} at ({result.x}, {result.y})")
+            return HopResult.ADVANCED
+        return HopResult.ARRIVED
+    
+    async def click_template(
+        self,
+        template_name: str,
+        timeout: float = 5.0,
+        threshold: float = 0.7,
+        blind: bool = False,
+    ) -> bool:
+        """
+        等待并点击模板
+        
+        Args:
+            blind: 按钮位置固定时允许盲点：同一位置多次匹配成功后直接点击缓存的坐标，
+                   点击效果在后台验证，未生效时作废缓存并在下次导航前重新检测场景
+        """
+        if blind and await self.tap_cache.tap(template_name, threshold=threshold):
+            return True
+        
+        result = await wait_for_any(
+            self.adb.pipeline,
+            [TemplateCondition(template_name, threshold=threshold)],
+            timeout,
+            max_interval=0.3,
+        )
+        if result:
+            await self.adb.tap(result.x, result.y)
+            self.tap_cache.observe(template_name, result.x, result.y)
+            logger.debug(f"点击模板: {template_name} at ({result.x}, {result.y})")
+            return True
         
         logger.warning(f"未找到模板: {template_name}")
         return False
@@ -100,111 +360,171 @@ class GameNavigator:
     
     async def _click_text(self, text: str, timeout: float = 5.0) -> bool:
         """点击文字"""
-        elapsed = 0
-        interval = 0.5
-        
-        while elapsed < timeout:
-            screen = await self.adb.screencap_array()
-            result = image_matcher.ocr_find_text(screen, text)
-            
-            if result:
-                x, y, confidence = result
-                await self.adb.tap(x, y)
-                logger.debug(f"点击文字: {text} at ({x}, {y})")
-                return True
-            
-            await asyncio.sleep(interval)
-            elapsed += interval
+        result = await wait_for_any(self.adb.pipeline, [TextCondition(text)], timeout, max_interval=0.5)
+        if result:
+            await self.adb.tap(result.x, result.y)
+            logger.debug(f"点击文字: {text} at ({result.x}, {result.y})")
+            return True
         
         logger.warning(f"未找到文字: {text}")
         return False
     
     async def _scroll(self, direction: str, distance: int = 500):
-        """滑动屏幕"""
-        screen = await self.adb.screencap_array()
-        h, w = screen.shape[:2]
-        
-        start_x = w // 2
-        start_y = h // 2
-        
-        if direction == "down":
-            end_y = start_y + distance
-        elif direction == "up":
-            end_y = start_y - distance
-        else:
-            logger.warning(f"未知滑动方向: {direction}")
-            return
-        
-        await self.adb.swipe(start_x, start_y, start_x, end_y, duration=300)
-        logger.debug(f"滑动: {direction} {distance}px")
-        await asyncio.sleep(0.5)
+        """滑动屏幕（等待列表停止滚动，并记录当前场景的滚动位置）"""
+        scene_id = scene_navigator.current_scene or self._last_scene or ""
+        await self.scroller.scroll(scene_id, direction, distance)
     
     async def press_back(self) -> bool:
         """按返回键"""
-        cmd = f'"{self.adb.adb_path}" -s {self.adb.device} shell input keyevent KEYCODE_BACK'
-        await self.adb._run_command(cmd)
+        await self.adb.keyevent("KEYCODE_BACK")
         logger.debug("按下返回键")
         return True
     
-    async def detect_current_scene(self) -> Optional[str]:
-        """检测当前场景"""
-        screen = await self.adb.screencap_array()
-        
-        # 优先检测底部导航栏
-        tab_scenes = ["home", "note", "character", "guild", "world"]
-        for scene_id in tab_scenes:
-            scene = SCENES.get(scene_id)
-            if scene:
-                for template in scene.detect_templates:
-                    if image_matcher.match_template(screen, template, threshold=0.7):
-                        logger.info(f"检测到场景: {scene.name}")
-                        scene_navigator.current_scene = scene_id
-                        return scene_id
-        
-        # 检测其他场景
-        for scene_id, scene in SCENES.items():
-            if scene_id in tab_scenes:
-                continue
-            
-            for template in scene.detect_templates:
+    def _detection_order(self, candidates: list[str]) -> list[str]:
+        """
+        场景检测顺序：
+        1. 指纹分类器的候选
+        2. 转移模型根据上一个场景预测的可能场景（按概率）
+        3. 底部导航栏场景，最后是其他场景
+        """
+        previous = scene_navigator.current_scene or self._last_scene
+        order = [scene_id for scene_id in candidates if scene_id in SCENES]
+        for scene_id in scene_model.rank(previous) + TAB_SCENES + list(SCENES.keys()):
+            if scene_id not in order and scene_id in SCENES:
+                order.append(scene_id)
+        return order
+    
+    def _confirm_scene(self, screen, order: list[str]) -> Optional[str]:
+        """按顺序用模板确认场景，全部失败后再用 OCR（OCR 最慢，放在最后）"""
+        for scene_id in order:
+            for template in SCENES[scene_id].detect_templates:
+                self.detection_stats.template_checks += 1
                 if image_matcher.match_template(screen, template, threshold=0.7):
-                    logger.info(f"检测到场景: {scene.name}")
-                    scene_navigator.current_scene = scene_id
-                    return scene_id
-            
-            for text in scene.detect_texts:
+                    return self._disambiguate(screen, scene_id, template, order)
+        
+        for scene_id in order:
+            for text in SCENES[scene_id].detect_texts:
+                self.detection_stats.ocr_checks += 1
                 if image_matcher.ocr_find_text(screen, text):
-                    logger.info(f"检测到场景: {scene.name}")
-                    scene_navigator.current_scene = scene_id
                     return scene_id
         
+        return None
+    
+    def _disambiguate(self, screen, scene_id: str, template: str, order: list[str]) -> str:
+        """
+        多个场景共用匹配到的模板时（如副本列表和副本详情都有副本图标），
+        选可见模板比例最高的场景，比例相同时选可见模板多的
+        """
+        sharing = [s for s in order if template in SCENES[s].detect_templates]
+        if len(sharing) <= 1:
+            return scene_id
+        
+        def score(candidate: str) -> tuple[float, int]:
+            templates = SCENES[candidate].detect_templates
+            visible = sum(
+                1 for t in templates
+                if image_matcher.match_template(screen, t, threshold=0.7)
+            )
+            return (visible / len(templates), visible)
+        
+        # 同一帧上的匹配结果有缓存，这里只会为未检查过的模板计算
+        return max(sharing, key=score)
+    
+    async def detect_current_scene(self, hint: Optional[str] = None) -> Optional[str]:
+        """检测当前场景（截取新的画面）"""
+        screen = await self.adb.capture()
+        return self.detect_scene(screen, hint)
+    
+    def detect_scene(self, screen: Frame, hint: Optional[str] = None) -> Optional[str]:
+        """
+        在指定画面上检测场景
+        
+        先用场景指纹索引一步定位，结果不明确时按候选顺序用模板 / OCR 确认，
+        确认成功的截图会加入索引，下次同样的画面可以一步识别
+        
+        Args:
+            hint: 很可能的场景（如检查点记录的场景），最先确认，其相邻场景随后
+        """
+        self.detection_stats.detections += 1
+        if hint in SCENES and scene_navigator.current_scene is None:
+            self._last_scene = hint
+        
+        classification = scene_classifier.classify(screen)
+        if classification and not classification.ambiguous and classification.scene_id in SCENES:
+            scene_id = classification.scene_id
+            logger.info(f"检测到场景: {SCENES[scene_id].name}（指纹距离 {classification.distance:.3f}）")
+            self._on_scene_detected(scene_id)
+            return scene_id
+        
+        candidates = classification.candidates if classification else []
+        if hint in SCENES:
+            candidates = [hint] + [c for c in candidates if c != hint]
+        scene_id = self._confirm_scene(screen, self._detection_order(candidates))
+        
+        if scene_id:
+            logger.info(f"检测到场景: {SCENES[scene_id].name}")
+            self._on_scene_detected(scene_id)
+            scene_classifier.record(scene_id, screen)
+            return scene_id
+        
         logger.warning("无法识别当前场景")
         scene_navigator.current_scene = None
         return None
     
+    def _on_scene_detected(self, scene_id: str):
+        """检测到场景后更新当前场景，并把这次转移计入转移模型（进入新场景时滚动位置清零）"""
+        previous = scene_navigator.current_scene or self._last_scene
+        if previous != scene_id:
+            scene_model.observe(previous, scene_id)
+            self.scroller.reset(scene_id)
+        scene_navigator.current_scene = scene_id
+        self._last_scene = scene_id
+    
     async def navigate_to(self, target_scene: str) -> bool:
-        """导航到目标场景"""
-        if scene_navigator.current_scene is None:
-            detected = await self.detect_current_scene()
-            if not detected:
-                logger.error("无法检测当前场景，尝试返回主界面")
-                for _ in range(5):
-                    await self.press_back()
-                    await asyncio.sleep(0.5)
-                    detected = await self.detect_current_scene()
-                    if detected:
-                        break
-                
-                if not detected:
-                    logger.error("无法确定当前场景")
-                    return False
+        """
+        导航到目标场景
+        
+        提前执行的下一跳操作未能到达时，重新检测场景并从检测结果重新规划一次
+        """
+        if not await self._ensure_scene_known():
+            return False
+        
+        self._speculation_missed = False
+        if await scene_navigator.navigate_to(target_scene):
+            return True
         
+        if not self._speculation_missed:
+            return False
+        
+        logger.info("预判执行未命中，重新检测场景")
+        self._speculation_missed = False
+        if not await self.detect_current_scene():
+            return False
         return await scene_navigator.navigate_to(target_scene)
     
+    async def _ensure_scene_known(self) -> bool:
+        """当前场景未知时检测场景，无法识别则交给恢复规划器"""
+        if scene_navigator.current_scene is not None:
+            return True
+        
+        if await self.detect_current_scene():
+            return True
+        
+        logger.warning("无法检测当前场景，尝试恢复")
+        if not await self.recovery.recover():
+            logger.error("无法确定当前场景")
+            return False
+        return True
+    
+    def _on_blind_tap_miss(self, template: str):
+        """盲点未生效：画面可能不在预期的场景，下次导航前重新检测"""
+        scene_navigator.current_scene = None
+
     def set_current_scene(self, scene_id: str):
         """手动设置当前场景"""
         if scene_id in SCENES:
             scene_navigator.current_scene = scene_id
+            self._last_scene = scene_id
             logger.info(f"设置当前场景: {SCENES[scene_id].name}")
         else:
             logger.warning(f"未知场景: {scene_id}")
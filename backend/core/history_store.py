@@ -0,0 +1,295 @@
+"""
+副本运行历史存储
+使用 SQLite（WAL 模式）保存每次副本运行的记录，跨会话保留
+
+- 写入：放入队列由后台写线程攒批提交（一个事务写一批），不阻塞事件循环
+- 明细查询：按 ID 倒序的游标分页，只走主键 / 索引
+- 聚合查询：运行结束时同步累加到按小时汇总的表，聚合只扫描汇总表，与明细行数无关
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from utils.storage import data_path
+
+logger = logging.getLogger("zat.history")
+
+HISTORY_FILE = "history.db"
+
+# 写线程拿到第一条写入后继续收集的时间（秒）和单批最大条数
+BATCH_WINDOW = 0.2
+MAX_BATCH = 500
+# flush 默认最长等待时间（秒）
+FLUSH_TIMEOUT = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    dungeon_id TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rank TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    duration REAL,
+    failure TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_dungeon ON runs (dungeon_id, id);
+
+CREATE TABLE IF NOT EXISTS runs_hourly (
+    hour INTEGER NOT NULL,
+    dungeon_id TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rank TEXT NOT NULL,
+    failure TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (hour, dungeon_id, difficulty, status, rank, failure)
+) WITHOUT ROWID;
+"""
+
+COLUMNS = ["id", "dungeon_id", "difficulty", "status", "rank", "started_at", "finished_at", "duration", "failure"]
+
+
+class HistoryStore:
+    """运行历史存储（start 时打开数据库和启动写线程，未调用时首次写入时启动）"""
+
+    def __init__(self, filename: str = HISTORY_FILE):
+        self._path = data_path(filename)
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._next_id = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """读连接（WAL 模式下读写互不阻塞；读连接在线程间共享，用锁串行化）"""
+        with self._lock:
+            if self._reader is None:
+                self._reader = self._connect()
+            yield self._reader
+
+    # ==================== 写入 ====================
+
+    def start(self):
+        """
+        打开数据库、启动写线程（阻塞，在事件循环中请用 asyncio.to_thread 调用）
+
+        上次进程退出时仍在运行的记录标记为失败并计入汇总，然后读取已有的最大 ID
+        """
+        with self._start_lock:
+            if self._writer is not None:
+                return
+            conn = self._connect()
+            with conn:
+                running = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM runs WHERE status = 'running'").fetchall()
+                for row in running:
+                    self._apply(conn, {**dict(row), "status": "failed", "failure": "进程退出"})
+            if running:
+                logger.info(f"上次退出时未结束的运行记为失败: {len(running)} 条")
+            self._next_id = conn.execute("SELECT MAX(id) FROM runs").fetchone()[0] or 0
+            self._writer = threading.Thread(target=self._write_loop, args=(conn,), name="history-writer", daemon=True)
+            self._writer.start()
+
+    def next_id(self) -> int:
+        """分配记录 ID（未调用 start 时在此启动，会阻塞读取已有的最大 ID）"""
+        if self._writer is None:
+            self.start()
+        self._next_id += 1
+        return self._next_id
+
+    def save(self, record: dict):
+        """
+        保存记录（异步写入）
+
+        同一 ID 第一次保存时插入，之后更新；记录从 running 变为结束状态时累加到小时汇总
+        """
+        if self._writer is None:
+            self.start()
+        self._queue.put({column: record.get(column) for column in COLUMNS})
+
+    def _write_loop(self, conn: sqlite3.Connection):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WINDOW
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            rows = [row for row in batch if row is not None]
+            try:
+                with conn:
+                    for row in rows:
+                        self._apply(conn, row)
+            except sqlite3.Error as e:
+                logger.error(f"写入运行历史失败（{len(rows)} 条）: {e}")
+
+            for _ in batch:
+                self._queue.task_done()
+            if len(rows) < len(batch):
+                conn.close()
+                return
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, row: dict):
+        current = conn.execute("SELECT status FROM runs WHERE id = ?", (row["id"],)).fetchone()
+        if current is None:
+            conn.execute(
+                f"INSERT INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [row[column] for column in COLUMNS],
+            )
+        elif current["status"] == "running":
+            conn.execute(
+                "UPDATE runs SET status = ?, rank = ?, finished_at = ?, duration = ?, failure = ? WHERE id = ?",
+                (row["status"], row["rank"], row["finished_at"], row["duration"], row["failure"], row["id"]),
+            )
+        else:
+            # 已结束的记录不再修改，避免重复计入汇总
+            return
+
+        if row["status"] != "running":
+            conn.execute(
+                """
+                INSERT INTO runs_hourly VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT (hour, dungeon_id, difficulty, status, rank, failure)
+                DO UPDATE SET runs = runs + 1, duration = duration + excluded.duration
+                """,
+                (
+                    int(row["started_at"] // 3600), row["dungeon_id"], row["difficulty"], row["status"],
+                    row["rank"] or "", row["failure"] or "", row["duration"] or 0.0,
+                ),
+            )
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """
+        等待已提交的写入全部完成（阻塞，在事件循环中请用 asyncio.to_thread 调用）
+
+        Returns:
+            是否全部写完；写线程已退出或超时返回 False
+        """
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if self._writer is None or not self._writer.is_alive() or remaining <= 0:
+                    logger.warning(f"运行历史未写完: 剩余 {self._queue.unfinished_tasks} 条")
+                    return False
+                self._queue.all_tasks_done.wait(min(remaining, 0.5))
+        return True
+
+    def close(self):
+        """写完剩余数据并关闭"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+        self._writer = None
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    # ==================== 查询（阻塞，在事件循环中请用 asyncio.to_thread 调用）====================
+
+    def recent(self, limit: int = 10, before_id: Optional[int] = None, dungeon_id: Optional[str] = None) -> list[dict]:
+        """
+        最近的记录（ID 倒序）
+
+        Args:
+            before_id: 游标，只返回 ID 小于该值的记录（上一页最后一条的 ID）
+            dungeon_id: 只返回该副本的记录
+        """
+        conditions, params = [], []
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        if dungeon_id is not None:
+            conditions.append("dungeon_id = ?")
+            params.append(dungeon_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._read() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM runs {where} ORDER BY id DESC LIMIT ?",
+                [*params, limit],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _aggregate(self, select: str, group_by: str, hours: Optional[int], dungeon_id: Optional[str], status: Optional[str] = None) -> list[sqlite3.Row]:
+        conditions, params = [], []
+        if hours is not None:
+            conditions.append("hour >= ?")
+            params.append(int(time.time() // 3600) - hours + 1)
+        if dungeon_id is not None:
+            conditions.append("dungeon_id = ?")
+            params.append(dungeon_id)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._read() as conn:
+            return conn.execute(f"SELECT {select} FROM runs_hourly {where} GROUP BY {group_by}", params).fetchall()
+
+    def runs_per_hour(self, hours: int = 24, dungeon_id: Optional[str] = None) -> list[dict]:
+        """最近 hours 小时每小时的运行次数（没有运行的小时不返回）"""
+        rows = self._aggregate(
+            "hour, SUM(runs) AS runs, "
+            "SUM(CASE WHEN status = 'completed' THEN runs ELSE 0 END) AS completed, "
+            "SUM(duration) AS duration",
+            "hour ORDER BY hour",
+            hours, dungeon_id,
+        )
+        return [
+            {
+                "hour": row["hour"] * 3600,
+                "runs": row["runs"],
+                "completed": row["completed"],
+                "failed": row["runs"] - row["completed"],
+                "avg_duration": round(row["duration"] / row["runs"], 1),
+            }
+            for row in rows
+        ]
+
+    def rank_distribution(self, hours: Optional[int] = None, dungeon_id: Optional[str] = None) -> dict[str, dict[str, int]]:
+        """副本 -> 评级 -> 完成次数"""
+        rows = self._aggregate(
+            "dungeon_id, rank, SUM(runs) AS runs", "dungeon_id, rank", hours, dungeon_id, "completed",
+        )
+        result: dict[str, dict[str, int]] = {}
+        for row in rows:
+            result.setdefault(row["dungeon_id"], {})[row["rank"] or "unknown"] = row["runs"]
+        return result
+
+    def failure_causes(self, hours: Optional[int] = None, dungeon_id: Optional[str] = None) -> dict[str, dict[str, int]]:
+        """副本 -> 失败原因 -> 次数"""
+        rows = self._aggregate(
+            "dungeon_id, failure, SUM(runs) AS runs", "dungeon_id, failure", hours, dungeon_id, "failed",
+        )
+        result: dict[str, dict[str, int]] = {}
+        for row in rows:
+            result.setdefault(row["dungeon_id"], {})[row["failure"] or "unknown"] = row["runs"]
+        return result
+
+
+# 全局实例
+history_store = HistoryStore()
@@ -4,10 +4,14 @@
 """
 import os
 import logging
-from typing import Optional, Tuple, List
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple, List, Union
 import numpy as np
 import cv2
 
+from core.frame import Frame, clip_region
+
 # 跳过模型源检查，加快启动速度
 os.environ["DISABLE_MODEL_SOURCE_CHECK"] = "True"
 
@@ -34,11 +38,31 @@ def get_ocr():
     return _ocr_instance
 
 
+@dataclass
+class MatcherStats:
+    """识别耗时统计（累计值，调用方按前后差值计算某段时间内的耗时）"""
+    matches: int = 0             # 模板匹配次数（不含帧缓存命中）
+    match_time: float = 0.0      # 模板匹配总耗时（秒）
+    ocr_calls: int = 0           # OCR 次数
+    ocr_time: float = 0.0        # OCR 总耗时（秒）
+
+    def to_dict(self) -> dict:
+        return {
+            "matches": self.matches,
+            "avg_match_ms": round(self.match_time / max(self.matches, 1) * 1000, 2),
+            "ocr_calls": self.ocr_calls,
+            "avg_ocr_ms": round(self.ocr_time / max(self.ocr_calls, 1) * 1000, 1),
+        }
+
+
 class ImageMatcher:
     """图像匹配器"""
     
     def __init__(self):
         self.templates: dict[str, np.ndarray] = {}
+        self.stats = MatcherStats()
+        # 模板最近一次匹配成功的中心位置，用于限定下一次的搜索区域
+        self._last_locations: dict[str, Tuple[int, int]] = {}
         self._load_templates()
     
     def _load_templates(self, directory: str = None, prefix: str = ""):
@@ -74,13 +98,13 @@ class ImageMatcher:
                     self.templates[template_name] = img
                     logger.info(f"已加载模板: {template_name}")
     
-    def match_template(
-        self,
-        screen: np.ndarray,
-        template_name: str,
-        threshold: float = 0.8,
-    ) -> Optional[Tuple[int, int, float]]:
-        """模板匹配"""
+    def _locate(self, screen: np.ndarray, template_name: str) -> Optional[Tuple[int, int, float]]:
+        """
+        在截图中寻找模板的最佳匹配位置（不做阈值判断）
+
+        Returns:
+            (center_x, center_y, confidence)，模板不存在或尺寸不合法时返回 None
+        """
         if template_name not in self.templates:
             logger.debug(f"模板不存在: {template_name}")
             return None
@@ -94,34 +118,88 @@ class ImageMatcher:
             logger.warning(f"模板 {template_name} ({tw}x{th}) 大于截图 ({sw}x{sh})，跳过匹配")
             return None
         
+        started = time.perf_counter()
         result = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
         _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        self.stats.matches += 1
+        self.stats.match_time += time.perf_counter() - started
+        
+        return (max_loc[0] + tw // 2, max_loc[1] + th // 2, float(max_val))
+    
+    def match_template(
+        self,
+        screen: Union[np.ndarray, Frame],
+        template_name: str,
+        threshold: float = 0.8,
+        region: Optional[Tuple[int, int, int, int]] = None,
+    ) -> Optional[Tuple[int, int, float]]:
+        """
+        模板匹配
+        
+        screen 为 Frame 时，同一帧上对同一模板（同一区域）的匹配只计算一次（不同阈值共享结果）
         
+        Args:
+            region: 搜索区域 (x, y, w, h)，可选，超出屏幕的部分会被截断，返回的坐标仍为全屏坐标
+        """
+        if region is not None:
+            region = clip_region(region, screen.shape[1], screen.shape[0])
+        if isinstance(screen, Frame):
+            key = ("match", template_name, region)
+            best = screen.cached(key, lambda: self._locate_in(screen.image, template_name, region))
+        else:
+            best = self._locate_in(screen, template_name, region)
+        
+        if best is None:
+            return None
+        
+        center_x, center_y, max_val = best
         if max_val >= threshold:
-            center_x = max_loc[0] + tw // 2
-            center_y = max_loc[1] + th // 2
             logger.debug(f"模板匹配成功: {template_name}, 置信度: {max_val:.3f}, 位置: ({center_x}, {center_y})")
-            return (center_x, center_y, max_val)
+            self._last_locations[template_name] = (center_x, center_y)
+            return best
         return None
     
-    def ocr_find_text(
+    def _locate_in(
         self,
         screen: np.ndarray,
-        target_text: str,
+        template_name: str,
         region: Optional[Tuple[int, int, int, int]] = None,
-        confidence_threshold: float = 0.5
     ) -> Optional[Tuple[int, int, float]]:
-        """
-        使用 OCR 查找指定文字的位置
+        """在指定区域内寻找模板，返回全屏坐标"""
+        if region is None:
+            return self._locate(screen, template_name)
         
-        Args:
-            screen: 屏幕截图 (BGR)
-            target_text: 要查找的文字（支持部分匹配）
-            region: 搜索区域 (x, y, w, h)，可选，限制搜索范围提高速度
-            confidence_threshold: 置信度阈值
+        x, y, w, h = region
+        best = self._locate(screen[y:y+h, x:x+w], template_name)
+        if best is None:
+            return None
+        return (best[0] + x, best[1] + y, best[2])
+    
+    def search_region(self, template_name: str, padding: int = 40) -> Optional[Tuple[int, int, int, int]]:
+        """
+        模板上次出现位置周围的搜索区域
         
         Returns:
-            找到返回 (center_x, center_y, confidence)，否则返回 None
+            (x, y, w, h)，模板从未匹配成功过时返回 None
+        """
+        location = self._last_locations.get(template_name)
+        template = self.templates.get(template_name)
+        if location is None or template is None:
+            return None
+        
+        th, tw = template.shape[:2]
+        cx, cy = location
+        return (cx - tw // 2 - padding, cy - th // 2 - padding, tw + 2 * padding, th + 2 * padding)
+    
+    def _ocr_predict(
+        self,
+        screen: np.ndarray,
+        region: Optional[Tuple[int, int, int, int]] = None
+    ) -> List[Tuple[str, float, Tuple[int, int]]]:
+        """
+        执行 OCR 并返回全部识别结果（坐标已换算为全屏坐标）
+        
+        没有文字框坐标时，使用识别区域的中心点
         """
         ocr = get_ocr()
         
@@ -133,11 +211,15 @@ class ImageMatcher:
             offset_x, offset_y = x, y
         
         # 执行 OCR (PaddleOCR 3.x 使用 predict 方法)
+        started = time.perf_counter()
         result = ocr.predict(screen)
+        self.stats.ocr_calls += 1
+        self.stats.ocr_time += time.perf_counter() - started
         
+        texts_list = []
         if not result:
             logger.debug("OCR 返回空结果")
-            return None
+            return texts_list
         
         # PaddleOCR 3.x 返回格式: [{'rec_texts': [...], 'rec_scores': [...], 'rec_polys': [...]}]
         for item in result:
@@ -150,29 +232,64 @@ class ImageMatcher:
             for i, text in enumerate(texts):
                 confidence = scores[i] if i < len(scores) else 0
                 
-                # 检查是否包含目标文字
-                if target_text in text and confidence >= confidence_threshold:
-                    # 计算文字框中心点
-                    if i < len(polys) and len(polys[i]) >= 4:
-                        poly = polys[i]
-                        x_coords = [p[0] for p in poly]
-                        y_coords = [p[1] for p in poly]
-                        center_x = int(sum(x_coords) / len(x_coords)) + offset_x
-                        center_y = int(sum(y_coords) / len(y_coords)) + offset_y
-                    else:
-                        # 如果没有坐标，返回图片中心
-                        h, w = screen.shape[:2]
-                        center_x = w // 2 + offset_x
-                        center_y = h // 2 + offset_y
-                    
-                    logger.info(f"OCR 找到文字: '{text}', 置信度: {confidence:.3f}, 位置: ({center_x}, {center_y})")
-                    return (center_x, center_y, confidence)
+                # 计算文字框中心点
+                if i < len(polys) and len(polys[i]) >= 4:
+                    poly = polys[i]
+                    x_coords = [p[0] for p in poly]
+                    y_coords = [p[1] for p in poly]
+                    center_x = int(sum(x_coords) / len(x_coords)) + offset_x
+                    center_y = int(sum(y_coords) / len(y_coords)) + offset_y
+                else:
+                    # 如果没有坐标，使用图片中心
+                    h, w = screen.shape[:2]
+                    center_x = w // 2 + offset_x
+                    center_y = h // 2 + offset_y
+                
+                texts_list.append((text, confidence, (center_x, center_y)))
+        
+        return texts_list
+    
+    def _ocr_results(
+        self,
+        screen: Union[np.ndarray, Frame],
+        region: Optional[Tuple[int, int, int, int]] = None
+    ) -> List[Tuple[str, float, Tuple[int, int]]]:
+        """获取 OCR 结果，Frame 上同一区域只识别一次"""
+        if isinstance(screen, Frame):
+            image = screen.image
+            return screen.cached(("ocr", region), lambda: self._ocr_predict(image, region))
+        return self._ocr_predict(screen, region)
+    
+    def ocr_find_text(
+        self,
+        screen: Union[np.ndarray, Frame],
+        target_text: str,
+        region: Optional[Tuple[int, int, int, int]] = None,
+        confidence_threshold: float = 0.5
+    ) -> Optional[Tuple[int, int, float]]:
+        """
+        使用 OCR 查找指定文字的位置
+        
+        Args:
+            screen: 屏幕截图 (BGR) 或 Frame
+            target_text: 要查找的文字（支持部分匹配）
+            region: 搜索区域 (x, y, w, h)，可选，限制搜索范围提高速度
+            confidence_threshold: 置信度阈值
+        
+        Returns:
+            找到返回 (center_x, center_y, confidence)，否则返回 None
+        """
+        for text, confidence, (center_x, center_y) in self._ocr_results(screen, region):
+            # 检查是否包含目标文字
+            if target_text in text and confidence >= confidence_threshold:
+                logger.info(f"OCR 找到文字: '{text}', 置信度: {confidence:.3f}, 位置: ({center_x}, {center_y})")
+                return (center_x, center_y, confidence)
         
         return None
     
     def ocr_get_all_text(
         self,
-        screen: np.ndarray,
+        screen: Union[np.ndarray, Frame],
         region: Optional[Tuple[int, int, int, int]] = None
     ) -> List[Tuple[str, float, Tuple[int, int]]]:
         """
@@ -181,38 +298,7 @@ class ImageMatcher:
         Returns:
             列表 [(text, confidence, (center_x, center_y)), ...]
         """
-        ocr = get_ocr()
-        
-        offset_x, offset_y = 0, 0
-        if region:
-            x, y, w, h = region
-            screen = screen[y:y+h, x:x+w]
-            offset_x, offset_y = x, y
-        
-        result = ocr.predict(screen)
-        
-        texts_list = []
-        if result:
-            for item in result:
-                texts = item.get('rec_texts', [])
-                scores = item.get('rec_scores', [])
-                polys = item.get('rec_polys', [])
-                
-                for i, text in enumerate(texts):
-                    confidence = scores[i] if i < len(scores) else 0
-                    
-                    if i < len(polys) and len(polys[i]) >= 4:
-                        poly = polys[i]
-                        x_coords = [p[0] for p in poly]
-                        y_coords = [p[1] for p in poly]
-                        center_x = int(sum(x_coords) / len(x_coords)) + offset_x
-                        center_y = int(sum(y_coords) / len(y_coords)) + offset_y
-                    else:
-                        center_x, center_y = 0, 0
-                    
-                    texts_list.append((text, confidence, (center_x, center_y)))
-        
-        return texts_list
+        return list(self._ocr_results(screen, region))
 
 
 # 全局实例
@@ -0,0 +1,187 @@
+"""
+后台任务管理
+长时间运行的操作（如循环刷副本）作为后台任务执行，提交后立即返回任务 ID，
+通过 ID 查询状态或取消，进度事件推送给所有订阅者（WebSocket）
+"""
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger("zat.jobs")
+
+# 保留最近多少个已结束的任务
+MAX_FINISHED = 50
+# 每个订阅者最多缓存的事件数，超出时丢弃最旧的（客户端接收慢不影响任务执行）
+SUBSCRIBER_QUEUE_SIZE = 100
+# 请求取消后等待任务自行结束的时间（秒），超时后强制取消
+CANCEL_GRACE = 10.0
+
+
+class JobStatus(str, Enum):
+    """任务状态"""
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class Job:
+    """后台任务"""
+    id: str
+    kind: str
+    params: dict
+    status: JobStatus = JobStatus.RUNNING
+    created: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    finished: Optional[str] = None
+    progress: dict = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+
+    @property
+    def done(self) -> bool:
+        return self.status != JobStatus.RUNNING
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status.value,
+            "created": self.created,
+            "finished": self.finished,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+        }
+
+
+# 任务函数：接收 Job（用于汇报进度），返回可 JSON 序列化的结果
+JobFunc = Callable[[Job], Awaitable[Any]]
+
+
+class JobManager:
+    """后台任务管理器"""
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        # 任务 ID -> 请求取消时调用的函数（让任务在检查点自行结束）
+        self._stoppers: dict[str, Callable[[], None]] = {}
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def submit(self, kind: str, params: dict, func: JobFunc, stop: Optional[Callable[[], None]] = None) -> Job:
+        """
+        提交任务（立即返回，任务在后台执行）
+
+        Args:
+            kind: 任务类型
+            params: 任务参数（仅用于展示）
+            func: 任务函数
+            stop: 请求取消时调用的函数，None 表示直接取消协程
+        """
+        job = Job(id=uuid.uuid4().hex[:12], kind=kind, params=params)
+        self._jobs[job.id] = job
+        if stop:
+            self._stoppers[job.id] = stop
+        self._tasks[job.id] = asyncio.create_task(self._run(job, func))
+        logger.info(f"提交任务: {kind} ({job.id})")
+        self._publish("created", job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        """所有任务（最新的在前）"""
+        return list(reversed(self._jobs.values()))
+
+    def active(self, kind: Optional[str] = None) -> list[Job]:
+        """正在运行的任务"""
+        return [job for job in self._jobs.values() if not job.done and (kind is None or job.kind == kind)]
+
+    def report(self, job: Job, **progress):
+        """任务函数汇报进度（合并到 job.progress 并推送事件）"""
+        job.progress.update(progress)
+        self._publish("progress", job)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        请求取消任务
+
+        有 stop 函数时先让任务在检查点自行结束，CANCEL_GRACE 秒后仍未结束再强制取消
+        """
+        job = self._jobs.get(job_id)
+        task = self._tasks.get(job_id)
+        if job is None or job.done or task is None:
+            return False
+
+        job.cancel_requested = True
+        stop = self._stoppers.get(job_id)
+        if stop is None:
+            task.cancel()
+        else:
+            stop()
+            asyncio.get_running_loop().call_later(CANCEL_GRACE, lambda: task.done() or task.cancel())
+        logger.info(f"请求取消任务: {job.kind} ({job_id})")
+        self._publish("cancelling", job)
+        return True
+
+    async def shutdown(self):
+        """取消所有运行中的任务并等待结束"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: Job, func: JobFunc):
+        self._publish("started", job)
+        try:
+            job.result = await func(job)
+            job.status = JobStatus.CANCELLED if job.cancel_requested else JobStatus.COMPLETED
+        except asyncio.CancelledError:
+            job.status = JobStatus.CANCELLED
+        except Exception as e:
+            logger.error(f"任务失败: {job.kind} ({job.id}): {e}")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished = datetime.now().isoformat(timespec="seconds")
+            self._tasks.pop(job.id, None)
+            self._stoppers.pop(job.id, None)
+            self._prune()
+            logger.info(f"任务结束: {job.kind} ({job.id}) - {job.status.value}")
+            self._publish("finished", job)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:-MAX_FINISHED]:
+            del self._jobs[job_id]
+
+    # ==================== 事件订阅 ====================
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: str, job: Job):
+        message = {"type": "job", "event": event, "job": job.to_dict()}
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+# 全局实例
+job_manager = JobManager()
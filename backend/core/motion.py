@@ -0,0 +1,158 @@
+"""
+画面活动估计
+用相邻两帧缩略图的差异估计画面活动程度，把画面分为战斗进行中 / 静止 / 场景切换三种状态，
+供战斗循环决定是否运行模板匹配等开销较大的识别，并在画面长时间静止时报告停滞
+"""
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from core.frame import Frame, Region
+from core.frame_waiter import Condition, Match, frame_change
+
+logger = logging.getLogger("zat.motion")
+
+# 战斗区域（相对屏幕的比例 x, y, w, h），避开顶部和底部的 HUD（计时器等变化不代表战斗在进行）
+FIELD_REGION = (0.0, 0.2, 1.0, 0.6)
+# 全屏差异超过该值视为场景切换（淡入淡出、加载、切换到结算界面）
+TRANSITION_THRESHOLD = 0.12
+# 战斗区域活动量（平滑后）超过该值视为战斗进行中
+COMBAT_THRESHOLD = 0.02
+# 活动量平滑系数，越大越偏向最近一帧
+ENERGY_ALPHA = 0.5
+# 战斗进行中跳过识别时，至少每隔该时间（秒）仍然识别一次，避免结算界面的动画导致一直跳过
+FORCE_CHECK_INTERVAL = 5.0
+
+
+class MotionState(str, Enum):
+    """画面状态"""
+    COMBAT = "combat"            # 战斗进行中（战斗区域持续变化）
+    STATIC = "static"            # 静止 / 等待
+    TRANSITION = "transition"    # 场景切换
+
+
+@dataclass
+class MotionStats:
+    """画面活动统计"""
+    frames: int = 0              # 估计过的帧数
+    combat: int = 0              # 各状态的帧数
+    static: int = 0
+    transition: int = 0
+    skipped: int = 0             # 被跳过识别的帧数
+    stalls: int = 0              # 停滞次数
+
+    def to_dict(self) -> dict:
+        return {
+            "frames": self.frames,
+            "combat": self.combat,
+            "static": self.static,
+            "transition": self.transition,
+            "skipped": self.skipped,
+            "stalls": self.stalls,
+        }
+
+
+class MotionEstimator:
+    """画面活动估计器（按帧的截图时刻去重，同一帧只估计一次）"""
+
+    def __init__(self):
+        self.stats = MotionStats()
+        self.state = MotionState.STATIC
+        self.energy = 0.0
+        self._previous: Optional[Frame] = None
+        self._static_since: Optional[float] = None
+
+    def reset(self):
+        self.state = MotionState.STATIC
+        self.energy = 0.0
+        self._previous = None
+        self._static_since = None
+
+    @staticmethod
+    def _field(frame: Frame) -> Region:
+        rx, ry, rw, rh = FIELD_REGION
+        return (int(rx * frame.width), int(ry * frame.height), int(rw * frame.width), int(rh * frame.height))
+
+    def update(self, frame: Frame) -> MotionState:
+        """用新的一帧更新状态"""
+        previous = self._previous
+        if previous is not None and frame.timestamp <= previous.timestamp:
+            return self.state
+        self._previous = frame
+        if previous is None:
+            self._static_since = frame.timestamp
+            return self.state
+
+        if frame_change(previous, frame) >= TRANSITION_THRESHOLD:
+            state = MotionState.TRANSITION
+        else:
+            change = frame_change(previous, frame, self._field(frame))
+            self.energy += ENERGY_ALPHA * (change - self.energy)
+            state = MotionState.COMBAT if self.energy >= COMBAT_THRESHOLD else MotionState.STATIC
+
+        if state == MotionState.STATIC:
+            if self.state != MotionState.STATIC:
+                self._static_since = frame.timestamp
+        else:
+            self._static_since = None
+
+        if state != self.state:
+            logger.debug(f"画面状态: {state.value} (活动量 {self.energy:.3f})")
+        self.state = state
+        self.stats.frames += 1
+        setattr(self.stats, state.value, getattr(self.stats, state.value) + 1)
+        return state
+
+    def static_for(self, now: float) -> float:
+        """画面已持续静止的时长（秒），不是静止状态时为 0"""
+        if self.state != MotionState.STATIC or self._static_since is None:
+            return 0.0
+        return now - self._static_since
+
+
+class MotionGate:
+    """
+    识别闸门：战斗进行中和场景切换时跳过识别，静止画面才运行
+
+    enabled 为 False 时不跳过（如匹配阶段、接近预计结束时），但仍会更新画面状态
+    """
+
+    def __init__(self, estimator: MotionEstimator, force_interval: float = FORCE_CHECK_INTERVAL):
+        self.estimator = estimator
+        self.force_interval = force_interval
+        self.enabled = False
+        self._last_check = 0.0
+
+    def reset(self):
+        self.enabled = False
+        self._last_check = 0.0
+
+    def allow(self, frame: Frame) -> bool:
+        """是否在这一帧上运行识别（同一帧只判定一次）"""
+        return frame.cached(("motion_gate", id(self)), lambda: self._decide(frame))
+
+    def _decide(self, frame: Frame) -> bool:
+        state = self.estimator.update(frame)
+        if not self.enabled or state == MotionState.STATIC or frame.timestamp - self._last_check >= self.force_interval:
+            self._last_check = frame.timestamp
+            return True
+        self.estimator.stats.skipped += 1
+        return False
+
+
+class GatedCondition(Condition):
+    """受识别闸门控制的条件"""
+
+    def __init__(self, inner: Condition, gate: MotionGate):
+        super().__init__(inner.name, inner.priority)
+        self.inner = inner
+        self.gate = gate
+
+    def reset(self):
+        self.inner.reset()
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        if not self.gate.allow(frame):
+            return None
+        return self.inner.check(frame)
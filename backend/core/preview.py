@@ -0,0 +1,151 @@
+"""
+截图预览编码
+将 Frame 裁剪、缩放并编码为 JPEG/WebP，供调试页面预览使用
+
+编码函数是同步的 CPU 密集操作，调用方应通过 asyncio.to_thread 放到工作线程执行
+"""
+from dataclasses import dataclass
+from typing import Optional
+import cv2
+
+from core.frame import Frame, Region
+
+# 支持的编码格式: 格式名 -> (扩展名, 质量参数, MIME 类型)
+PREVIEW_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+
+def parse_roi(roi: Optional[str]) -> Optional[Region]:
+    """
+    解析 ROI 参数
+
+    Args:
+        roi: "x,y,w,h" 格式的字符串
+
+    Raises:
+        ValueError: 格式不正确或宽高不为正
+    """
+    if not roi:
+        return None
+
+    parts = [int(p) for p in roi.split(",")]
+    if len(parts) != 4:
+        raise ValueError(f"ROI 格式应为 x,y,w,h: {roi}")
+
+    x, y, w, h = parts
+    if w <= 0 or h <= 0:
+        raise ValueError(f"ROI 宽高必须为正: {roi}")
+    return (x, y, w, h)
+
+
+def clip_roi(frame: Frame, roi: Optional[Region]) -> Optional[Region]:
+    """
+    将 ROI 截断到画面范围内
+
+    Raises:
+        ValueError: ROI 与画面没有重叠
+    """
+    if roi is None:
+        return None
+    x, y, w, h = frame.clip_region(roi)
+    if w <= 0 or h <= 0:
+        raise ValueError(f"ROI 超出画面范围 ({frame.width}x{frame.height}): {roi}")
+    return (x, y, w, h)
+
+
+def preview_etag(
+    frame: Frame,
+    fmt: str = "jpeg",
+    quality: int = 65,
+    scale: float = 1.0,
+    roi: Optional[Region] = None,
+    gray: bool = False,
+) -> str:
+    """根据帧内容摘要和编码参数生成 ETag（画面不变且参数相同则 ETag 不变）"""
+    roi_str = "full" if roi is None else "_".join(map(str, roi))
+    return f'"{frame.digest}-{fmt}-{quality}-{scale:g}-{roi_str}-{int(gray)}"'
+
+
+def encode_preview(
+    frame: Frame,
+    fmt: str = "jpeg",
+    quality: int = 65,
+    scale: float = 1.0,
+    roi: Optional[Region] = None,
+    gray: bool = False,
+) -> bytes:
+    """
+    编码预览图
+
+    Args:
+        frame: 截图帧
+        fmt: 编码格式 (jpeg, webp)
+        quality: 编码质量 (1-100)
+        scale: 缩放比例 (0, 1]
+        roi: 裁剪区域 (x, y, w, h)，先裁剪后缩放
+        gray: 是否输出灰度图
+
+    Returns:
+        编码后的图像字节
+    """
+    ext, quality_flag, _ = PREVIEW_FORMATS[fmt]
+
+    if roi is not None:
+        img = frame.crop(roi, gray=gray)
+    else:
+        img = frame.gray if gray else frame.image
+
+    if scale < 1.0:
+        h, w = img.shape[:2]
+        size = (max(int(w * scale), 1), max(int(h * scale), 1))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+    ok, buffer = cv2.imencode(ext, img, [quality_flag, quality])
+    if not ok:
+        raise ValueError(f"编码预览图失败: {fmt}")
+    return buffer.tobytes()
+
+
+@dataclass
+class PreviewConfig:
+    """实时预览配置（由客户端通过 WebSocket 设置）"""
+    fps: float = 2.0
+    fmt: str = "jpeg"
+    quality: int = 60
+    scale: float = 0.5
+    roi: Optional[Region] = None
+    gray: bool = False
+
+    # 帧率上限，避免预览占用过多带宽和编码时间
+    MAX_FPS = 30.0
+
+    def update(self, message: dict):
+        """
+        根据客户端消息更新配置，非法值会被忽略或截断到合法范围
+
+        消息格式: {"fps": 5, "format": "webp", "quality": 60, "scale": 0.5, "roi": "x,y,w,h", "gray": false}
+        """
+        if "fps" in message:
+            self.fps = min(max(float(message["fps"]), 0.1), self.MAX_FPS)
+        if message.get("format") in PREVIEW_FORMATS:
+            self.fmt = message["format"]
+        if "quality" in message:
+            self.quality = min(max(int(message["quality"]), 1), 100)
+        if "scale" in message:
+            self.scale = min(max(float(message["scale"]), 0.05), 1.0)
+        if "roi" in message:
+            try:
+                self.roi = parse_roi(message["roi"])
+            except ValueError:
+                pass
+        if "gray" in message:
+            self.gray = bool(message["gray"])
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.fps
+
+    def encode_params(self) -> dict:
+        return dict(fmt=self.fmt, quality=self.quality, scale=self.scale, roi=self.roi, gray=self.gray)
@@ -0,0 +1,192 @@
+"""
+异常恢复
+先识别当前画面（已知弹窗 / 场景），已知场景沿路由表的最短路径回到安全的锚点场景，
+只有无法识别的画面才按返回键，避免盲目连按返回键误触退出游戏等弹窗
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, TYPE_CHECKING
+
+from core.frame import Frame
+from core.frame_waiter import wait_for_any, RoiChangeCondition, TemplateGoneCondition
+from core.image_matcher import image_matcher
+from core.scene_graph import scene_navigator, get_route_table, SCENES
+
+if TYPE_CHECKING:
+    from core.game_navigator import GameNavigator
+
+logger = logging.getLogger("zat.recovery")
+
+
+@dataclass
+class Popup:
+    """弹窗定义"""
+    id: str
+    name: str
+    detect_template: str                 # 用于识别弹窗的模板
+    dismiss_template: str                # 关闭弹窗要点击的按钮
+    threshold: float = 0.7
+
+
+# 已知弹窗（按检测顺序）
+POPUPS = [
+    Popup(
+        id="skip_reward",
+        name="未领取奖励确认",
+        detect_template="daily_dungeon/confirm_skip_reward",
+        dismiss_template="daily_dungeon/confirm",
+        threshold=0.6,
+    ),
+    Popup(
+        id="invite",
+        name="邀请",
+        detect_template="reject",
+        dismiss_template="reject",
+    ),
+]
+
+# 恢复最多执行的步数（每步处理一个弹窗、一次导航或一次返回键）
+MAX_STEPS = 10
+# 无法识别画面时最多按返回键的次数
+MAX_BACK_PRESSES = 5
+# 按返回键 / 关闭弹窗后等待画面变化的最长时间（秒）
+SETTLE_TIMEOUT = 1.5
+
+
+@dataclass
+class RecoveryStats:
+    """恢复统计"""
+    attempts: int = 0            # 恢复次数
+    recovered: int = 0           # 成功恢复次数
+    popups_dismissed: int = 0    # 关闭的弹窗数
+    back_presses: int = 0        # 按返回键次数
+    total_time: float = 0.0      # 恢复总耗时（秒）
+    last_time: float = 0.0       # 最近一次恢复耗时（秒）
+    max_time: float = 0.0        # 最长恢复耗时（秒）
+
+    def record(self, duration: float, success: bool):
+        self.attempts += 1
+        if success:
+            self.recovered += 1
+        self.total_time += duration
+        self.last_time = duration
+        self.max_time = max(self.max_time, duration)
+
+    def to_dict(self) -> dict:
+        attempts = max(self.attempts, 1)
+        return {
+            "attempts": self.attempts,
+            "recovered": self.recovered,
+            "popups_dismissed": self.popups_dismissed,
+            "back_presses": self.back_presses,
+            "avg_time_ms": round(self.total_time / attempts * 1000, 1),
+            "last_time_ms": round(self.last_time * 1000, 1),
+            "max_time_ms": round(self.max_time * 1000, 1),
+        }
+
+
+class RecoveryPlanner:
+    """恢复规划器"""
+
+    def __init__(self, navigator: "GameNavigator"):
+        self.navigator = navigator
+        self.stats = RecoveryStats()
+
+    async def recover(self, anchors: Optional[list[str]] = None) -> Optional[str]:
+        """
+        恢复到已知的安全场景
+
+        Args:
+            anchors: 锚点场景，恢复到其中路径最短的一个；None 表示识别出任意已知场景即可
+
+        Returns:
+            恢复后所在的场景，失败返回 None
+        """
+        logger.info("开始恢复...")
+        started = time.monotonic()
+        scene_id = None
+        try:
+            scene_id = await self._recover(anchors)
+            return scene_id
+        finally:
+            duration = time.monotonic() - started
+            self.stats.record(duration, scene_id is not None)
+            if scene_id:
+                logger.info(f"已恢复到: {SCENES[scene_id].name}（{duration:.2f}s）")
+            else:
+                logger.error(f"恢复失败（{duration:.2f}s）")
+
+    async def _recover(self, anchors: Optional[list[str]]) -> Optional[str]:
+        pipeline = self.navigator.adb.pipeline
+        back_presses = 0
+
+        for _ in range(MAX_STEPS):
+            # 恢复前的画面可能已经过期，每一步都使用新的截图
+            screen = await pipeline.next_frame(after=time.monotonic())
+
+            # 1. 弹窗会遮挡场景，优先处理
+            popup = self._find_popup(screen)
+            if popup:
+                await self._dismiss(popup, screen)
+                continue
+
+            # 2. 已知场景：沿最短路径回到锚点
+            scene_id = self.navigator.detect_scene(screen)
+            if scene_id:
+                anchor = self._nearest_anchor(scene_id, anchors)
+                if anchor is None:
+                    logger.warning(f"{SCENES[scene_id].name} 无法到达任何锚点场景")
+                    return None
+                if anchor == scene_id or await scene_navigator.navigate_to(anchor):
+                    return anchor
+                # 导航失败时当前场景已标记为未知，下一步重新识别
+                continue
+
+            # 3. 无法识别的画面：按返回键
+            if back_presses >= MAX_BACK_PRESSES:
+                break
+            back_presses += 1
+            self.stats.back_presses += 1
+            await self.navigator.press_back()
+            await wait_for_any(pipeline, [RoiChangeCondition(baseline=screen)], SETTLE_TIMEOUT)
+
+        return None
+
+    def _find_popup(self, screen: Frame) -> Optional[Popup]:
+        for popup in POPUPS:
+            if image_matcher.match_template(screen, popup.detect_template, threshold=popup.threshold):
+                return popup
+        return None
+
+    async def _dismiss(self, popup: Popup, screen: Frame):
+        """点击弹窗按钮并等待弹窗消失，找不到按钮时按返回键"""
+        logger.info(f"关闭弹窗: {popup.name}")
+        self.stats.popups_dismissed += 1
+
+        button = image_matcher.match_template(screen, popup.dismiss_template, threshold=popup.threshold)
+        if button:
+            x, y, _ = button
+            await self.navigator.adb.tap(x, y)
+        else:
+            await self.navigator.press_back()
+
+        await wait_for_any(
+            self.navigator.adb.pipeline,
+            [TemplateGoneCondition(popup.detect_template, threshold=popup.threshold)],
+            SETTLE_TIMEOUT,
+        )
+
+    @staticmethod
+    def _nearest_anchor(scene_id: str, anchors: Optional[list[str]]) -> Optional[str]:
+        """路由表中期望耗时最短的锚点场景"""
+        if anchors is None or scene_id in anchors:
+            return scene_id
+
+        table = get_route_table()
+        best, best_cost = None, float("inf")
+        for anchor in anchors:
+            path = table.path(scene_id, anchor)
+            if path and table.cost(path) < best_cost:
+                best, best_cost = anchor, table.cost(path)
+        return best
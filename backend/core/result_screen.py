@@ -0,0 +1,252 @@
+"""
+结算界面解析
+一帧内完成结算界面的全部识别：评级徽章、退出按钮，以及退出后是否会弹出跳过奖励确认
+
+评级徽章的位置是固定的：第一次全屏匹配成功后记住徽章区域，之后只裁剪该区域，
+与所有评级模板的缩略图做一次多类比较（一次矩阵乘法得到全部相关系数），不再逐个全屏匹配
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import cv2
+
+from core.frame import Frame, Region
+from core.frame_waiter import Condition, Match
+from core.image_matcher import image_matcher
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.result")
+
+RESULT_FILE = "result_screen.json"
+
+# 评级模板
+RANK_TEMPLATES = {
+    "S": "daily_dungeon/level/s",
+    "A": "daily_dungeon/level/a",
+    "B": "daily_dungeon/level/b",
+    "C": "daily_dungeon/level/c",
+}
+EXIT_TEMPLATE = "back"
+SKIP_REWARD_POPUP = "daily_dungeon/confirm_skip_reward"
+
+# 全屏匹配评级模板的阈值（学习徽章区域前使用）
+RANK_THRESHOLD = 0.7
+# 徽章缩略图尺寸 (w, h)：在缩略灰度图上比较，容忍几个像素的位置偏差
+BADGE_SIZE = (24, 24)
+# 徽章区域与模板缩略图的相关系数阈值
+BADGE_THRESHOLD = 0.8
+# 学习到徽章区域后，每检查多少帧做一次全屏匹配兜底（分辨率或界面布局变化时重新学习）
+FULL_SCAN_EVERY = 10
+# 跳过奖励弹窗的出现概率不低于该值时预测会出现
+SKIP_REWARD_LIKELY = 0.5
+
+
+def _badge_vector(image: np.ndarray) -> np.ndarray:
+    """徽章缩略图（零均值、单位长度），两个向量的点积即为相关系数"""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    vector = cv2.resize(image, BADGE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 1e-6 else vector
+
+
+@dataclass
+class ResultScreen:
+    """结算界面识别结果"""
+    rank: str                            # S/A/B/C
+    score: float                         # 评级识别的相关系数 / 置信度
+    exit: Optional[Match] = None         # 退出按钮（同一帧上识别，找不到为 None）
+    skip_reward_likely: bool = True      # 预测退出后是否会弹出跳过奖励确认
+
+
+class ResultScreenParser:
+    """
+    结算界面解析器
+
+    徽章区域和跳过奖励弹窗的出现次数持久化到数据目录
+    """
+
+    # 跳过奖励统计的最短保存间隔（秒），避免每次战斗都写文件
+    SAVE_INTERVAL = 10.0
+
+    def __init__(self, filename: str = RESULT_FILE):
+        self._path = data_path(filename)
+        data = load_json(self._path, default={})
+        # 徽章区域与学习时的屏幕尺寸 (w, h)
+        self._badge: Optional[Region] = tuple(data["badge"]) if data.get("badge") else None
+        self._screen: Optional[tuple[int, int]] = tuple(data["screen"]) if data.get("screen") else None
+        # 分组（副本:难度:评级 / 评级）-> [弹窗出现次数, 退出次数]
+        self._skip_reward: dict[str, list[int]] = data.get("skip_reward", {})
+        self._dirty = False
+        self._last_save = 0.0
+        self._ranks: list[str] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    @property
+    def badge_region(self) -> Optional[Region]:
+        return self._badge
+
+    def _classes(self) -> Optional[np.ndarray]:
+        """所有已加载评级模板的徽章向量（每行一类）"""
+        if self._matrix is None:
+            ranks = [rank for rank, template in RANK_TEMPLATES.items() if template in image_matcher.templates]
+            if not ranks:
+                return None
+            self._ranks = ranks
+            self._matrix = np.stack([
+                _badge_vector(image_matcher.templates[RANK_TEMPLATES[rank]]) for rank in ranks
+            ])
+        return self._matrix
+
+    def _save(self):
+        try:
+            save_json(self._path, {
+                "badge": self._badge,
+                "screen": self._screen,
+                "skip_reward": self._skip_reward,
+            })
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"保存结算界面数据失败: {e}")
+
+    def flush(self):
+        """将未保存的统计写入文件"""
+        if self._dirty:
+            self._save()
+
+    def read_rank(self, frame: Frame, full_scan: bool = False) -> Optional[tuple[str, float]]:
+        """
+        识别评级
+
+        已学习徽章区域时只比较该区域；未学习、屏幕尺寸变化或 full_scan 时逐个全屏匹配评级模板，
+        匹配成功后记住徽章区域
+
+        Returns:
+            (rank, score)，不是结算界面时返回 None
+        """
+        if self._badge is not None and self._screen == (frame.width, frame.height):
+            result = frame.cached(("rank", self._badge), lambda: self._compare_badge(frame))
+            if result or not full_scan:
+                return result
+        return frame.cached("rank:full", lambda: self._scan_ranks(frame))
+
+    def _compare_badge(self, frame: Frame) -> Optional[tuple[str, float]]:
+        classes = self._classes()
+        crop = frame.crop(self._badge, gray=True)
+        if classes is None or crop.size == 0:
+            return None
+
+        scores = classes @ _badge_vector(crop)
+        best = int(np.argmax(scores))
+        if scores[best] < BADGE_THRESHOLD:
+            return None
+        return self._ranks[best], float(scores[best])
+
+    def _scan_ranks(self, frame: Frame) -> Optional[tuple[str, float]]:
+        best = None
+        for rank, template in RANK_TEMPLATES.items():
+            match = image_matcher.match_template(frame, template, threshold=RANK_THRESHOLD)
+            if match and (best is None or match[2] > best[1][2]):
+                best = (rank, match)
+        if best is None:
+            return None
+
+        rank, (x, y, confidence) = best
+        th, tw = image_matcher.templates[RANK_TEMPLATES[rank]].shape[:2]
+        badge = (x - tw // 2, y - th // 2, tw, th)
+        if badge != self._badge or self._screen != (frame.width, frame.height):
+            self._badge = badge
+            self._screen = (frame.width, frame.height)
+            logger.info(f"已记录评级徽章区域: {badge}")
+            self._save()
+        return rank, confidence
+
+    def parse(self, frame: Frame, profile: Optional[str] = None) -> Optional[ResultScreen]:
+        """
+        解析结算界面
+
+        Args:
+            profile: 跳过奖励弹窗预测的分组（如 副本:难度）
+
+        Returns:
+            ResultScreen，不是结算界面时返回 None
+        """
+        rank = self.read_rank(frame, full_scan=True)
+        if rank is None:
+            return None
+
+        rank, score = rank
+        region = image_matcher.search_region(EXIT_TEMPLATE)
+        exit_button = image_matcher.match_template(frame, EXIT_TEMPLATE, threshold=0.7, region=region)
+        if exit_button is None and region is not None:
+            exit_button = image_matcher.match_template(frame, EXIT_TEMPLATE, threshold=0.7)
+
+        return ResultScreen(rank, score, exit_button, self.skip_reward_probability(rank, profile) >= SKIP_REWARD_LIKELY)
+
+    @staticmethod
+    def _skip_reward_keys(rank: str, profile: Optional[str]) -> list[str]:
+        return [f"{profile}:{rank}", rank] if profile else [rank]
+
+    def skip_reward_probability(self, rank: str, profile: Optional[str] = None) -> float:
+        """退出后弹出跳过奖励确认的概率（拉普拉斯平滑，没有样本时为 0.5）"""
+        for key in self._skip_reward_keys(rank, profile):
+            if key in self._skip_reward:
+                appeared, total = self._skip_reward[key]
+                return (appeared + 1) / (total + 2)
+        return 0.5
+
+    def record_skip_reward(self, rank: str, appeared: bool, profile: Optional[str] = None):
+        """记录一次退出结算界面后是否出现了跳过奖励确认"""
+        for key in self._skip_reward_keys(rank, profile):
+            counts = self._skip_reward.setdefault(key, [0, 0])
+            counts[0] += int(appeared)
+            counts[1] += 1
+        self._dirty = True
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self._save()
+
+    def to_dict(self) -> dict:
+        return {
+            "badge_region": self._badge,
+            "screen": self._screen,
+            "skip_reward": {
+                key: {"appeared": appeared, "total": total}
+                for key, (appeared, total) in self._skip_reward.items()
+            },
+        }
+
+
+class RankCondition(Condition):
+    """结算界面出现（评级可识别），满足后 rank 为识别到的评级"""
+
+    def __init__(self, parser: "ResultScreenParser", priority: int = 0, name: str = "rank"):
+        super().__init__(name, priority)
+        self.parser = parser
+        self.rank: Optional[str] = None
+        self._checks = 0
+
+    def reset(self):
+        self.rank = None
+        self._checks = 0
+
+    def check(self, frame: Frame) -> Optional[Match]:
+        self._checks += 1
+        result = self.parser.read_rank(frame, full_scan=self._checks % FULL_SCAN_EVERY == 0)
+        if result is None:
+            return None
+
+        self.rank, score = result
+        badge = self.parser.badge_region
+        if badge is None:
+            return (frame.width // 2, frame.height // 2, score)
+        x, y, w, h = badge
+        return (x + w // 2, y + h // 2, score)
+
+
+# 全局实例
+result_parser = ResultScreenParser()
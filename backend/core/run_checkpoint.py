@@ -0,0 +1,74 @@
+"""
+运行检查点
+循环 / 计划运行在每次副本结束时把进度、计划位置和当前场景写入数据目录（原子写入），
+后端重启后可以从检查点继续，不用从头运行；记录的场景作为检测提示，只需确认一次即可继续
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Optional
+
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.checkpoint")
+
+CHECKPOINT_FILE = "run_checkpoint.json"
+
+
+@dataclass
+class RunCheckpoint:
+    """运行检查点"""
+    kind: str                            # loop / plan
+    params: dict                         # loop: dungeon_id, difficulty, count；plan: 排好序的计划
+    iteration: int = 0                   # 已完成的次数
+    completed: int = 0
+    failed: int = 0
+    ranks: list = field(default_factory=list)
+    entry_index: int = 0                 # 计划位置：当前条目
+    entry_done: int = 0                  # 当前条目已完成的次数
+    scene: Optional[str] = None          # 最近一次确定的场景
+    updated: float = 0.0                 # 写入时间（Unix 时间戳）
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunCheckpoint":
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__ if key in data})
+
+
+class CheckpointStore:
+    """检查点存储（同一时间只有一个运行中的循环 / 计划，只保存一个检查点）"""
+
+    def __init__(self, filename: str = CHECKPOINT_FILE):
+        self._path = data_path(filename)
+
+    def load(self) -> Optional[RunCheckpoint]:
+        data = load_json(self._path)
+        if not isinstance(data, dict):
+            return None
+        try:
+            return RunCheckpoint.from_dict(data)
+        except TypeError as e:
+            logger.warning(f"检查点格式无效，已忽略: {e}")
+            return None
+
+    def save(self, checkpoint: RunCheckpoint):
+        checkpoint.updated = time.time()
+        try:
+            save_json(self._path, checkpoint.to_dict())
+        except OSError as e:
+            logger.warning(f"保存检查点失败: {e}")
+
+    def clear(self):
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除检查点失败: {e}")
+
+
+# 全局实例
+run_checkpoint = CheckpointStore()
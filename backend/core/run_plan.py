@@ -0,0 +1,121 @@
+"""
+多副本运行计划
+把多组（副本, 难度, 次数）排成一个执行顺序，使场景切换和列表滑动最少：
+
+- 同一副本的所有条目排在一起，切换难度不离开副本详情页
+- 副本之间只经过副本列表（详情页 -> 返回列表 -> 下一个副本），不再从头导航
+- 副本按从副本列表进入的期望耗时（场景图路由表）排序，不需要滑动的副本在前；
+  当前已在某个副本详情页时先执行该副本
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+from core.scene_graph import get_route_table
+
+logger = logging.getLogger("zat.plan")
+
+LIST_SCENE = "dungeon_list"
+# 难度的执行顺序（同一副本内）
+DIFFICULTY_ORDER = ["normal", "hard", "nightmare"]
+
+
+def dungeon_scene(dungeon_id: str) -> str:
+    return f"dungeon:{dungeon_id}"
+
+
+@dataclass
+class PlanEntry:
+    """计划条目"""
+    dungeon_id: str
+    difficulty: str = "normal"
+    count: int = 1
+
+    def to_dict(self) -> dict:
+        return {"dungeon_id": self.dungeon_id, "difficulty": self.difficulty, "count": self.count}
+
+
+@dataclass
+class RunPlan:
+    """排好序的运行计划"""
+    entries: list[PlanEntry] = field(default_factory=list)
+    transitions: int = 0                 # 副本之间预计的场景切换次数（不含首次导航）
+    scrolls: int = 0                     # 副本之间切换时需要滑动列表的次数
+    navigation_cost: float = 0.0         # 副本之间切换的期望耗时（秒）
+
+    @property
+    def total(self) -> int:
+        return sum(entry.count for entry in self.entries)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunPlan":
+        """从 to_dict 的结果恢复（保持原有顺序，不重新排序）"""
+        return cls(
+            entries=[PlanEntry(e["dungeon_id"], e["difficulty"], e["count"]) for e in data.get("entries", [])],
+            transitions=data.get("transitions", 0),
+            scrolls=data.get("scrolls", 0),
+            navigation_cost=data.get("navigation_cost", 0.0),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "entries": [entry.to_dict() for entry in self.entries],
+            "total": self.total,
+            "transitions": self.transitions,
+            "scrolls": self.scrolls,
+            "navigation_cost": round(self.navigation_cost, 2),
+        }
+
+
+def plan_runs(entries: list[PlanEntry], current_scene: Optional[str] = None) -> RunPlan:
+    """
+    合并并排序计划条目
+
+    Args:
+        entries: 计划条目（同一副本和难度的条目会合并，次数不大于 0 的条目忽略）
+        current_scene: 当前场景，是某个副本详情页时先执行该副本
+
+    Returns:
+        RunPlan，条目按执行顺序排列
+    """
+    # 副本 -> 难度 -> 次数（保持首次出现的顺序）
+    groups: dict[str, dict[str, int]] = {}
+    for entry in entries:
+        if entry.count > 0:
+            counts = groups.setdefault(entry.dungeon_id, {})
+            counts[entry.difficulty] = counts.get(entry.difficulty, 0) + entry.count
+
+    table = get_route_table()
+
+    def enter(dungeon_id: str) -> tuple[bool, float]:
+        """从副本列表进入副本：(是否需要滑动, 期望耗时)"""
+        transition = table.transition(LIST_SCENE, dungeon_scene(dungeon_id))
+        if transition is None:
+            return False, float("inf")
+        return transition.scroll is not None, table.costs[LIST_SCENE][dungeon_scene(dungeon_id)]
+
+    def leave(dungeon_id: str) -> float:
+        return table.costs.get(dungeon_scene(dungeon_id), {}).get(LIST_SCENE, 0.0)
+
+    order = sorted(groups, key=lambda dungeon_id: (dungeon_scene(dungeon_id) != current_scene, *enter(dungeon_id)))
+
+    plan = RunPlan()
+    for index, dungeon_id in enumerate(order):
+        difficulties = sorted(
+            groups[dungeon_id],
+            key=lambda d: DIFFICULTY_ORDER.index(d) if d in DIFFICULTY_ORDER else len(DIFFICULTY_ORDER),
+        )
+        plan.entries.extend(PlanEntry(dungeon_id, d, groups[dungeon_id][d]) for d in difficulties)
+
+        if index == 0:
+            continue
+        scroll, cost = enter(dungeon_id)
+        plan.transitions += 2
+        plan.scrolls += int(scroll)
+        plan.navigation_cost += leave(order[index - 1]) + cost
+
+    logger.debug(
+        f"运行计划: {' -> '.join(f'{e.dungeon_id}:{e.difficulty}x{e.count}' for e in plan.entries)}"
+        f"（切换 {plan.transitions} 次，滑动 {plan.scrolls} 次）"
+    )
+    return plan
@@ -0,0 +1,284 @@
+"""
+场景分类器
+基于截图指纹（整体布局哈希 + 关键区域签名）的最近邻索引，一步判断当前场景；
+只有最近邻结果不明确时，才需要模板匹配 / OCR 确认
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import cv2
+
+from core.frame import Frame, phash_distance
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.classifier")
+
+INDEX_FILE = "scene_index.json"
+# 录制的场景截图目录，结构见 SceneClassifier.import_screenshots
+SCREENS_DIR = "scene_screens"
+
+# 关键区域（相对屏幕的比例 x, y, w, h）：顶部标题栏和底部导航栏最能区分场景
+KEY_REGIONS = {
+    "top": (0.0, 0.0, 1.0, 0.12),
+    "bottom": (0.0, 0.88, 1.0, 0.12),
+}
+# 区域签名尺寸 (w, h)
+SIGNATURE_SIZE = (16, 4)
+
+
+@dataclass
+class Fingerprint:
+    """截图指纹"""
+    layout: int                         # 整体布局感知哈希（64 位）
+    regions: dict[str, np.ndarray]      # 关键区域的缩略灰度签名
+
+    def distance(self, other: "Fingerprint") -> float:
+        """指纹距离（0 表示完全相同，约 0.3 以上基本是不同画面）"""
+        layout = phash_distance(self.layout, other.layout) / 64
+        diffs = [
+            np.abs(sig.astype(np.int16) - other.regions[name].astype(np.int16)).mean() / 255
+            for name, sig in self.regions.items()
+            if name in other.regions
+        ]
+        region = float(np.mean(diffs)) if diffs else layout
+        return 0.5 * layout + 0.5 * region
+
+    def to_dict(self) -> dict:
+        return {
+            "layout": self.layout,
+            "regions": {name: sig.tolist() for name, sig in self.regions.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Fingerprint":
+        return cls(
+            layout=int(data["layout"]),
+            regions={name: np.array(sig, dtype=np.uint8) for name, sig in data["regions"].items()},
+        )
+
+
+def compute_fingerprint(frame: Frame) -> Fingerprint:
+    """计算帧指纹（缓存在 Frame 上）"""
+    def compute():
+        regions = {}
+        for name, (rx, ry, rw, rh) in KEY_REGIONS.items():
+            region = (int(rx * frame.width), int(ry * frame.height), int(rw * frame.width), int(rh * frame.height))
+            crop = frame.crop(region, gray=True)
+            regions[name] = cv2.resize(crop, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).flatten()
+        return Fingerprint(layout=frame.phash, regions=regions)
+
+    return frame.cached("scene_fingerprint", compute)
+
+
+@dataclass
+class Classification:
+    """分类结果"""
+    scene_id: str
+    distance: float              # 与最近样本的距离
+    margin: float                # 与次近的其他场景的距离差
+    candidates: list[str]        # 按距离排序的候选场景
+    ambiguous: bool              # 是否需要模板 / OCR 确认
+
+
+@dataclass
+class ClassifierStats:
+    """分类统计"""
+    lookups: int = 0
+    confident: int = 0           # 一步确定场景的次数
+    ambiguous: int = 0           # 需要确认的次数
+    misses: int = 0              # 索引为空或没有足够接近的样本
+
+    def to_dict(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "confident": self.confident,
+            "ambiguous": self.ambiguous,
+            "misses": self.misses,
+        }
+
+
+class SceneClassifier:
+    """场景分类器"""
+
+    # 最近样本距离低于该值才认为是同一场景
+    MATCH_DISTANCE = 0.12
+    # 最近场景与次近场景的距离差至少为该值才认为结果明确
+    MIN_MARGIN = 0.05
+    # 超过该距离的候选不再参与确认
+    CANDIDATE_DISTANCE = 0.25
+    # 每个场景保留的样本数
+    MAX_SAMPLES_PER_SCENE = 8
+    # 最短保存间隔（秒），避免每次新增样本都写文件
+    SAVE_INTERVAL = 10.0
+
+    def __init__(self, filename: str = INDEX_FILE):
+        self._path = data_path(filename)
+        self._index: dict[str, list[Fingerprint]] = {}
+        self.stats = ClassifierStats()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+
+    def load(self):
+        """
+        加载索引（首次使用时自动加载；阻塞，在事件循环中请用 asyncio.to_thread 调用）
+
+        索引文件为空时从录制的截图目录导入
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self._load()
+            if not self._index:
+                self.import_screenshots(data_path(SCREENS_DIR))
+            self._loaded = True
+
+    def _load(self):
+        data = load_json(self._path, default={})
+        for scene_id, samples in data.items():
+            try:
+                self._index[scene_id] = [Fingerprint.from_dict(s) for s in samples]
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"忽略无效的场景索引: {scene_id}")
+        if self._index:
+            total = sum(len(v) for v in self._index.values())
+            logger.info(f"已加载场景索引: {len(self._index)} 个场景, {total} 个样本")
+
+    def save(self):
+        """保存索引"""
+        try:
+            save_json(self._path, {
+                scene_id: [fp.to_dict() for fp in samples]
+                for scene_id, samples in self._index.items()
+            })
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"保存场景索引失败: {e}")
+
+    def flush(self):
+        """将未保存的样本写入文件"""
+        if self._dirty:
+            self.save()
+
+    def record(self, scene_id: str, frame: Frame, persist: bool = True) -> bool:
+        """
+        将截图加入场景索引
+
+        与该场景已有样本几乎相同的截图不会重复加入；样本数达到上限时替换最旧的样本。
+        新样本先记在内存中，距上次保存超过 SAVE_INTERVAL 时才写文件（其余由 flush 写入）
+
+        Returns:
+            是否加入了新样本
+        """
+        self.load()
+        if not self._add(scene_id, frame):
+            return False
+        if persist and time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.save()
+        return True
+
+    def _add(self, scene_id: str, frame: Frame) -> bool:
+        fingerprint = compute_fingerprint(frame)
+        samples = self._index.setdefault(scene_id, [])
+
+        if any(fingerprint.distance(s) < self.MATCH_DISTANCE / 3 for s in samples):
+            return False
+
+        samples.append(fingerprint)
+        if len(samples) > self.MAX_SAMPLES_PER_SCENE:
+            samples.pop(0)
+
+        logger.debug(f"场景索引新增样本: {scene_id} ({len(samples)} 个)")
+        self._dirty = True
+        return True
+
+    def import_screenshots(self, directory: str) -> int:
+        """
+        从截图目录批量建立索引，目录结构: <directory>/<scene_id>/*.png
+
+        场景 ID 中的 ":" 在目录名中写作 "@"（如 dungeon@sea_palace）
+
+        Returns:
+            导入的样本数
+        """
+        imported = 0
+        if not os.path.isdir(directory):
+            return imported
+
+        for dirname in sorted(os.listdir(directory)):
+            scene_dir = os.path.join(directory, dirname)
+            if not os.path.isdir(scene_dir):
+                continue
+            scene_id = dirname.replace("@", ":")
+            for filename in sorted(os.listdir(scene_dir)):
+                if not filename.endswith((".png", ".jpg", ".jpeg")):
+                    continue
+                img = cv2.imread(os.path.join(scene_dir, filename))
+                if img is not None and self._add(scene_id, Frame(img, 0.0)):
+                    imported += 1
+
+        if imported:
+            self.save()
+            logger.info(f"从截图导入场景索引: {imported} 个样本")
+        return imported
+
+    def classify(self, frame: Frame) -> Optional[Classification]:
+        """
+        查找最近的场景
+
+        Returns:
+            Classification，索引为空或没有足够接近的样本时返回 None
+        """
+        self.load()
+        self.stats.lookups += 1
+        if not self._index:
+            self.stats.misses += 1
+            return None
+
+        fingerprint = compute_fingerprint(frame)
+        distances = sorted(
+            (min(fingerprint.distance(s) for s in samples), scene_id)
+            for scene_id, samples in self._index.items()
+            if samples
+        )
+        if not distances or distances[0][0] > self.CANDIDATE_DISTANCE:
+            self.stats.misses += 1
+            return None
+
+        best_distance, best_scene = distances[0]
+        margin = distances[1][0] - best_distance if len(distances) > 1 else 1.0
+        ambiguous = best_distance > self.MATCH_DISTANCE or margin < self.MIN_MARGIN
+
+        if ambiguous:
+            self.stats.ambiguous += 1
+        else:
+            self.stats.confident += 1
+
+        return Classification(
+            scene_id=best_scene,
+            distance=best_distance,
+            margin=margin,
+            candidates=[scene_id for d, scene_id in distances if d <= self.CANDIDATE_DISTANCE],
+            ambiguous=ambiguous,
+        )
+
+    def summary(self) -> dict:
+        """索引概况"""
+        self.load()
+        return {
+            "scenes": {scene_id: len(samples) for scene_id, samples in self._index.items()},
+            "stats": self.stats.to_dict(),
+        }
+
+
+# 全局实例
+scene_classifier = SceneClassifier()
@@ -1,13 +1,17 @@
 """
 场景图导航系统
-使用图结构管理游戏场景，支持自动寻路
+使用图结构管理游戏场景，支持按实测耗时自动寻路
 """
+import heapq
 import logging
-from collections import deque
+import time
 from dataclasses import dataclass, field
-from typing import Optional, Callable, Awaitable, Any
+from types import MappingProxyType
+from typing import Optional, Callable, Awaitable, Any, Mapping
 from enum import Enum
 
+from core.transition_stats import EdgeStats, TransitionStatsStore
+
 logger = logging.getLogger("zat.scene")
 
 
@@ -19,6 +23,13 @@ class ActionType(str, Enum):
     SWIPE = "swipe"           # 滑动
 
 
+class HopResult(str, Enum):
+    """单步转移的执行结果"""
+    FAILED = "failed"         # 操作失败或未能确认到达
+    ARRIVED = "arrived"       # 已到达目标场景
+    ADVANCED = "advanced"     # 已到达目标场景，并已提前执行下一跳的操作
+
+
 @dataclass
 class Transition:
     """场景转移定义"""
@@ -49,8 +60,9 @@ SCENES: dict[str, Scene] = {}
 
 
 def register_scene(scene: Scene):
-    """注册场景"""
+    """注册场景（会使已编译的路由表失效）"""
     SCENES[scene.id] = scene
+    invalidate_route_table()
     logger.debug(f"注册场景: {scene.id} ({scene.name})")
 
 
@@ -241,8 +253,159 @@ def define_scenes():
         ))
 
 
-# 初始化场景
+# ==================== 路由表 ====================
+
+# 各操作类型的先验耗时（秒，不含 wait_after），没有实测数据时使用
+ACTION_PRIOR_COST = {
+    ActionType.CLICK: 0.6,
+    ActionType.CLICK_TEXT: 2.5,   # 需要 OCR
+    ActionType.BACK: 0.4,
+    ActionType.SWIPE: 0.8,
+}
+SCROLL_PRIOR_COST = 1.0
+
+# 实测期望耗时相对编译时变化超过该比例时，重新编译路由表
+REROUTE_COST_RATIO = 0.2
+
+# 转移统计（实测耗时和失败率，跨会话持久化）
+transition_stats = TransitionStatsStore()
+
+
+def prior_cost(transition: Transition) -> float:
+    """转移的先验耗时"""
+    cost = ACTION_PRIOR_COST.get(transition.action, 1.0) + transition.wait_after
+    if transition.scroll:
+        cost += SCROLL_PRIOR_COST
+    return cost
+
+
+def edge_cost(from_scene: str, to_scene: str, transition: Transition) -> float:
+    """转移的期望耗时：有实测数据时使用实测值，否则使用先验值"""
+    stats = transition_stats.get(from_scene, to_scene) or EdgeStats()
+    return stats.expected_cost(prior_cost(transition))
+
+
+@dataclass(frozen=True)
+class RouteTable:
+    """
+    编译后的场景图（不可变）
+    
+    edges: 邻接表 from -> to -> Transition，返回操作（back_to）已展开为 BACK 转移
+    costs: 每条边编译时的期望耗时 from -> to -> 秒
+    next_hop: 全源下一跳表 from -> to -> 下一个场景
+    """
+    edges: Mapping[str, Mapping[str, Transition]]
+    costs: Mapping[str, Mapping[str, float]]
+    next_hop: Mapping[str, Mapping[str, str]]
+    
+    def path(self, from_scene: str, to_scene: str) -> Optional[list[str]]:
+        """沿下一跳表查找路径，复杂度为路径长度"""
+        if from_scene == to_scene:
+            return [from_scene] if from_scene in self.edges else None
+        
+        path = [from_scene]
+        current = from_scene
+        while current != to_scene:
+            current = self.next_hop.get(current, {}).get(to_scene)
+            if current is None:
+                return None
+            path.append(current)
+        return path
+    
+    def transition(self, from_scene: str, to_scene: str) -> Optional[Transition]:
+        """获取相邻场景之间的转移"""
+        return self.edges.get(from_scene, {}).get(to_scene)
+    
+    def cost(self, path: list[str]) -> float:
+        """路径的期望耗时"""
+        return sum(self.costs[a][b] for a, b in zip(path, path[1:]))
+
+
+def _compile_edges(scenes: dict[str, Scene]) -> dict[str, dict[str, Transition]]:
+    """展开场景的转移和返回操作为统一的邻接表"""
+    edges: dict[str, dict[str, Transition]] = {}
+    for scene_id, scene in scenes.items():
+        out = {
+            target: transition
+            for target, transition in scene.transitions.items()
+            if target in scenes
+        }
+        # 没有直接转移时，返回操作作为一条 BACK 边
+        if scene.back_to and scene.back_to in scenes and scene.back_to not in out:
+            out[scene.back_to] = Transition(
+                target=scene.back_to,
+                action=ActionType.BACK,
+                template=scene.back_template,
+                wait_after=0.8
+            )
+        edges[scene_id] = out
+    return edges
+
+
+def compile_route_table(
+    scenes: dict[str, Scene],
+    cost: Callable[[str, str, Transition], float] = edge_cost,
+) -> RouteTable:
+    """
+    编译路由表：对每个起点做一次 Dijkstra，记录到达每个终点的第一跳
+    
+    边权为期望耗时，耗时相同时选跳数少的路径。
+    复杂度 O(V * E log V)，只在场景图或耗时显著变化后执行
+    """
+    edges = _compile_edges(scenes)
+    costs = {
+        source: {target: cost(source, target, t) for target, t in out.items()}
+        for source, out in edges.items()
+    }
+    next_hop: dict[str, Mapping[str, str]] = {}
+    
+    for source in edges:
+        first_hop: dict[str, str] = {}
+        settled = {source}
+        # (累计耗时, 跳数, 场景, 第一跳)
+        heap = [(c, 1, target, target) for target, c in costs[source].items() if target != source]
+        heapq.heapify(heap)
+        
+        while heap:
+            distance, hops, current, hop = heapq.heappop(heap)
+            if current in settled:
+                continue
+            settled.add(current)
+            first_hop[current] = hop
+            for target, c in costs[current].items():
+                if target not in settled:
+                    heapq.heappush(heap, (distance + c, hops + 1, target, hop))
+        
+        next_hop[source] = MappingProxyType(first_hop)
+    
+    return RouteTable(
+        edges=MappingProxyType({k: MappingProxyType(v) for k, v in edges.items()}),
+        costs=MappingProxyType({k: MappingProxyType(v) for k, v in costs.items()}),
+        next_hop=MappingProxyType(next_hop),
+    )
+
+
+_route_table: Optional[RouteTable] = None
+
+
+def get_route_table() -> RouteTable:
+    """获取路由表（场景图或耗时变化后首次调用时重新编译）"""
+    global _route_table
+    if _route_table is None:
+        _route_table = compile_route_table(SCENES)
+        logger.debug(f"路由表已编译: {len(SCENES)} 个场景")
+    return _route_table
+
+
+def invalidate_route_table():
+    """使路由表失效，下次使用时重新编译"""
+    global _route_table
+    _route_table = None
+
+
+# 初始化场景并编译路由表
 define_scenes()
+get_route_table()
 
 
 # ==================== 场景图导航器 ====================
@@ -254,18 +417,23 @@ class SceneNavigator:
         self.current_scene: Optional[str] = None
         self._action_handler: Optional[Callable] = None
     
-    def set_action_handler(self, handler: Callable[[Transition, Scene], Awaitable[bool]]):
+    def set_action_handler(self, handler: Callable[..., Awaitable[HopResult]]):
         """
         设置操作处理器
         
-        handler 签名: async def handler(transition: Transition, from_scene: Scene) -> bool
-        返回 True 表示操作成功
+        handler 签名:
+            async def handler(transition: Transition, from_scene: Scene,
+                              next_transition: Optional[Transition], performed: bool) -> HopResult
+        
+        next_transition 是路径上的下一跳（最后一跳为 None），处理器可以在确认到达的同时
+        监视下一跳的模板并提前点击，此时返回 ADVANCED，下一跳调用时 performed 为 True，
+        处理器只需确认到达
         """
         self._action_handler = handler
     
     def find_path(self, from_scene: str, to_scene: str) -> Optional[list[str]]:
         """
-        使用 BFS 寻找从 from_scene 到 to_scene 的最短路径
+        查找从 from_scene 到 to_scene 期望耗时最短的路径（查预编译的路由表）
         
         Returns:
             场景ID列表（包含起点和终点），如果无法到达返回 None
@@ -273,37 +441,7 @@ class SceneNavigator:
         if from_scene == to_scene:
             return [from_scene]
         
-        if from_scene not in SCENES or to_scene not in SCENES:
-            return None
-        
-        # BFS
-        queue = deque([(from_scene, [from_scene])])
-        visited = {from_scene}
-        
-        while queue:
-            current, path = queue.popleft()
-            scene = SCENES.get(current)
-            
-            if not scene:
-                continue
-            
-            # 检查所有可转移的场景
-            for target_id in scene.transitions.keys():
-                if target_id == to_scene:
-                    return path + [target_id]
-                
-                if target_id not in visited and target_id in SCENES:
-                    visited.add(target_id)
-                    queue.append((target_id, path + [target_id]))
-            
-            # 也考虑返回操作
-            if scene.back_to and scene.back_to not in visited:
-                if scene.back_to == to_scene:
-                    return path + [scene.back_to]
-                visited.add(scene.back_to)
-                queue.append((scene.back_to, path + [scene.back_to]))
-        
-        return None
+        return get_route_table().path(from_scene, to_scene)
     
     async def navigate_to(self, target_scene: str) -> bool:
         """
@@ -336,6 +474,8 @@ class SceneNavigator:
         logger.info(f"导航路径: {' -> '.join(path)}")
         
         # 执行路径上的每一步
+        table = get_route_table()
+        performed = False
         for i in range(len(path) - 1):
             from_id = path[i]
             to_id = path[i + 1]
@@ -345,25 +485,23 @@ class SceneNavigator:
                 logger.error(f"场景不存在: {from_id}")
                 return False
             
-            # 查找转移
-            transition = from_scene.transitions.get(to_id)
-            
-            # 如果没有直接转移，检查是否是返回操作
-            if not transition and from_scene.back_to == to_id:
-                transition = Transition(
-                    target=to_id,
-                    action=ActionType.BACK,
-                    template=from_scene.back_template,
-                    wait_after=0.8
-                )
+            # 查找转移（返回操作已编译为 BACK 边）
+            transition = table.transition(from_id, to_id)
             
             if not transition:
                 logger.error(f"无法从 {from_id} 转移到 {to_id}")
                 return False
             
-            # 执行操作
+            next_transition = table.transition(to_id, path[i + 2]) if i + 2 < len(path) else None
+            
+            # 执行操作（performed 为 True 时操作已在上一跳提前执行）
             logger.info(f"执行: {from_scene.name} -> {SCENES[to_id].name}")
-            success = await self._action_handler(transition, from_scene)
+            started = time.monotonic()
+            result = await self._action_handler(transition, from_scene, next_transition, performed)
+            success = result != HopResult.FAILED
+            # 操作已在上一跳提前执行时，耗时只包含到达确认，失败也可能是预判点错：不计入转移统计
+            if not performed:
+                self._record_transition(from_id, to_id, transition, time.monotonic() - started, success)
             
             if not success:
                 logger.error(f"操作失败: {from_id} -> {to_id}")
@@ -372,10 +510,27 @@ class SceneNavigator:
             
             # 更新当前场景
             self.current_scene = to_id
+            performed = result == HopResult.ADVANCED
         
         logger.info(f"成功导航到: {SCENES[target_scene].name}")
         return True
     
+    def _record_transition(
+        self,
+        from_id: str,
+        to_id: str,
+        transition: Transition,
+        duration: float,
+        success: bool,
+    ):
+        """记录转移实测耗时，期望耗时变化明显时让路由表重新编译"""
+        stats = transition_stats.record(from_id, to_id, duration, success)
+        compiled = get_route_table().costs[from_id][to_id]
+        current = stats.expected_cost(prior_cost(transition))
+        if abs(current - compiled) > REROUTE_COST_RATIO * compiled:
+            logger.debug(f"转移耗时变化 {from_id} -> {to_id}: {compiled:.2f}s -> {current:.2f}s，重新规划路由")
+            invalidate_route_table()
+    
     def get_scene(self, scene_id: str) -> Optional[Scene]:
         """获取场景定义"""
         return SCENES.get(scene_id)
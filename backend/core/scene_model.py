@@ -0,0 +1,91 @@
+"""
+场景转移模型
+一阶马尔可夫模型：根据上一个场景预测下一个最可能出现的场景，用于安排检测顺序
+"""
+import logging
+import time
+from typing import Optional
+
+from core.scene_graph import SCENES
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.scene")
+
+MODEL_FILE = "scene_model.json"
+
+
+class SceneTransitionModel:
+    """
+    场景转移模型
+
+    先验来自场景图结构（转移目标和 back_to），观测到的实际转移按次数累加，
+    两者相加后归一化得到转移概率
+    """
+
+    # 场景图中每条边的先验权重
+    EDGE_PRIOR = 2.0
+    # 停留在原场景的先验权重（检测时画面可能没变）
+    STAY_PRIOR = 1.0
+    # 最短保存间隔（秒）
+    SAVE_INTERVAL = 30.0
+
+    def __init__(self, filename: str = MODEL_FILE):
+        self._path = data_path(filename)
+        self._observed: dict[str, dict[str, int]] = load_json(self._path, default={})
+        self._dirty = False
+        self._last_save = 0.0
+
+    def _prior(self, from_scene: str) -> dict[str, float]:
+        scene = SCENES.get(from_scene)
+        if not scene:
+            return {}
+        weights = {from_scene: self.STAY_PRIOR}
+        for target in scene.transitions:
+            weights[target] = weights.get(target, 0.0) + self.EDGE_PRIOR
+        if scene.back_to and scene.back_to not in scene.transitions:
+            weights[scene.back_to] = self.EDGE_PRIOR
+        return weights
+
+    def probabilities(self, from_scene: str) -> dict[str, float]:
+        """从 from_scene 出发，下一次检测到各场景的概率"""
+        weights = self._prior(from_scene)
+        for target, count in self._observed.get(from_scene, {}).items():
+            weights[target] = weights.get(target, 0.0) + count
+
+        total = sum(weights.values())
+        if total <= 0:
+            return {}
+        return {target: w / total for target, w in weights.items() if target in SCENES}
+
+    def rank(self, from_scene: Optional[str]) -> list[str]:
+        """按概率从高到低排列可能的下一个场景（不含概率为 0 的场景）"""
+        if not from_scene:
+            return []
+        probs = self.probabilities(from_scene)
+        return sorted(probs, key=lambda scene_id: probs[scene_id], reverse=True)
+
+    def observe(self, from_scene: Optional[str], to_scene: Optional[str]):
+        """记录一次观测到的场景转移"""
+        if not from_scene or not to_scene:
+            return
+        targets = self._observed.setdefault(from_scene, {})
+        targets[to_scene] = targets.get(to_scene, 0) + 1
+        self._dirty = True
+
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """将未保存的观测写入文件"""
+        if not self._dirty:
+            return
+        try:
+            save_json(self._path, self._observed)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"保存场景转移模型失败: {e}")
+
+
+# 全局实例
+scene_model = SceneTransitionModel()
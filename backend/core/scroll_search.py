@@ -0,0 +1,221 @@
+"""
+滚动查找
+在可滚动列表中按步滑动查找模板：每次滑动后用相位相关测量内容的实际位移，跟踪列表的滚动位置；
+内容不再移动时视为到达列表末端。找到模板时的滚动位置会缓存到数据目录，下次直接滚动过去
+"""
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+import cv2
+
+from core.adb_controller import ADBController
+from core.frame import Frame, Region
+from core.frame_waiter import Match, frame_change, MOTION_THRESHOLD
+from core.image_matcher import image_matcher
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.scroll")
+
+OFFSETS_FILE = "scroll_offsets.json"
+
+# 列表区域（相对屏幕的比例 x, y, w, h），避开顶部标题栏和底部导航栏
+LIST_REGION = (0.0, 0.15, 1.0, 0.7)
+# 单步滑动距离上限（相对列表区域高度），保证相邻两帧有足够重叠用于测量位移
+MAX_STEP_RATIO = 0.4
+# 位移小于该值（像素）视为列表没有移动（已到末端）
+MIN_MOVEMENT = 3.0
+# 相位相关响应低于该值时测量不可信，按滑动距离估算
+MIN_RESPONSE = 0.05
+# 滑动后等待画面静止的最长时间（秒）
+SETTLE_TIMEOUT = 1.5
+# 直接滚动到缓存位置时允许的误差（相对单步距离）
+JUMP_TOLERANCE = 0.2
+
+# 滑动方向 -> 手指移动方向（与 Transition.scroll 一致）
+DIRECTION_SIGN = {"down": 1, "up": -1}
+
+
+def measure_scroll(before: Frame, after: Frame, region: Region) -> tuple[float, float]:
+    """
+    测量两帧之间列表内容的垂直位移
+
+    Returns:
+        (dy, response): dy 为内容移动的像素数（向下为正），response 为相位相关峰值（越大越可信）
+    """
+    a = before.crop(region, gray=True).astype(np.float32)
+    b = after.crop(region, gray=True).astype(np.float32)
+    if a.shape != b.shape or a.size == 0:
+        return 0.0, 0.0
+
+    window = cv2.createHanningWindow((a.shape[1], a.shape[0]), cv2.CV_32F)
+    (_, dy), response = cv2.phaseCorrelate(a, b, window)
+    return float(dy), float(response)
+
+
+class ScrollSearcher:
+    """
+    滚动查找器
+
+    滚动位置按场景记录（内容相对进入场景时的累计位移），进入场景时清零
+    """
+
+    def __init__(self, adb: ADBController, filename: str = OFFSETS_FILE):
+        self.adb = adb
+        self._path = data_path(filename)
+        # 场景 -> 模板 -> 找到模板时的滚动位置
+        self._offsets: dict[str, dict[str, float]] = load_json(self._path, default={})
+        # 场景 -> 当前滚动位置
+        self._positions: dict[str, float] = {}
+
+    def reset(self, scene_id: str):
+        """进入场景时调用：列表回到初始位置"""
+        self._positions[scene_id] = 0.0
+
+    def position(self, scene_id: str) -> float:
+        return self._positions.get(scene_id, 0.0)
+
+    def cached_offset(self, scene_id: str, template: str) -> Optional[float]:
+        return self._offsets.get(scene_id, {}).get(template)
+
+    def _screen_size(self) -> tuple[int, int]:
+        """屏幕尺寸 (w, h)，优先使用最近一帧，避免为了读取尺寸专门截图"""
+        latest = self.adb.pipeline.latest
+        if latest is not None:
+            return latest.width, latest.height
+        return self.adb.screen_resolution or self.adb.RECOMMENDED_RESOLUTION
+
+    def list_region(self) -> Region:
+        w, h = self._screen_size()
+        rx, ry, rw, rh = LIST_REGION
+        return (int(rx * w), int(ry * h), int(rw * w), int(rh * h))
+
+    def max_step(self) -> int:
+        return int(self.list_region()[3] * MAX_STEP_RATIO)
+
+    async def swipe(self, direction: str, distance: int):
+        """在列表区域中部滑动（不测量位移）"""
+        sign = DIRECTION_SIGN.get(direction)
+        if sign is None:
+            logger.warning(f"未知滑动方向: {direction}")
+            return
+
+        x, y, w, h = self.list_region()
+        start_x = x + w // 2
+        start_y = y + h // 2 - sign * distance // 2
+        await self.adb.swipe(start_x, start_y, start_x, start_y + sign * distance, duration=300)
+        logger.debug(f"滑动: {direction} {distance}px")
+
+    async def _settle(self, region: Region) -> Frame:
+        """等待列表停止滚动（惯性），返回静止后的帧"""
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        frame = await self.adb.pipeline.next_frame()
+        while time.monotonic() < deadline:
+            current = await self.adb.pipeline.next_frame(after=frame.timestamp)
+            moving = frame_change(frame, current, region) >= MOTION_THRESHOLD
+            frame = current
+            if not moving:
+                break
+        return frame
+
+    async def scroll(self, scene_id: str, direction: str, distance: int) -> tuple[float, Frame]:
+        """
+        滑动并测量内容的实际位移，更新滚动位置
+
+        Returns:
+            (moved, frame): moved 为内容位移（像素，带方向），frame 为静止后的帧
+        """
+        region = self.list_region()
+        distance = min(distance, self.max_step())
+        before = await self.adb.pipeline.next_frame()
+
+        await self.swipe(direction, distance)
+        after = await self._settle(region)
+
+        moved, response = measure_scroll(before, after, region)
+        if response < MIN_RESPONSE and abs(moved) >= MIN_MOVEMENT:
+            # 画面变化太大无法测量，按滑动距离估算
+            moved = float(DIRECTION_SIGN[direction] * distance)
+
+        self._positions[scene_id] = self.position(scene_id) + moved
+        logger.debug(f"列表位移: {moved:.0f}px，位置: {self._positions[scene_id]:.0f}")
+        return moved, after
+
+    async def search(
+        self,
+        scene_id: str,
+        template: str,
+        direction: str,
+        step: int = 500,
+        threshold: float = 0.7,
+        max_steps: int = 8,
+    ) -> Optional[Match]:
+        """
+        滚动查找模板
+
+        1. 当前画面已有模板则直接返回
+        2. 有缓存的位置时直接滚动过去
+        3. 按 direction 逐步滚动查找，到达末端后反向查找
+
+        Returns:
+            (x, y, confidence)，找不到返回 None
+        """
+        frame = await self.adb.pipeline.next_frame()
+        result = image_matcher.match_template(frame, template, threshold=threshold)
+        if result:
+            return result
+
+        cached = self.cached_offset(scene_id, template)
+        if cached is not None:
+            result = await self._jump(scene_id, template, cached, threshold)
+            if result:
+                return result
+
+        for current in (direction, "up" if direction == "down" else "down"):
+            for _ in range(max_steps):
+                moved, frame = await self.scroll(scene_id, current, step)
+                result = image_matcher.match_template(frame, template, threshold=threshold)
+                if result:
+                    self._remember(scene_id, template)
+                    return result
+                if abs(moved) < MIN_MOVEMENT:
+                    logger.debug(f"列表已到末端: {current}")
+                    break
+
+        logger.warning(f"滚动查找失败: {template}")
+        return None
+
+    async def _jump(self, scene_id: str, template: str, target: float, threshold: float) -> Optional[Match]:
+        """滚动到缓存的位置并检查模板"""
+        step = self.max_step()
+        frame = None
+        for _ in range(8):
+            delta = target - self.position(scene_id)
+            if abs(delta) <= step * JUMP_TOLERANCE:
+                break
+            direction = "down" if delta > 0 else "up"
+            moved, frame = await self.scroll(scene_id, direction, int(min(abs(delta), step)))
+            if abs(moved) < MIN_MOVEMENT:
+                break
+
+        if frame is None:
+            return None
+        result = image_matcher.match_template(frame, template, threshold=threshold)
+        if result:
+            logger.debug(f"按缓存位置找到: {template}")
+            self._remember(scene_id, template)
+        return result
+
+    def _remember(self, scene_id: str, template: str):
+        """缓存找到模板时的滚动位置"""
+        position = self.position(scene_id)
+        previous = self.cached_offset(scene_id, template)
+        if previous is not None and abs(previous - position) < MIN_MOVEMENT:
+            return
+
+        self._offsets.setdefault(scene_id, {})[template] = round(position, 1)
+        try:
+            save_json(self._path, self._offsets)
+        except OSError as e:
+            logger.warning(f"保存滚动位置失败: {e}")
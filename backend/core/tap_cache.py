@@ -0,0 +1,158 @@
+"""
+盲点缓存
+位置固定的按钮（匹配、难度标签、返回等）连续多次在同一位置匹配成功后，最近一帧已是
+上次输入之后的画面时，只在缓存位置附近确认按钮后直接点击，省去等待新截图和全屏匹配。
+点击效果在后台验证（使用调用方之后本来就会截取的帧）：按钮区域没有变化时作废缓存并通知调用方
+重新检测场景；已经发出的点击不会再补点，避免重复输入
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from core.adb_controller import ADBController
+from core.frame import Frame, Region
+from core.frame_waiter import wait_for_any, RoiChangeCondition
+from core.image_matcher import image_matcher
+
+logger = logging.getLogger("zat.tap")
+
+# 连续在同一位置匹配成功多少次后允许盲点
+STABLE_HITS = 3
+# 位置容差（像素）
+POSITION_TOLERANCE = 4
+# 验证基准帧（点击前的画面）的最大年龄（秒），没有足够新的画面时不盲点
+MAX_BASELINE_AGE = 2.0
+# 点击后等待按钮区域变化的最长时间（秒）
+VERIFY_TIMEOUT = 1.5
+# 按钮区域的最小变化量（0-1）
+VERIFY_CHANGE = 0.05
+# 按钮区域外扩（像素）
+REGION_PADDING = 20
+
+
+@dataclass
+class TapCacheStats:
+    """盲点统计"""
+    blind_taps: int = 0          # 盲点次数（每次省去等待新截图和全屏匹配）
+    verified: int = 0            # 验证通过次数
+    failed: int = 0              # 验证失败（缓存作废）次数
+
+    def to_dict(self) -> dict:
+        return {
+            "blind_taps": self.blind_taps,
+            "verified": self.verified,
+            "failed": self.failed,
+        }
+
+
+@dataclass
+class _Entry:
+    x: int
+    y: int
+    hits: int = 1
+
+
+class TapCache:
+    """盲点缓存"""
+
+    def __init__(self, adb: ADBController, on_miss: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            on_miss: 盲点验证失败时调用（参数为模板名），用于让调用方重新检测场景
+        """
+        self.adb = adb
+        self.on_miss = on_miss
+        self.stats = TapCacheStats()
+        self._entries: dict[str, _Entry] = {}
+        # 后台验证任务（保留引用，避免被回收）
+        self._verifying: set[asyncio.Task] = set()
+
+    def observe(self, template: str, x: int, y: int):
+        """记录一次匹配成功的位置"""
+        entry = self._entries.get(template)
+        if entry and abs(entry.x - x) <= POSITION_TOLERANCE and abs(entry.y - y) <= POSITION_TOLERANCE:
+            entry.hits += 1
+        else:
+            self._entries[template] = _Entry(x, y)
+
+    def position(self, template: str) -> Optional[tuple[int, int]]:
+        """已稳定的位置，未稳定返回 None"""
+        entry = self._entries.get(template)
+        if entry is None or entry.hits < STABLE_HITS:
+            return None
+        return entry.x, entry.y
+
+    def invalidate(self, template: str):
+        self._entries.pop(template, None)
+
+    def _region(self, template: str, x: int, y: int) -> Region:
+        th, tw = image_matcher.templates[template].shape[:2]
+        return (
+            x - tw // 2 - REGION_PADDING,
+            y - th // 2 - REGION_PADDING,
+            tw + 2 * REGION_PADDING,
+            th + 2 * REGION_PADDING,
+        )
+
+    async def tap(self, template: str, threshold: float = 0.7) -> bool:
+        """
+        尝试盲点
+
+        只有基准帧（最近一帧）是最近一次输入之后的画面、且按钮仍在原位时才点击，
+        点击后立即返回，效果在后台验证
+
+        Returns:
+            已点击返回 True；位置未稳定、没有可用的基准帧或基准帧上看不到按钮时返回 False（由调用方走正常流程）
+        """
+        position = self.position(template)
+        pipeline = self.adb.pipeline
+        baseline = pipeline.latest
+        if (position is None or baseline is None or baseline.age > MAX_BASELINE_AGE
+                or baseline.timestamp <= pipeline.last_input):
+            return False
+
+        x, y = position
+        region = self._region(template, x, y)
+        # 只匹配按钮区域，开销很小
+        if not image_matcher.match_template(baseline, template, threshold=threshold, region=region):
+            return False
+
+        tapped_at = time.monotonic()
+        await self.adb.tap(x, y)
+        self.stats.blind_taps += 1
+        logger.debug(f"盲点: {template} at ({x}, {y})")
+
+        task = asyncio.ensure_future(self._verify(template, baseline, region, tapped_at))
+        self._verifying.add(task)
+        task.add_done_callback(self._verifying.discard)
+        return True
+
+    async def _verify(self, template: str, baseline: Frame, region: Region, tapped_at: float):
+        """
+        验证点击效果：按钮区域相对基准帧发生变化
+
+        流水线会复用调用方同时在截取的帧，调用方空闲时才额外截图
+        """
+        try:
+            changed = await wait_for_any(
+                self.adb.pipeline,
+                [RoiChangeCondition(region, threshold=VERIFY_CHANGE, baseline=baseline)],
+                VERIFY_TIMEOUT,
+                max_interval=0.3,
+                after=tapped_at,
+            )
+        except Exception as e:
+            logger.debug(f"盲点验证中断: {template}: {e}")
+            return
+
+        if changed:
+            self.stats.verified += 1
+            return
+
+        self.stats.failed += 1
+        self.invalidate(template)
+        logger.info(f"盲点未生效，作废缓存: {template}")
+        if self.on_miss:
+            self.on_miss(template)
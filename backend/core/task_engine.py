@@ -1,55 +1,293 @@
 """
 任务引擎
 负责执行自动化任务流程
+
+任务流程是一张有依赖的任务图（启动游戏、导航、运行副本计划、领取奖励、保存数据……），
+每个任务可设定优先级、超时和重试策略。依赖全部完成的任务立即就绪：
+- 需要操作设备的任务串行执行（设备空闲时从就绪任务中选优先级最高的）
+- 只在本机执行的任务（如保存数据）不占用设备，与设备任务同时执行
+依赖失败的任务不会执行（标记为 skipped），不相关的分支继续执行
 """
 import asyncio
+import heapq
+import itertools
 import logging
-from typing import Optional
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Awaitable, Callable, Optional
 
 from core.adb_controller import ADBController
+from core.battle_telemetry import battle_telemetry
+from core.dungeon_runner import DungeonRunner
+from core.game_launcher import GameLauncher
+from core.game_navigator import GameNavigator
+from core.history_store import history_store
+from core.image_matcher import image_matcher
+from core.result_screen import result_parser
+from core.run_plan import PlanEntry, plan_runs
+from core.scene_classifier import scene_classifier
+from core.scene_graph import SCENES, transition_stats
+from core.scene_model import scene_model
 from utils.logger import LogBroadcaster
+from utils.storage import data_path, load_json
 
 logger = logging.getLogger("zat.task")
 
+# 用户自定义任务图（任务名 -> 任务列表），与内置任务图同名时覆盖内置任务图
+GRAPHS_FILE = "task_graphs.json"
+# 领取奖励时最多点击的次数（防止一直能识别到同一个按钮时无限点击）
+MAX_REWARD_TAPS = 20
+
+
+class TaskError(Exception):
+    """任务执行失败（可按重试策略重试）"""
+    pass
+
+
+class TaskKind(str, Enum):
+    """任务类型"""
+    LAUNCH_GAME = "launch_game"            # 启动游戏并等待进入 {timeout}
+    NAVIGATE = "navigate"                  # 导航到场景 {scene}
+    RUN_PLAN = "run_plan"                  # 运行副本计划 {entries: [{dungeon_id, difficulty, count}]}
+    COLLECT_REWARDS = "collect_rewards"    # 在场景中点击领取按钮直到没有可领取的 {scene, templates}
+    PERSIST = "persist"                    # 保存运行数据（只在本机执行，不占用设备）
+
+
+class TaskStatus(str, Enum):
+    """任务状态"""
+    PENDING = "pending"        # 等待依赖完成
+    READY = "ready"            # 依赖已完成，等待设备空闲
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    SKIPPED = "skipped"        # 依赖失败，不执行
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略：失败后等待 delay * backoff^(第几次重试 - 1) 秒再试，最多执行 max_attempts 次"""
+    max_attempts: int = 1
+    delay: float = 2.0
+    backoff: float = 2.0
+
+    def wait(self, attempt: int) -> float:
+        return self.delay * self.backoff ** (attempt - 1)
+
+
+@dataclass
+class TaskSpec:
+    """任务定义"""
+    id: str
+    kind: TaskKind
+    params: dict = field(default_factory=dict)
+    depends_on: list[str] = field(default_factory=list)
+    priority: int = 0                    # 越大越先执行（同时就绪时）
+    timeout: Optional[float] = None      # 单次执行超时（秒），None 不限制
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TaskSpec":
+        """从配置解析（类型或字段无效时抛出 ValueError）"""
+        try:
+            kind = TaskKind(data["kind"])
+            retry = data.get("retry") or {}
+            return cls(
+                id=str(data.get("id") or kind.value),
+                kind=kind,
+                params=dict(data.get("params") or {}),
+                depends_on=list(data.get("depends_on") or []),
+                priority=int(data.get("priority", 0)),
+                timeout=float(data["timeout"]) if data.get("timeout") is not None else None,
+                retry=RetryPolicy(
+                    max_attempts=max(1, int(retry.get("max_attempts", 1))),
+                    delay=float(retry.get("delay", 2.0)),
+                    backoff=float(retry.get("backoff", 2.0)),
+                ),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"任务定义无效: {data}: {e}") from e
+
+
+@dataclass
+class TaskRun:
+    """任务的执行状态"""
+    spec: TaskSpec
+    status: TaskStatus = TaskStatus.PENDING
+    attempts: int = 0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.spec.id,
+            "kind": self.spec.kind.value,
+            "params": self.spec.params,
+            "depends_on": self.spec.depends_on,
+            "priority": self.spec.priority,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "duration": round(self.finished - self.started, 2) if self.started and self.finished else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# 任务处理函数：接收任务参数，返回可 JSON 序列化的结果，失败时抛出异常
+TaskHandler = Callable[[dict], Awaitable[Any]]
+
+
+# 内置任务图
+DEFAULT_GRAPHS: dict[str, list[dict]] = {
+    "farming": [
+        {"id": "launch", "kind": "launch_game", "params": {"timeout": 60}, "priority": 10,
+         "timeout": 90, "retry": {"max_attempts": 2, "delay": 5}},
+        {"id": "to_dungeons", "kind": "navigate", "params": {"scene": "dungeon_list"}, "depends_on": ["launch"],
+         "timeout": 30, "retry": {"max_attempts": 3, "delay": 2}},
+        {"id": "dungeons", "kind": "run_plan", "depends_on": ["to_dungeons"], "params": {"entries": [
+            {"dungeon_id": "sea_palace", "difficulty": "normal", "count": 1},
+            {"dungeon_id": "mizumoto_shrine", "difficulty": "normal", "count": 1},
+        ]}},
+        {"id": "save", "kind": "persist", "depends_on": ["dungeons"]},
+        {"id": "home", "kind": "navigate", "params": {"scene": "home"}, "depends_on": ["dungeons"],
+         "timeout": 30, "retry": {"max_attempts": 2}},
+    ],
+}
+
+
+def parse_graph(tasks: list[dict]) -> list[TaskSpec]:
+    """
+    解析并校验任务图（ID 重复、依赖不存在、存在环时抛出 ValueError）
+
+    Returns:
+        任务列表（按拓扑序）
+    """
+    specs = [TaskSpec.from_dict(task) for task in tasks]
+    by_id: dict[str, TaskSpec] = {}
+    for spec in specs:
+        if spec.id in by_id:
+            raise ValueError(f"任务 ID 重复: {spec.id}")
+        by_id[spec.id] = spec
+    for spec in specs:
+        for dependency in spec.depends_on:
+            if dependency not in by_id:
+                raise ValueError(f"任务 {spec.id} 依赖的任务不存在: {dependency}")
+
+    # Kahn 算法检查环
+    indegree = {spec.id: len(spec.depends_on) for spec in specs}
+    dependents: dict[str, list[str]] = {spec.id: [] for spec in specs}
+    for spec in specs:
+        for dependency in spec.depends_on:
+            dependents[dependency].append(spec.id)
+    queue = [task_id for task_id, degree in indegree.items() if degree == 0]
+    order = []
+    while queue:
+        task_id = queue.pop()
+        order.append(task_id)
+        for dependent in dependents[task_id]:
+            indegree[dependent] -= 1
+            if indegree[dependent] == 0:
+                queue.append(dependent)
+    if len(order) != len(specs):
+        cyclic = sorted(task_id for task_id, degree in indegree.items() if degree > 0)
+        raise ValueError(f"任务依赖存在环: {', '.join(cyclic)}")
+    return [by_id[task_id] for task_id in order]
+
 
 class TaskEngine:
     """任务引擎 - 负责自动化任务的执行"""
-    
-    def __init__(self, adb: ADBController, log_broadcaster: LogBroadcaster):
+
+    def __init__(
+        self,
+        adb: ADBController,
+        log_broadcaster: LogBroadcaster,
+        navigator: Optional[GameNavigator] = None,
+        dungeon_runner: Optional[DungeonRunner] = None,
+        game_launcher: Optional[GameLauncher] = None,
+    ):
         self.adb = adb
         self.log_broadcaster = log_broadcaster
-        
+        self.navigator = navigator
+        self.dungeon_runner = dungeon_runner
+        self.game_launcher = game_launcher
+
         self.current_state: Optional[str] = None
-        self.loop_count: int = 0
+        self.task_name: Optional[str] = None
+        self.runs: dict[str, TaskRun] = {}
         self._running: bool = False
         self._task: Optional[asyncio.Task] = None
-    
+        # 任务类型 -> (处理函数, 是否占用设备, 超时时调用的中断函数)
+        self._handlers: dict[TaskKind, tuple[TaskHandler, bool, Optional[Callable[[], None]]]] = {}
+
+        self.register(TaskKind.LAUNCH_GAME, self._launch_game)
+        self.register(TaskKind.NAVIGATE, self._navigate)
+        self.register(TaskKind.RUN_PLAN, self._run_plan, interrupt=self._stop_dungeon)
+        self.register(TaskKind.COLLECT_REWARDS, self._collect_rewards)
+        self.register(TaskKind.PERSIST, self._persist, device=False)
+
+    def register(
+        self,
+        kind: TaskKind,
+        handler: TaskHandler,
+        device: bool = True,
+        interrupt: Optional[Callable[[], None]] = None,
+    ):
+        """
+        注册任务处理函数
+
+        Args:
+            device: 是否需要操作设备（需要的任务串行执行）
+            interrupt: 超时或停止时调用，让处理函数在检查点自行结束
+        """
+        self._handlers[kind] = (handler, device, interrupt)
+
     def is_running(self) -> bool:
         """检查任务是否正在运行"""
         return self._running
-    
-    async def start(self, task_name: str):
-        """启动任务"""
+
+    def graph(self, task_name: str) -> list[dict]:
+        """获取任务图配置（数据目录中的自定义任务图优先）"""
+        custom = load_json(data_path(GRAPHS_FILE), default={})
+        if isinstance(custom, dict) and task_name in custom:
+            return custom[task_name]
+        if task_name in DEFAULT_GRAPHS:
+            return DEFAULT_GRAPHS[task_name]
+        raise ValueError(f"未知任务: {task_name}")
+
+    async def start(self, task_name: str, tasks: Optional[list[dict]] = None):
+        """
+        启动任务
+
+        Args:
+            task_name: 任务名
+            tasks: 任务图，None 时按任务名加载配置
+        """
         if self._running:
             raise RuntimeError("任务已在运行")
-        
+
+        specs = parse_graph(tasks if tasks is not None else self.graph(task_name))
+
         self._running = True
-        self.loop_count = 0
+        self.task_name = task_name
+        self.runs = {spec.id: TaskRun(spec) for spec in specs}
         self.current_state = "STARTING"
-        
+
         # 创建任务
         self._task = asyncio.create_task(self._run_task(task_name))
-        
-        logger.info(f"任务引擎已启动: {task_name}")
-    
+
+        logger.info(f"任务引擎已启动: {task_name}（{len(specs)} 个任务）")
+
     async def stop(self):
         """停止任务"""
         if not self._running:
             return
-        
+
         self._running = False
         self.current_state = "STOPPING"
-        
+
         # 取消任务
         if self._task:
             self._task.cancel()
@@ -57,28 +295,33 @@ class TaskEngine:
                 await self._task
             except asyncio.CancelledError:
                 pass
-        
+
         self.current_state = "STOPPED"
         logger.info("任务引擎已停止")
-    
+
+    def status(self) -> dict:
+        """任务引擎状态和各任务的执行情况"""
+        return {
+            "task": self.task_name,
+            "running": self._running,
+            "state": self.current_state,
+            "tasks": [run.to_dict() for run in self.runs.values()],
+        }
+
     async def _run_task(self, task_name: str):
         """运行任务（内部方法）"""
         try:
             logger.info(f"开始执行任务: {task_name}")
-            
-            # TODO: 加载任务配置
-            # TODO: 执行任务流程
-            
-            # 临时：简单的测试循环
-            while self._running:
-                self.current_state = "RUNNING"
-                self.loop_count += 1
-                
-                logger.info(f"任务循环 #{self.loop_count}")
-                
-                # 模拟任务执行
-                await asyncio.sleep(5)
-            
+            self.current_state = "RUNNING"
+            await self._schedule()
+
+            failed = [run.spec.id for run in self.runs.values() if run.status in (TaskStatus.FAILED, TaskStatus.SKIPPED)]
+            self.current_state = "FAILED" if failed else "COMPLETED"
+            if failed:
+                logger.warning(f"任务 {task_name} 结束，未完成: {', '.join(failed)}")
+            else:
+                logger.info(f"任务 {task_name} 全部完成")
+
         except asyncio.CancelledError:
             logger.info("任务已取消")
             raise
@@ -86,4 +329,222 @@ class TaskEngine:
             logger.error(f"任务执行失败: {e}", exc_info=True)
             self.current_state = "ERROR"
         finally:
+            for run in self.runs.values():
+                if run.status in (TaskStatus.PENDING, TaskStatus.READY, TaskStatus.RUNNING):
+                    run.status = TaskStatus.CANCELLED
             self._running = False
+
+    # ==================== 调度 ====================
+
+    async def _schedule(self):
+        """
+        按依赖调度任务图
+
+        依赖全部完成的任务进入就绪队列；设备任务同一时间只执行一个，设备空闲时选优先级最高的，
+        本机任务就绪后立即执行
+        """
+        remaining = {task_id: len(run.spec.depends_on) for task_id, run in self.runs.items()}
+        dependents: dict[str, list[str]] = {task_id: [] for task_id in self.runs}
+        for run in self.runs.values():
+            for dependency in run.spec.depends_on:
+                dependents[dependency].append(run.spec.id)
+
+        # (-优先级, 就绪顺序, 任务 ID)
+        ready: list[tuple[int, int, str]] = []
+        sequence = itertools.count()
+        running: dict[asyncio.Task, str] = {}
+        device_busy = False
+
+        def make_ready(task_id: str):
+            self.runs[task_id].status = TaskStatus.READY
+            heapq.heappush(ready, (-self.runs[task_id].spec.priority, next(sequence), task_id))
+
+        def skip(task_id: str, reason: str):
+            for dependent in dependents[task_id]:
+                run = self.runs[dependent]
+                if run.status == TaskStatus.PENDING:
+                    run.status = TaskStatus.SKIPPED
+                    run.error = reason
+                    logger.info(f"跳过任务 {dependent}: {reason}")
+                    skip(dependent, reason)
+
+        for task_id, count in remaining.items():
+            if count == 0:
+                make_ready(task_id)
+
+        try:
+            while ready or running:
+                # 本机任务立即执行，设备任务在设备空闲时执行优先级最高的一个
+                deferred = []
+                while ready:
+                    entry = heapq.heappop(ready)
+                    task_id = entry[2]
+                    device = self._handlers[self.runs[task_id].spec.kind][1]
+                    if device and device_busy:
+                        deferred.append(entry)
+                        continue
+                    device_busy = device_busy or device
+                    running[asyncio.create_task(self._execute(self.runs[task_id]))] = task_id
+                for entry in deferred:
+                    heapq.heappush(ready, entry)
+
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task_id = running.pop(task)
+                    run = self.runs[task_id]
+                    if self._handlers[run.spec.kind][1]:
+                        device_busy = False
+
+                    if run.status == TaskStatus.COMPLETED:
+                        for dependent in dependents[task_id]:
+                            remaining[dependent] -= 1
+                            if remaining[dependent] == 0 and self.runs[dependent].status == TaskStatus.PENDING:
+                                make_ready(dependent)
+                    else:
+                        skip(task_id, f"依赖的任务 {task_id} 未完成")
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def _execute(self, run: TaskRun):
+        """执行单个任务（按重试策略重试，结果写入 run）"""
+        spec = run.spec
+        handler, _, interrupt = self._handlers[spec.kind]
+        run.status = TaskStatus.RUNNING
+        run.started = time.monotonic()
+
+        try:
+            while True:
+                run.attempts += 1
+                logger.info(f"执行任务 {spec.id} ({spec.kind.value})，第 {run.attempts} 次")
+                try:
+                    run.result = await self._attempt(handler, spec, interrupt)
+                    run.status = TaskStatus.COMPLETED
+                    run.error = None
+                    logger.info(f"任务完成: {spec.id}")
+                    return
+                except asyncio.TimeoutError:
+                    run.error = f"超时（{spec.timeout}s）"
+                except Exception as e:
+                    run.error = str(e) or type(e).__name__
+
+                if run.attempts >= spec.retry.max_attempts:
+                    run.status = TaskStatus.FAILED
+                    logger.error(f"任务失败: {spec.id}: {run.error}")
+                    return
+
+                wait = spec.retry.wait(run.attempts)
+                logger.warning(f"任务 {spec.id} 失败: {run.error}，{wait:.1f}s 后重试")
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            run.status = TaskStatus.CANCELLED
+            raise
+        finally:
+            run.finished = time.monotonic()
+
+    @staticmethod
+    async def _attempt(handler: TaskHandler, spec: TaskSpec, interrupt: Optional[Callable[[], None]]) -> Any:
+        """
+        执行一次处理函数
+
+        超时或被取消时先调用 interrupt 让处理函数在当前步骤结束后自行停止，再取消协程
+        """
+        task = asyncio.create_task(handler(spec.params))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), spec.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if interrupt:
+                interrupt()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+
+    # ==================== 任务处理函数 ====================
+
+    def _require(self, component, name: str):
+        if component is None:
+            raise TaskError(f"{name}未初始化")
+        return component
+
+    async def _launch_game(self, params: dict) -> dict:
+        launcher = self._require(self.game_launcher, "游戏启动器")
+        if await launcher.is_running():
+            return {"already_running": True}
+
+        result = await launcher.start(wait_ready=True, timeout=int(params.get("timeout", 60)))
+        if not result.get("success") or not result.get("entered"):
+            raise TaskError(result.get("message") or "启动游戏失败")
+        return {"already_running": False}
+
+    async def _navigate(self, params: dict) -> dict:
+        navigator = self._require(self.navigator, "导航器")
+        scene = params.get("scene")
+        if scene not in SCENES:
+            raise TaskError(f"未知场景: {scene}")
+        if not await navigator.navigate_to(scene):
+            raise TaskError(f"导航到 {SCENES[scene].name} 失败")
+        return {"scene": scene}
+
+    async def _run_plan(self, params: dict) -> dict:
+        runner = self._require(self.dungeon_runner, "副本执行器")
+        if runner.is_running:
+            raise TaskError("副本任务正在运行中")
+
+        entries = [
+            PlanEntry(e["dungeon_id"], e.get("difficulty", "normal"), int(e.get("count", 1)))
+            for e in params.get("entries", [])
+        ]
+        plan = plan_runs(entries, self.navigator.get_current_scene() if self.navigator else None)
+        # 引擎负责重试，不写检查点：后端重启时不会把引擎的计划当作独立任务继续
+        result = await runner.run_plan(plan, use_checkpoint=False)
+        if result.stopped:
+            raise TaskError(f"副本运行被停止（完成 {result.completed}/{plan.total} 次）")
+        if plan.total and result.completed == 0:
+            raise TaskError(f"副本全部失败（{result.failed} 次）")
+        return {"total": result.total, "completed": result.completed, "failed": result.failed, "ranks": result.ranks}
+
+    def _stop_dungeon(self):
+        if self.dungeon_runner:
+            self.dungeon_runner.stop()
+
+    async def _collect_rewards(self, params: dict) -> dict:
+        """在场景中反复点击可见的领取按钮，直到一个都看不到"""
+        templates = [t for t in params.get("templates", []) if t in image_matcher.templates]
+        if not templates:
+            raise TaskError("没有可用的领取按钮模板")
+        if params.get("scene"):
+            await self._navigate({"scene": params["scene"]})
+
+        pipeline = self.adb.pipeline
+        taps = 0
+        while taps < MAX_REWARD_TAPS:
+            frame = await pipeline.next_frame(after=pipeline.last_input)
+            match = next(
+                (m for m in (image_matcher.match_template(frame, t, threshold=0.7) for t in templates) if m),
+                None,
+            )
+            if match is None:
+                break
+            await self.adb.tap(match[0], match[1])
+            taps += 1
+            await asyncio.sleep(float(params.get("interval", 0.8)))
+        return {"taps": taps}
+
+    async def _persist(self, params: dict) -> dict:
+        """保存运行数据（等待运行历史写入完成，并把转移统计、场景模型、场景索引、战斗阶段时长、结算界面统计和战斗时间线写入文件）"""
+        # 这两个文件很小，且统计数据由事件循环中的导航修改，在事件循环中写入
+        transition_stats.flush()
+        scene_model.flush()
+        scene_classifier.flush()
+        if self.dungeon_runner:
+            self.dungeon_runner.battle_loop.timings.flush()
+        result_parser.flush()
+        battle_telemetry.flush()
+        if not await asyncio.to_thread(history_store.flush):
+            raise TaskError("运行历史未写完")
+        return {"saved": True}
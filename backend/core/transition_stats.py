@@ -0,0 +1,116 @@
+"""
+场景转移统计
+记录每条转移的实际耗时和失败率，用于按期望耗时寻路
+"""
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from utils.storage import data_path, load_json, save_json
+
+logger = logging.getLogger("zat.scene")
+
+STATS_FILE = "transition_stats.json"
+
+
+@dataclass
+class EdgeStats:
+    """单条转移的统计"""
+    count: int = 0                # 执行次数
+    failures: int = 0             # 失败次数
+    avg_duration: float = 0.0     # 成功执行的平均耗时（指数滑动平均，秒）
+
+    # 滑动平均系数，越大越偏向最近的测量
+    ALPHA = 0.3
+    # 成功率先验：相当于预先观察到 PRIOR_WEIGHT 次、成功率为 PRIOR_SUCCESS 的样本
+    PRIOR_SUCCESS = 0.95
+    PRIOR_WEIGHT = 2.0
+
+    def record(self, duration: float, success: bool):
+        self.count += 1
+        if not success:
+            self.failures += 1
+            return
+
+        successes = self.count - self.failures
+        if successes == 1:
+            self.avg_duration = duration
+        else:
+            self.avg_duration += self.ALPHA * (duration - self.avg_duration)
+
+    @property
+    def success_rate(self) -> float:
+        """成功率（带先验平滑，样本少时接近 PRIOR_SUCCESS）"""
+        successes = self.count - self.failures
+        return (successes + self.PRIOR_SUCCESS * self.PRIOR_WEIGHT) / (self.count + self.PRIOR_WEIGHT)
+
+    def expected_cost(self, prior: float) -> float:
+        """
+        期望耗时：单次耗时 / 成功率（失败后需要重试）
+
+        Args:
+            prior: 没有成功样本时使用的先验耗时
+        """
+        duration = self.avg_duration if self.count > self.failures else prior
+        return duration / max(self.success_rate, 0.1)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "avg_duration": round(self.avg_duration, 3),
+        }
+
+
+class TransitionStatsStore:
+    """转移统计存储（持久化到数据目录）"""
+
+    # 最短保存间隔（秒），避免每次转移都写文件
+    SAVE_INTERVAL = 10.0
+
+    def __init__(self, filename: str = STATS_FILE):
+        self._path = data_path(filename)
+        self._edges: dict[str, EdgeStats] = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+
+    @staticmethod
+    def _key(from_scene: str, to_scene: str) -> str:
+        return f"{from_scene}->{to_scene}"
+
+    def _load(self):
+        data = load_json(self._path, default={})
+        for key, value in data.items():
+            try:
+                self._edges[key] = EdgeStats(**value)
+            except TypeError:
+                logger.warning(f"忽略无效的转移统计: {key}")
+        if self._edges:
+            logger.info(f"已加载 {len(self._edges)} 条转移统计")
+
+    def get(self, from_scene: str, to_scene: str) -> Optional[EdgeStats]:
+        return self._edges.get(self._key(from_scene, to_scene))
+
+    def record(self, from_scene: str, to_scene: str, duration: float, success: bool) -> EdgeStats:
+        """记录一次转移结果"""
+        key = self._key(from_scene, to_scene)
+        stats = self._edges.setdefault(key, EdgeStats())
+        stats.record(duration, success)
+        self._dirty = True
+
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.flush()
+        return stats
+
+    def flush(self):
+        """将未保存的统计写入文件"""
+        if not self._dirty:
+            return
+        try:
+            save_json(self._path, {key: asdict(stats) for key, stats in self._edges.items()})
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"保存转移统计失败: {e}")
@@ -3,19 +3,34 @@ ZAT Python Backend
 FastAPI + WebSocket + ADB Controller
 """
 import asyncio
+import json
 import logging
+import time
 from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Header
 from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, Field
 
 from core.adb_controller import ADBController
+from core.buffer_pool import frame_pool
 from core.task_engine import TaskEngine
 from core.game_navigator import GameNavigator
-from core.dungeon_runner import DungeonRunner
+from core.dungeon_runner import DungeonRunner, DungeonResult, DungeonRunResult, DUNGEON_NAMES, DIFFICULTY_NAMES
+from core.history_store import history_store
+from core.job_manager import Job, job_manager
+from core.run_checkpoint import RunCheckpoint, run_checkpoint
+from core.run_plan import PlanEntry, RunPlan, plan_runs
 from core.game_launcher import GameLauncher
-from core.scene_graph import SCENES
+from core.scene_graph import SCENES, get_route_table, transition_stats
+from core.scene_classifier import scene_classifier
+from core.scene_model import scene_model
+from core.result_screen import result_parser
+from core.battle_telemetry import battle_telemetry
+from core.preview import PREVIEW_FORMATS, PreviewConfig, parse_roi, clip_roi, preview_etag, encode_preview
 from utils.logger import setup_logger, LogBroadcaster
 
 # 全局实例
@@ -38,9 +53,6 @@ async def lifespan(app: FastAPI):
     # 初始化 ADB 控制器
     adb_controller = ADBController()
     
-    # 初始化任务引擎
-    task_engine = TaskEngine(adb_controller, log_broadcaster)
-    
     # 初始化游戏导航器
     game_navigator = GameNavigator(adb_controller)
     
@@ -50,21 +62,55 @@ async def lifespan(app: FastAPI):
     # 初始化游戏启动器
     game_launcher = GameLauncher(adb_controller)
     
+    # 初始化任务引擎
+    task_engine = TaskEngine(adb_controller, log_broadcaster, game_navigator, dungeon_runner, game_launcher)
+    
+    # 打开运行历史（读取已有的最大 ID，处理上次未结束的记录）
+    await asyncio.to_thread(history_store.start)
+    # 加载场景指纹索引
+    await asyncio.to_thread(scene_classifier.load)
+    
     logger.info("ZAT Backend 启动完成")
     
+    # 上次关闭 / 崩溃时有未完成的循环或计划：连接设备后从检查点继续
+    if run_checkpoint.load():
+        asyncio.create_task(_resume_on_startup())
+    
     yield
     
     # 清理资源
     logger.info("ZAT Backend 关闭中...")
     if dungeon_runner:
-        dungeon_runner.stop()
+        # 保留检查点，下次启动时继续
+        dungeon_runner.stop(keep_checkpoint=True)
+    await job_manager.shutdown()
+    # 先停任务引擎（引擎的持久化任务还会写历史），再关闭历史库
     if task_engine:
         await task_engine.stop()
+    await asyncio.to_thread(history_store.close)
     if game_launcher:
         await game_launcher.stop()
+    transition_stats.flush()
+    scene_model.flush()
+    scene_classifier.flush()
+    if dungeon_runner:
+        dungeon_runner.battle_loop.timings.flush()
+    result_parser.flush()
+    battle_telemetry.flush()
     logger.info("ZAT Backend 已关闭")
 
 
+async def _resume_on_startup():
+    """启动时自动连接设备并从检查点继续；找不到设备时在 /connect 成功后继续"""
+    try:
+        if await adb_controller.auto_discover():
+            _resume_checkpoint()
+        else:
+            logger.info("有未完成的运行检查点，连接设备后继续")
+    except Exception as e:
+        logger.warning(f"从检查点继续失败: {e}")
+
+
 app = FastAPI(title="ZAT Backend", version="0.1.0", lifespan=lifespan)
 
 # CORS 配置（仅本地）
@@ -74,6 +120,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
@@ -91,6 +138,7 @@ async def connect_device():
         device = await adb_controller.auto_discover()
         if device:
             logger.info(f"已连接设备: {device}")
+            _resume_checkpoint()
             
             # 获取屏幕分辨率
             try:
@@ -133,21 +181,42 @@ async def get_status():
     }
 
 
+class TaskGraphRequest(BaseModel):
+    tasks: list[dict] = Field(min_length=1)
+
+
 @app.post("/task-engine/start")
-async def start_task_engine(task_name: str = "farming"):
-    """启动任务引擎（自动化）"""
+async def start_task_engine(task_name: str = "farming", request: Optional[TaskGraphRequest] = None):
+    """
+    启动任务引擎（自动化）
+    
+    Args:
+        task_name: 任务名（没有请求体时按任务名加载任务图：data/task_graphs.json 或内置任务图）
+        request: 任务图 {"tasks": [...]}
+    """
     if not adb_controller.is_connected():
         raise HTTPException(status_code=400, detail="设备未连接")
+    if task_engine.is_running():
+        raise HTTPException(status_code=409, detail="任务已在运行")
+    if dungeon_runner.is_running or job_manager.active("dungeon"):
+        raise HTTPException(status_code=409, detail="副本任务正在运行中")
     
     try:
-        await task_engine.start(task_name)
-        logger.info(f"任务引擎已启动: {task_name}")
-        return {"success": True, "task": task_name}
+        await task_engine.start(task_name, request.tasks if request else None)
+        return {"success": True, "task": task_name, "tasks": [run["id"] for run in task_engine.status()["tasks"]]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"启动任务引擎失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/task-engine")
+async def get_task_engine_status():
+    """任务引擎状态和各任务的执行情况"""
+    return task_engine.status()
+
+
 @app.post("/task-engine/stop")
 async def stop_task_engine():
     """停止任务引擎（自动化）"""
@@ -191,19 +260,72 @@ async def stop_game():
 
 
 @app.get("/debug/screenshot")
-async def get_screenshot(gray: bool = False):
-    """获取当前截图（仅 Debug 模式）"""
+async def get_screenshot(
+    gray: bool = False,
+    quality: int = Query(65, ge=1, le=100),
+    scale: float = Query(1.0, gt=0, le=1.0),
+    roi: Optional[str] = None,
+    fmt: str = Query("jpeg", pattern="^(jpeg|webp)$"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    获取当前截图（仅 Debug 模式）
+    
+    Args:
+        gray: 是否输出灰度图
+        quality: 编码质量 (1-100)
+        scale: 缩放比例 (0, 1]
+        roi: 裁剪区域 "x,y,w,h"（截断到画面范围内，与画面没有重叠时返回 400）
+        fmt: 编码格式 (jpeg, webp)
+    
+    画面未变化时（If-None-Match 与当前 ETag 相同）返回 304，不重新编码
+    """
     if not adb_controller.is_connected():
         raise HTTPException(status_code=400, detail="设备未连接")
     
     try:
-        screenshot = await adb_controller.screencap(gray=gray)
-        return Response(content=screenshot, media_type="image/jpeg")
+        region = parse_roi(roi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # 自动化运行时复用流水线中的新鲜帧，不额外截图
+        frame = await adb_controller.pipeline.next_frame(prefetch=False)
+        try:
+            region = clip_roi(frame, region)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params = dict(fmt=fmt, quality=quality, scale=scale, roi=region, gray=gray)
+        
+        etag = await asyncio.to_thread(preview_etag, frame, **params)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match == etag:
+            return Response(status_code=304, headers=headers)
+        
+        content = await asyncio.to_thread(encode_preview, frame, **params)
+        return Response(content=content, media_type=PREVIEW_FORMATS[fmt][2], headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"截图失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/debug/pipeline")
+async def get_pipeline_stats():
+    """获取截图流水线统计（重叠节省的延迟等）"""
+    if not adb_controller:
+        return {"pipelined": False, "stats": {}}
+    pipeline = adb_controller.pipeline
+    return {
+        "pipelined": pipeline.pipelined,
+        "capture_mode": adb_controller.capture_mode,
+        "stats": pipeline.stats.to_dict(),
+        "pool": {**frame_pool.stats.to_dict(), "pooled_bytes": frame_pool.pooled_bytes},
+        "blind_tap": game_navigator.tap_cache.stats.to_dict() if game_navigator else {},
+    }
+
+
 @app.get("/dungeons")
 async def get_dungeons():
     """获取可用副本列表"""
@@ -242,6 +364,8 @@ async def navigate_to_dungeon(dungeon_id: str, difficulty: str = "normal"):
     """
     if not adb_controller.is_connected():
         raise HTTPException(status_code=400, detail="设备未连接")
+    if _automation_running():
+        raise HTTPException(status_code=409, detail="自动化正在运行中")
     
     try:
         target_scene = f"dungeon:{dungeon_id}"
@@ -257,7 +381,7 @@ async def navigate_to_dungeon(dungeon_id: str, difficulty: str = "normal"):
 
 @app.post("/run-dungeon")
 async def run_dungeon(dungeon_id: str, difficulty: str = "normal", count: int = 1):
-    # 执行副本
+    # 提交副本任务（后台执行，立即返回任务 ID）
     # 
     # Args:
     #     dungeon_id: 副本ID (world_tree, mount_mechagod, sea_palace, mizumoto_shrine)
@@ -265,76 +389,311 @@ async def run_dungeon(dungeon_id: str, difficulty: str = "normal", count: int =
     #     count: 执行次数，1 为单次，>1 为循环，-1 为无限循环
     # 
     # Returns:
-    #     单次: {"success": bool, "rank": str | None, "message": str}
-    #     多次: {"total": int, "completed": int, "failed": int, "ranks": list}
+    #     {"job_id": str, "status": str}，进度和结果通过 /jobs/{job_id} 或 /ws/jobs 获取
     if not adb_controller.is_connected():
         raise HTTPException(status_code=400, detail="设备未连接")
+    if task_engine.is_running():
+        raise HTTPException(status_code=409, detail="任务引擎正在运行中")
+    if dungeon_runner.is_running or job_manager.active("dungeon"):
+        raise HTTPException(status_code=409, detail="副本任务正在运行中")
+    
+    if count != 1:
+        # count > 1 或 count == -1（无限循环）
+        job = _submit_loop(dungeon_id, difficulty, count)
+        return {"job_id": job.id, "status": job.status.value}
+    
+    async def run(job: Job):
+        result = await dungeon_runner.run_once(dungeon_id, difficulty)
+        job_manager.report(job, iteration=1, completed=int(result.success), failed=int(not result.success))
+        _mark_stopped(job, result.stopped)
+        return {
+            "success": result.success,
+            "rank": result.rank,
+            "message": result.message
+        }
     
-    try:
-        if count == 1:
-            result = await dungeon_runner.run_once(dungeon_id, difficulty)
-            return {
-                "success": result.success,
-                "rank": result.rank,
-                "message": result.message
-            }
-        else:
-            # count > 1 或 count == -1（无限循环）
-            result = await dungeon_runner.run_loop(dungeon_id, difficulty, count)
-            return {
-                "total": result.total,
-                "completed": result.completed,
-                "failed": result.failed,
-                "ranks": result.ranks,
-                "success_rate": result.success_rate
-            }
-    except Exception as e:
-        logger.error(f"执行副本失败: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    params = {"dungeon_id": dungeon_id, "difficulty": difficulty, "count": count}
+    job = job_manager.submit("dungeon", params, run, stop=dungeon_runner.stop)
+    return {"job_id": job.id, "status": job.status.value}
+
+
+def _mark_stopped(job: Job, stopped: bool):
+    """副本被 /stop-dungeon 停止时任务同样记为取消"""
+    if stopped:
+        job.cancel_requested = True
+
+
+def _run_summary(result: DungeonRunResult) -> dict:
+    return {
+        "total": result.total,
+        "completed": result.completed,
+        "failed": result.failed,
+        "ranks": result.ranks,
+        "success_rate": result.success_rate
+    }
+
+
+def _submit_loop(dungeon_id: str, difficulty: str, count: int, resume: Optional[RunCheckpoint] = None) -> Job:
+    """提交循环任务（resume 为检查点时从检查点继续）"""
+    async def run(job: Job):
+        def on_progress(iteration: int, total: DungeonRunResult, step: DungeonResult):
+            job_manager.report(
+                job,
+                iteration=iteration,
+                completed=total.completed,
+                failed=total.failed,
+                last_rank=step.rank,
+                last_message=step.message,
+            )
+        
+        result = await dungeon_runner.run_loop(dungeon_id, difficulty, count, on_progress=on_progress, resume=resume)
+        _mark_stopped(job, result.stopped)
+        return _run_summary(result)
+    
+    params = {"dungeon_id": dungeon_id, "difficulty": difficulty, "count": count}
+    if resume:
+        params["resumed_from"] = resume.iteration
+    return job_manager.submit("dungeon", params, run, stop=dungeon_runner.stop)
+
+
+def _submit_plan(plan: RunPlan, resume: Optional[RunCheckpoint] = None) -> Job:
+    """提交运行计划任务（resume 为检查点时从检查点记录的位置继续）"""
+    async def run(job: Job):
+        def on_progress(iteration: int, entry: PlanEntry, total: DungeonRunResult, step: DungeonResult):
+            job_manager.report(
+                job,
+                iteration=iteration,
+                dungeon_id=entry.dungeon_id,
+                difficulty=entry.difficulty,
+                completed=total.completed,
+                failed=total.failed,
+                last_rank=step.rank,
+                last_message=step.message,
+            )
+        
+        result = await dungeon_runner.run_plan(plan, on_progress=on_progress, resume=resume)
+        _mark_stopped(job, result.stopped)
+        return _run_summary(result)
+    
+    params = plan.to_dict()
+    if resume:
+        params["resumed_from"] = resume.iteration
+    return job_manager.submit("dungeon", params, run, stop=dungeon_runner.stop)
+
+
+def _resume_checkpoint() -> Optional[Job]:
+    """从检查点继续被中断的循环 / 计划（没有检查点、已有副本任务或任务引擎在运行时返回 None）"""
+    checkpoint = run_checkpoint.load()
+    if checkpoint is None or dungeon_runner.is_running or job_manager.active("dungeon") or task_engine.is_running():
+        return None
+    
+    logger.info(f"从检查点继续运行: {checkpoint.kind}，已完成 {checkpoint.iteration} 次")
+    if checkpoint.kind == "plan":
+        return _submit_plan(RunPlan.from_dict(checkpoint.params), resume=checkpoint)
+    params = checkpoint.params
+    return _submit_loop(params["dungeon_id"], params.get("difficulty", "normal"), params.get("count", -1), resume=checkpoint)
+
+
+class PlanEntryModel(BaseModel):
+    dungeon_id: str
+    difficulty: str = "normal"
+    count: int = Field(1, ge=1)
+
+
+class RunPlanRequest(BaseModel):
+    entries: list[PlanEntryModel] = Field(min_length=1)
+
+
+def _build_plan(request: RunPlanRequest):
+    for entry in request.entries:
+        if entry.dungeon_id not in DUNGEON_NAMES:
+            raise HTTPException(status_code=400, detail=f"未知副本: {entry.dungeon_id}")
+        if entry.difficulty not in DIFFICULTY_NAMES:
+            raise HTTPException(status_code=400, detail=f"未知难度: {entry.difficulty}")
+    entries = [PlanEntry(e.dungeon_id, e.difficulty, e.count) for e in request.entries]
+    return plan_runs(entries, game_navigator.get_current_scene() if game_navigator else None)
+
+
+@app.post("/run-plan/preview")
+async def preview_run_plan(request: RunPlanRequest):
+    """预览运行计划的执行顺序（不执行）"""
+    return _build_plan(request).to_dict()
+
+
+@app.post("/run-plan")
+async def run_plan(request: RunPlanRequest):
+    # 提交多副本运行计划（后台执行，立即返回任务 ID）
+    # 条目会合并并重新排序，使副本之间的场景切换和列表滑动最少
+    # 
+    # Returns:
+    #     {"job_id": str, "status": str, "plan": 排序后的计划}
+    if not adb_controller.is_connected():
+        raise HTTPException(status_code=400, detail="设备未连接")
+    if task_engine.is_running():
+        raise HTTPException(status_code=409, detail="任务引擎正在运行中")
+    if dungeon_runner.is_running or job_manager.active("dungeon"):
+        raise HTTPException(status_code=409, detail="副本任务正在运行中")
+    
+    plan = _build_plan(request)
+    job = _submit_plan(plan)
+    return {"job_id": job.id, "status": job.status.value, "plan": plan.to_dict()}
+
+
+@app.get("/checkpoint")
+async def get_checkpoint():
+    """被中断的循环 / 计划的检查点（没有时为 null）"""
+    checkpoint = run_checkpoint.load()
+    return {"checkpoint": checkpoint.to_dict() if checkpoint else None}
+
+
+@app.post("/checkpoint/resume")
+async def resume_checkpoint():
+    """从检查点继续运行"""
+    if not adb_controller.is_connected():
+        raise HTTPException(status_code=400, detail="设备未连接")
+    if task_engine.is_running():
+        raise HTTPException(status_code=409, detail="任务引擎正在运行中")
+    if dungeon_runner.is_running or job_manager.active("dungeon"):
+        raise HTTPException(status_code=409, detail="副本任务正在运行中")
+    job = _resume_checkpoint()
+    if job is None:
+        raise HTTPException(status_code=404, detail="没有可继续的检查点")
+    return {"job_id": job.id, "status": job.status.value}
+
+
+@app.delete("/checkpoint")
+async def discard_checkpoint():
+    """放弃检查点（不再继续）"""
+    if dungeon_runner.is_running:
+        raise HTTPException(status_code=409, detail="副本任务正在运行中")
+    run_checkpoint.clear()
+    return {"success": True}
 
 
 @app.post("/stop-dungeon")
 async def stop_dungeon():
     """停止副本运行"""
     if dungeon_runner:
-        dungeon_runner.stop()
+        jobs = job_manager.active("dungeon")
+        for job in jobs:
+            job_manager.cancel(job.id)
+        if not jobs:
+            dungeon_runner.stop()
         return {"success": True, "message": "已停止"}
     return {"success": False, "message": "副本执行器未初始化"}
 
 
+@app.get("/jobs")
+async def list_jobs():
+    """获取后台任务列表（最新的在前）"""
+    return {"jobs": [job.to_dict() for job in job_manager.jobs()]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取后台任务状态、进度和结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消后台任务（在检查点结束，结束后推送 finished 事件）"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not job_manager.cancel(job_id):
+        return {"success": False, "message": "任务已结束"}
+    return {"success": True, "message": "已请求取消"}
+
+
 @app.get("/dungeon-history")
-async def get_dungeon_history():
-    """获取副本运行历史"""
-    if not dungeon_runner:
-        return {"records": []}
+async def get_dungeon_history(
+    limit: int = Query(10, ge=1, le=500),
+    before_id: Optional[int] = None,
+    dungeon_id: Optional[str] = None,
+):
+    """
+    获取副本运行历史（游标分页）
+    
+    Args:
+        limit: 每页条数
+        before_id: 游标，传上一页返回的 next_before_id 获取更早的记录
+        dungeon_id: 只返回该副本的记录
+    """
+    await asyncio.to_thread(history_store.flush)
+    rows = await asyncio.to_thread(history_store.recent, limit, before_id, dungeon_id)
     
-    # 获取历史记录（最新的在前面），然后反转使最早的在前面
-    history = dungeon_runner.history
     records = []
-    for record in history:
+    for row in rows:
+        started = datetime.fromtimestamp(row["started_at"])
         records.append({
-            "id": record.id,
-            "name": record.dungeon_name,
-            "difficulty": record.difficulty_name,
-            "rank": record.rank,
-            "time": record.time,
-            "status": record.status,
+            "id": row["id"],
+            "name": DUNGEON_NAMES.get(row["dungeon_id"], row["dungeon_id"]),
+            "difficulty": DIFFICULTY_NAMES.get(row["difficulty"], row["difficulty"]),
+            "rank": row["rank"],
+            "time": started.strftime("%H:%M"),
+            "started_at": started.isoformat(timespec="seconds"),
+            "duration": row["duration"],
+            "status": row["status"],
+            "failure": row["failure"],
         })
+    next_before_id = rows[-1]["id"] if len(rows) == limit else None
     # 反转顺序，最早的在前面（时间线从左到右）
     records.reverse()
-    return {"records": records}
+    return {"records": records, "next_before_id": next_before_id}
+
+
+@app.get("/history/runs-per-hour")
+async def get_runs_per_hour(hours: int = Query(24, ge=1, le=24 * 365), dungeon_id: Optional[str] = None):
+    """获取最近 hours 小时每小时的运行次数（hour 为该小时起点的 Unix 时间戳）"""
+    await asyncio.to_thread(history_store.flush)
+    return {"hours": await asyncio.to_thread(history_store.runs_per_hour, hours, dungeon_id)}
+
+
+@app.get("/history/ranks")
+async def get_rank_distribution(hours: Optional[int] = Query(None, ge=1), dungeon_id: Optional[str] = None):
+    """获取各副本的评级分布（可限定最近 hours 小时）"""
+    await asyncio.to_thread(history_store.flush)
+    return {"ranks": await asyncio.to_thread(history_store.rank_distribution, hours, dungeon_id)}
+
+
+@app.get("/history/failures")
+async def get_failure_causes(hours: Optional[int] = Query(None, ge=1), dungeon_id: Optional[str] = None):
+    """获取各副本的失败原因统计（可限定最近 hours 小时）"""
+    await asyncio.to_thread(history_store.flush)
+    return {"failures": await asyncio.to_thread(history_store.failure_causes, hours, dungeon_id)}
+
+
+@app.get("/dungeon-stats")
+async def get_dungeon_stats(dungeon_id: Optional[str] = None, difficulty: Optional[str] = None):
+    """获取战斗时间线统计（各阶段时长直方图与最近的时间线），可按副本 / 难度筛选"""
+    return battle_telemetry.summary(dungeon_id, difficulty)
 
 
 @app.get("/scenes")
 async def get_scenes():
-    """获取所有场景"""
+    """获取所有场景（含每条转移的期望耗时和实测统计）"""
+    table = get_route_table()
     scenes = []
     for scene_id, scene in SCENES.items():
+        edges = []
+        for target, transition in table.edges.get(scene_id, {}).items():
+            stats = transition_stats.get(scene_id, target)
+            edges.append({
+                "target": target,
+                "action": transition.action.value,
+                "expected_cost": round(table.costs[scene_id][target], 3),
+                "stats": stats.to_dict() if stats else None,
+            })
         scenes.append({
             "id": scene_id,
             "name": scene.name,
             "transitions": list(scene.transitions.keys()),
             "back_to": scene.back_to,
+            "edges": edges,
         })
     return {"scenes": scenes}
 
@@ -377,6 +736,8 @@ async def navigate_to_scene(scene_id: str):
     """
     if not adb_controller.is_connected():
         raise HTTPException(status_code=400, detail="设备未连接")
+    if _automation_running():
+        raise HTTPException(status_code=409, detail="自动化正在运行中")
     
     if scene_id not in SCENES:
         raise HTTPException(status_code=400, detail=f"未知场景: {scene_id}")
@@ -392,6 +753,61 @@ async def navigate_to_scene(scene_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/debug/record-scene")
+async def record_scene(scene_id: str):
+    """
+    将当前截图录入场景指纹索引
+    
+    Args:
+        scene_id: 当前画面所属的场景ID
+    """
+    if not adb_controller.is_connected():
+        raise HTTPException(status_code=400, detail="设备未连接")
+    
+    if scene_id not in SCENES:
+        raise HTTPException(status_code=400, detail=f"未知场景: {scene_id}")
+    
+    try:
+        frame = await adb_controller.pipeline.next_frame(prefetch=False)
+        added = scene_classifier.record(scene_id, frame, persist=False)
+        # 手动录入立即保存
+        scene_classifier.flush()
+        return {"success": True, "added": added, "index": scene_classifier.summary()}
+    except Exception as e:
+        logger.error(f"录入场景失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/debug/scene-classifier")
+async def get_scene_classifier():
+    """获取场景指纹索引概况、分类统计、场景检测统计和多跳导航预判统计"""
+    summary = scene_classifier.summary()
+    summary["detection"] = game_navigator.detection_stats.to_dict() if game_navigator else {}
+    summary["speculation"] = game_navigator.speculation_stats.to_dict() if game_navigator else {}
+    return summary
+
+
+@app.get("/debug/recovery")
+async def get_recovery_stats():
+    """获取异常恢复统计（恢复耗时、关闭的弹窗数、返回键次数）"""
+    return game_navigator.recovery.stats.to_dict() if game_navigator else {}
+
+
+@app.get("/debug/battle")
+async def get_battle_stats():
+    """获取战斗循环统计（提示出现到点击的延迟、连续运行的再进入开销、各阶段实测时长、画面活动状态、结算界面解析数据）"""
+    if not dungeon_runner:
+        return {"stats": {}, "timings": {}, "motion": {}, "reentry": {}, "result_screen": result_parser.to_dict()}
+    battle_loop = dungeon_runner.battle_loop
+    return {
+        "stats": battle_loop.stats.to_dict(),
+        "reentry": dungeon_runner.reentry_stats.to_dict(),
+        "timings": battle_loop.timings.to_dict(),
+        "motion": {"state": battle_loop.motion.state.value, **battle_loop.motion.stats.to_dict()},
+        "result_screen": result_parser.to_dict(),
+    }
+
+
 @app.get("/debug/ocr")
 async def debug_ocr(target: str = None):
     """
@@ -406,7 +822,7 @@ async def debug_ocr(target: str = None):
     try:
         from core.image_matcher import image_matcher
         
-        screen = await adb_controller.screencap_array()
+        screen = await adb_controller.capture()
         
         if target:
             # 查找特定文字
@@ -494,6 +910,109 @@ async def websocket_state(websocket: WebSocket):
         logger.info("状态 WebSocket 已断开")
 
 
+@app.websocket("/ws/jobs")
+async def websocket_jobs(websocket: WebSocket):
+    """任务事件流 - 推送后台任务的创建、进度和结束事件（连接时先推送运行中的任务）"""
+    await websocket.accept()
+    queue = job_manager.subscribe()
+    
+    try:
+        for job in job_manager.active():
+            await websocket.send_json({"type": "job", "event": "snapshot", "job": job.to_dict()})
+        
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=30)
+            except asyncio.TimeoutError:
+                message = {"type": "ping"}
+            await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        job_manager.unsubscribe(queue)
+
+
+def _automation_running() -> bool:
+    """自动化是否正在运行（运行时预览只复用自动化已截取的帧）"""
+    return bool(
+        (dungeon_runner and dungeon_runner.is_running)
+        or (task_engine and task_engine.is_running())
+        or (game_launcher and game_launcher.is_waiting())
+    )
+
+
+@app.websocket("/ws/preview")
+async def websocket_preview(websocket: WebSocket):
+    """
+    实时预览流 - 推送二进制 JPEG/WebP 帧
+    
+    客户端可随时发送 JSON 配置（见 PreviewConfig.update）。
+    发送端每次只取最新一帧，客户端接收慢时中间帧直接丢弃，不会排队。
+    自动化运行期间只复用流水线中已有的帧，不触发额外截图。
+    """
+    await websocket.accept()
+    logger.info("预览 WebSocket 已连接")
+    
+    config = PreviewConfig()
+    
+    async def receive_config():
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                # 非 JSON 消息直接忽略，不中断推流
+                logger.debug(f"忽略非 JSON 预览配置: {text[:100]}")
+                continue
+            if not isinstance(message, dict):
+                continue
+            try:
+                config.update(message)
+            except (TypeError, ValueError) as e:
+                logger.debug(f"忽略非法预览配置: {e}")
+    
+    receiver = asyncio.create_task(receive_config())
+    last_timestamp = 0.0
+    last_etag = None
+    
+    try:
+        while not receiver.done():
+            started = time.monotonic()
+            frame = None
+            
+            if adb_controller and adb_controller.is_connected():
+                pipeline = adb_controller.pipeline
+                if _automation_running():
+                    frame = await pipeline.wait_for_frame(after=last_timestamp, timeout=config.interval)
+                else:
+                    after = max(last_timestamp, started - config.interval)
+                    frame = await pipeline.next_frame(after=after, prefetch=False)
+            
+            if frame is not None:
+                last_timestamp = frame.timestamp
+                params = config.encode_params()
+                try:
+                    params["roi"] = clip_roi(frame, params["roi"])
+                except ValueError:
+                    # ROI 超出画面时发送整帧
+                    params["roi"] = None
+                etag = await asyncio.to_thread(preview_etag, frame, **params)
+                # 画面和参数都没变就不重复编码和发送
+                if etag != last_etag:
+                    content = await asyncio.to_thread(encode_preview, frame, **params)
+                    await websocket.send_bytes(content)
+                    last_etag = etag
+            
+            await asyncio.sleep(max(config.interval - (time.monotonic() - started), 0))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"预览推送中断: {e}")
+    finally:
+        receiver.cancel()
+        logger.info("预览 WebSocket 已断开")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000, log_level="info")
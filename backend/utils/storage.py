@@ -0,0 +1,48 @@
+"""
+本地数据存储
+运行时学习到的数据（转移耗时、识别索引、检查点等）保存在 backend/data 目录
+"""
+import json
+import logging
+import os
+from typing import Any
+
+logger = logging.getLogger("zat.storage")
+
+# 数据目录
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+def data_path(filename: str) -> str:
+    """获取数据文件路径（自动创建数据目录）"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def load_json(path: str, default: Any = None) -> Any:
+    """
+    读取 JSON 文件
+
+    文件不存在或损坏时返回 default
+    """
+    if not os.path.exists(path):
+        return default
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取数据文件失败: {path}: {e}")
+        return default
+
+
+def save_json(path: str, data: Any):
+    """
+    原子写入 JSON 文件（先写临时文件再替换，避免中途崩溃留下半个文件）
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
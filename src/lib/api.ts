@@ -47,6 +47,92 @@ export interface StateMessage {
   loop_count: number;
 }
 
+export type JobStatus = 'running' | 'completed' | 'failed' | 'cancelled';
+
+export interface Job {
+  id: string;
+  kind: string;
+  params: Record<string, any>;
+  status: JobStatus;
+  created: string;
+  finished: string | null;
+  progress: {
+    iteration?: number;
+    completed?: number;
+    failed?: number;
+    last_rank?: string | null;
+    last_message?: string;
+  };
+  // 单次: {success, rank, message}；多次: {total, completed, failed, ranks, success_rate}
+  result: Record<string, any> | null;
+  error: string | null;
+  cancel_requested: boolean;
+}
+
+export interface PlanEntry {
+  dungeon_id: string;
+  difficulty: string;
+  count: number;
+}
+
+export interface RunPlan {
+  entries: PlanEntry[];
+  total: number;
+  transitions: number;
+  scrolls: number;
+  navigation_cost: number;
+}
+
+export interface RunCheckpoint {
+  kind: 'loop' | 'plan';
+  params: Record<string, any>;
+  iteration: number;
+  completed: number;
+  failed: number;
+  ranks: string[];
+  entry_index: number;
+  entry_done: number;
+  scene: string | null;
+  updated: number;
+}
+
+export type TaskKind = 'launch_game' | 'navigate' | 'run_plan' | 'collect_rewards' | 'persist';
+export type TaskStatus = 'pending' | 'ready' | 'running' | 'completed' | 'failed' | 'skipped' | 'cancelled';
+
+export interface TaskSpec {
+  id: string;
+  kind: TaskKind;
+  params?: Record<string, any>;
+  depends_on?: string[];
+  priority?: number;
+  timeout?: number;
+  retry?: { max_attempts?: number; delay?: number; backoff?: number };
+}
+
+export interface TaskEngineStatus {
+  task: string | null;
+  running: boolean;
+  state: string | null;
+  tasks: Array<{
+    id: string;
+    kind: TaskKind;
+    params: Record<string, any>;
+    depends_on: string[];
+    priority: number;
+    status: TaskStatus;
+    attempts: number;
+    duration: number | null;
+    result: any;
+    error: string | null;
+  }>;
+}
+
+export interface JobMessage {
+  type: 'job';
+  event: 'snapshot' | 'created' | 'started' | 'progress' | 'cancelling' | 'finished';
+  job: Job;
+}
+
 export interface Resolution {
   width: number;
   height: number;
@@ -58,6 +144,9 @@ export interface ConnectResponse {
   resolution?: Resolution;
 }
 
+// 截图缓存：请求 URL -> 上次的 ETag 和图片
+const screenshotCache = new Map<string, { etag: string; blob: Blob }>();
+
 /**
  * HTTP API
  */
@@ -72,13 +161,22 @@ export const api = {
     return res.json();
   },
 
-  async startTaskEngine(taskName: string = 'farming'): Promise<{ success: boolean }> {
+  /**
+   * 启动任务引擎（tasks 为空时按任务名加载任务图）
+   */
+  async startTaskEngine(taskName: string = 'farming', tasks?: TaskSpec[]): Promise<{ success: boolean; task?: string; tasks?: string[] }> {
     const res = await tauriFetch(`${API_BASE}/task-engine/start?task_name=${taskName}`, {
       method: 'POST',
+      ...(tasks ? { headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ tasks }) } : {}),
     });
     return res.json();
   },
 
+  async getTaskEngine(): Promise<TaskEngineStatus> {
+    const res = await tauriFetch(`${API_BASE}/task-engine`);
+    return res.json();
+  },
+
   async stopTaskEngine(): Promise<{ success: boolean }> {
     const res = await tauriFetch(`${API_BASE}/task-engine/stop`, { method: 'POST' });
     return res.json();
@@ -102,8 +200,38 @@ export const api = {
     return res.json();
   },
 
-  getScreenshotUrl(gray: boolean = false): string {
-    return `${API_BASE}/debug/screenshot?gray=${gray}&t=${Date.now()}`;
+  getScreenshotUrl(
+    gray: boolean = false,
+    options: { quality?: number; scale?: number; roi?: [number, number, number, number] } = {}
+  ): string {
+    const params = new URLSearchParams();
+    params.set('gray', String(gray));
+    if (options.quality !== undefined) params.set('quality', String(options.quality));
+    if (options.scale !== undefined) params.set('scale', String(options.scale));
+    if (options.roi) params.set('roi', options.roi.join(','));
+    return `${API_BASE}/debug/screenshot?${params}`;
+  },
+
+  /**
+   * 获取截图，带上次的 ETag 做条件请求，画面未变化（304）时复用上次的图片
+   */
+  async fetchScreenshot(
+    gray: boolean = false,
+    options: { quality?: number; scale?: number; roi?: [number, number, number, number] } = {}
+  ): Promise<Blob> {
+    const url = api.getScreenshotUrl(gray, options);
+    const cached = screenshotCache.get(url);
+    const headers: Record<string, string> = cached ? { 'If-None-Match': cached.etag } : {};
+    const res = await tauriFetch(url, { headers, cache: 'no-store' });
+    if (res.status === 304 && cached) return cached.blob;
+    if (!res.ok) {
+      const body = await res.json().catch(() => ({}));
+      throw new Error(body.detail || `截图失败: ${res.status}`);
+    }
+    const blob = await res.blob();
+    const etag = res.headers.get('ETag');
+    if (etag) screenshotCache.set(url, { etag, blob });
+    return blob;
   },
 
   async getDungeons(): Promise<{
@@ -130,23 +258,86 @@ export const api = {
     return res.json();
   },
 
+  /**
+   * 提交副本任务（后台执行，立即返回任务 ID）
+   * 进度通过 getJob 查询或订阅 /ws/jobs
+   */
   async runDungeon(dungeonId: string, difficulty: string = 'normal', count: number = 1): Promise<{
-    // 单次结果
-    success?: boolean;
-    rank?: string | null;
-    message?: string;
-    // 多次结果
-    total?: number;
-    completed?: number;
-    failed?: number;
-    ranks?: string[];
-    success_rate?: number;
+    job_id: string;
+    status: JobStatus;
   }> {
     const params = new URLSearchParams();
     params.set('dungeon_id', dungeonId);
     params.set('difficulty', difficulty);
     params.set('count', String(count));
     const res = await tauriFetch(`${API_BASE}/run-dungeon?${params}`, { method: 'POST' });
+    if (!res.ok) {
+      const body = await res.json().catch(() => ({}));
+      throw new Error(body.detail || `提交副本任务失败: ${res.status}`);
+    }
+    return res.json();
+  },
+
+  /**
+   * 提交多副本运行计划（条目会合并并按最少场景切换重新排序）
+   */
+  async runPlan(entries: PlanEntry[]): Promise<{
+    job_id: string;
+    status: JobStatus;
+    plan: RunPlan;
+  }> {
+    const res = await tauriFetch(`${API_BASE}/run-plan`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ entries }),
+    });
+    if (!res.ok) {
+      const body = await res.json().catch(() => ({}));
+      throw new Error(typeof body.detail === 'string' ? body.detail : `提交运行计划失败: ${res.status}`);
+    }
+    return res.json();
+  },
+
+  async previewRunPlan(entries: PlanEntry[]): Promise<RunPlan> {
+    const res = await tauriFetch(`${API_BASE}/run-plan/preview`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ entries }),
+    });
+    return res.json();
+  },
+
+  async getCheckpoint(): Promise<{ checkpoint: RunCheckpoint | null }> {
+    const res = await tauriFetch(`${API_BASE}/checkpoint`);
+    return res.json();
+  },
+
+  async resumeCheckpoint(): Promise<{ job_id: string; status: JobStatus }> {
+    const res = await tauriFetch(`${API_BASE}/checkpoint/resume`, { method: 'POST' });
+    if (!res.ok) {
+      const body = await res.json().catch(() => ({}));
+      throw new Error(body.detail || `继续运行失败: ${res.status}`);
+    }
+    return res.json();
+  },
+
+  async discardCheckpoint(): Promise<{ success: boolean }> {
+    const res = await tauriFetch(`${API_BASE}/checkpoint`, { method: 'DELETE' });
+    return res.json();
+  },
+
+  async getJobs(): Promise<{ jobs: Job[] }> {
+    const res = await tauriFetch(`${API_BASE}/jobs`);
+    return res.json();
+  },
+
+  async getJob(jobId: string): Promise<Job> {
+    const res = await tauriFetch(`${API_BASE}/jobs/${jobId}`);
+    return res.json();
+  },
+
+  async cancelJob(jobId: string): Promise<{ success: boolean; message?: string }> {
+    const res = await tauriFetch(`${API_BASE}/jobs/${jobId}/cancel`, { method: 'POST' });
     return res.json();
   },
 
@@ -155,17 +346,28 @@ export const api = {
     return res.json();
   },
 
-  async getDungeonHistory(): Promise<{
+  /**
+   * 获取运行历史（游标分页：传上一页的 next_before_id 获取更早的记录）
+   */
+  async getDungeonHistory(options: { limit?: number; beforeId?: number; dungeonId?: string } = {}): Promise<{
     records: Array<{
       id: number;
       name: string;
       difficulty: string;
       rank: string | null;
       time: string;
+      started_at: string;
+      duration: number | null;
       status: 'completed' | 'failed' | 'running';
+      failure: string | null;
     }>;
+    next_before_id: number | null;
   }> {
-    const res = await tauriFetch(`${API_BASE}/dungeon-history`);
+    const params = new URLSearchParams();
+    if (options.limit !== undefined) params.set('limit', String(options.limit));
+    if (options.beforeId !== undefined) params.set('before_id', String(options.beforeId));
+    if (options.dungeonId) params.set('dungeon_id', options.dungeonId);
+    const res = await tauriFetch(`${API_BASE}/dungeon-history?${params}`);
     return res.json();
   },
 };
@@ -238,6 +440,8 @@ export class WebSocketManager {
     }
 
     if (this.ws) {
+      // 主动断开时不触发自动重连
+      this.ws.onclose = null;
       this.ws.close();
       this.ws = null;
     }